@@ -0,0 +1,115 @@
+"""
+Admission control — shed Gemini work under overload instead of queueing it.
+
+Two load signals, both fed by gemini_client:
+- in-flight Gemini calls (including ones waiting for quota or a connection slot)
+- queue latency: how long calls in the last WINDOW_SECONDS waited for the rate
+  limiter and the concurrency limit (90th percentile)
+
+When either crosses its threshold (ADMISSION_MAX_IN_FLIGHT, ADMISSION_MAX_QUEUE_MS)
+new requests on Gemini-backed endpoints are answered local-only — regex
+extraction, triage rules, template explanation, safe fallback — and marked
+"degraded": true. Normal service resumes once both signals are back under
+RESUME_RATIO of their thresholds. Rule-only endpoints are never affected.
+"""
+
+import os
+import threading
+import time
+from collections import deque
+
+ADMISSION_CONTROL = os.getenv("ADMISSION_CONTROL", "true").lower() == "true"
+MAX_IN_FLIGHT = int(os.getenv("ADMISSION_MAX_IN_FLIGHT", "256"))
+MAX_QUEUE_MS = float(os.getenv("ADMISSION_MAX_QUEUE_MS", "1000"))
+RESUME_RATIO = 0.8
+WINDOW_SECONDS = 5.0
+_MAX_SAMPLES = 4096
+
+
+class AdmissionController:
+    """Thread-safe load tracker and shed / admit decision."""
+
+    def __init__(self, max_in_flight: int = MAX_IN_FLIGHT, max_queue_ms: float = MAX_QUEUE_MS,
+                 enabled: bool = ADMISSION_CONTROL):
+        self.max_in_flight = max_in_flight
+        self.max_queue_ms = max_queue_ms
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._waits = deque(maxlen=_MAX_SAMPLES)   # (timestamp, seconds waited)
+        self._shedding = False
+        self._since = 0.0
+        self._episodes = 0
+        self._admitted = 0
+        self._shed = {}
+
+    # ── Load signals (gemini_client) ───────────────────────────────────
+    def call_started(self) -> None:
+        with self._lock:
+            self._in_flight += 1
+
+    def call_finished(self) -> None:
+        with self._lock:
+            self._in_flight -= 1
+
+    def record_wait(self, seconds: float) -> None:
+        with self._lock:
+            self._waits.append((time.monotonic(), seconds))
+
+    # ── Decision (endpoints) ───────────────────────────────────────────
+    def admit(self, endpoint: str) -> bool:
+        """True if `endpoint` may use Gemini for this request; False = answer local-only."""
+        if not self.enabled:
+            return True
+        with self._lock:
+            shedding = self._update(time.monotonic())
+            if shedding:
+                self._shed[endpoint] = self._shed.get(endpoint, 0) + 1
+            else:
+                self._admitted += 1
+            return not shedding
+
+    @property
+    def shedding(self) -> bool:
+        if not self.enabled:
+            return False
+        with self._lock:
+            return self._update(time.monotonic())
+
+    def stats(self) -> dict:
+        with self._lock:
+            now = time.monotonic()
+            shedding = self.enabled and self._update(now)
+            return {
+                "enabled": self.enabled,
+                "shedding": shedding,
+                "sheddingForMs": round((now - self._since) * 1000) if shedding else 0,
+                "inFlight": self._in_flight,
+                "queueP90Ms": round(self._queue_p90(now) * 1000),
+                "maxInFlight": self.max_in_flight,
+                "maxQueueMs": self.max_queue_ms,
+                "admitted": self._admitted,
+                "shed": dict(self._shed),
+                "episodes": self._episodes,
+            }
+
+    # ── Internals ──────────────────────────────────────────────────────
+    def _update(self, now: float) -> bool:
+        load = max(self._in_flight / self.max_in_flight, self._queue_p90(now) * 1000 / self.max_queue_ms)
+        if not self._shedding and load >= 1.0:
+            self._shedding, self._since = True, now
+            self._episodes += 1
+        elif self._shedding and load < RESUME_RATIO:
+            self._shedding = False
+        return self._shedding
+
+    def _queue_p90(self, now: float) -> float:
+        while self._waits and self._waits[0][0] < now - WINDOW_SECONDS:
+            self._waits.popleft()
+        if not self._waits:
+            return 0.0
+        waits = sorted(w for _, w in self._waits)
+        return waits[int(len(waits) * 0.9)]
+
+
+controller = AdmissionController()
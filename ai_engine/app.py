@@ -1,9 +1,12 @@
 ﻿"""ArogyaSaarthi AI Engine — FastAPI service."""
 
 import os
+import json
 import time
+import asyncio
 import logging
 from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 from dotenv import load_dotenv
@@ -13,15 +16,23 @@ load_dotenv()
 logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s — %(message)s")
 logger = logging.getLogger(__name__)
 
-from nlp_extractor import extract_symptoms
+from nlp_extractor import aextract_symptoms, _extract_with_regex
 from triage_rules import classify
-from explainer import generate_explanation, get_clarifying_question
+from batch_classify import classify_batch
+from explainer import agenerate_explanation, cached_explanation, explanation_stats, get_clarifying_question
 from safety import check_safety
 from intent_gate import (
-    classify_intent, classify_intent_with_gemini,
+    classify_intent, classify_intent_with_gemini, aclassify_intent_with_gemini, aanalyze_with_gemini,
+    _has_symptom_signal,
     get_small_talk_reply, get_clarification_reply,
 )
-from triage_engine import run_triage
+from triage_engine import (
+    arun_triage, astream_triage, is_emergency_by_keywords, emergency_red_flags, _emergency_fallback,
+)
+from deadline import Deadline
+from admission import controller as admission
+from local_classifier import confident, scope_model, intent_model
+from local_first import LOCAL_FIRST, gemini_needed, shadow, PATH_LOCAL, PATH_GEMINI, PATH_FALLBACK
 
 app = FastAPI(title="ArogyaSaarthi AI Engine", version="2.0.0")
 
@@ -33,24 +44,35 @@ app.add_middleware(
 )
 
 USE_LLM = os.getenv("USE_LLM", "true").lower() == "true"
-from gemini_client import is_enabled as gemini_enabled
+from gemini_client import (
+    PromptSite, is_enabled as gemini_enabled, breaker_stats, cache_stats, prompt_cache_stats, singleflight_stats,
+    rate_limit_stats, parse_stats, schema_prompt,
+)
+import prompts
+import schemas
 
 
 class ExtractRequest(BaseModel):
     text: str
     language: str = "en"
     source: str = "text"
+    deadlineMs: int | None = None
 
 class ClassifyRequest(BaseModel):
     structured: dict
     language: str = "en"
 
+class ClassifyBatchRequest(BaseModel):
+    records: list[dict]
+
 class ExplainRequest(BaseModel):
     urgency: str
     careLevel: str
     structured: dict
     reasonCodes: list = []
     language: str = "en"
+    text: str | None = None      # the patient message; an emergency keyword hit skips Gemini
+    deadlineMs: int | None = None
 
 class ClarifyRequest(BaseModel):
     questionType: str
@@ -59,11 +81,97 @@ class ClarifyRequest(BaseModel):
 class IntentRequest(BaseModel):
     text: str
     language: str = "en"
+    deadlineMs: int | None = None
 
 
 class TriageRequest(BaseModel):
     text: str
     language: str = "en"
+    deadlineMs: int | None = None
+
+
+# ── Emergency fast path ────────────────────────────────────────────────────
+# Every text endpoint runs the emergency keyword automaton first. On a hit it
+# answers at once from local extraction — never waiting on Gemini — in that
+# endpoint's usual shape, marked "emergency": true.
+_background_tasks: set[asyncio.Task] = set()
+
+
+def _spawn(coro) -> None:
+    """Run coro in the background; keep a reference so it is not garbage-collected mid-flight."""
+    task = asyncio.create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+
+def _emergency_precheck(text: str, language: str, endpoint: str) -> dict | None:
+    """Local extraction for a message the emergency automaton flags, else None.
+    Red flags named by the emergency keywords are merged into the extraction so
+    /classify escalates it."""
+    if not is_emergency_by_keywords(text):
+        return None
+    extracted = _extract_with_regex(text, language)
+    red_flags = list(dict.fromkeys(extracted["redFlagsDetected"] + emergency_red_flags(text)))
+    symptoms = list(dict.fromkeys(extracted["allDetectedSymptoms"] + red_flags))
+    primary = extracted["primaryComplaint"]
+    if primary == "unknown" and symptoms:
+        primary = symptoms[0]
+    extracted.update(
+        primaryComplaint=primary,
+        associatedSymptoms=[s for s in symptoms if s != primary],
+        redFlagsDetected=red_flags,
+        allDetectedSymptoms=symptoms,
+        clarifyingQuestion=None,
+    )
+    logger.info(f"[Emergency] /{endpoint}: keyword hit {red_flags} — answering locally")
+    return extracted
+
+
+async def _warm_emergency_explanation(extracted: dict, language: str) -> None:
+    """Generate (and cache) the Gemini explanation /explain will be asked for next."""
+    classification = classify(extracted)
+    try:
+        await agenerate_explanation(
+            classification["urgency"], classification["careLevel"], extracted,
+            classification["reasonCodes"], language, Deadline.from_request(None),
+        )
+    except Exception as e:
+        logger.warning(f"[Emergency] Explanation warm-up failed: {e}")
+
+
+def _after_emergency(extracted: dict, language: str) -> None:
+    if gemini_enabled() and not admission.shedding:
+        _spawn(_warm_emergency_explanation(extracted, language))
+
+
+def _escalate(text: str, language: str):
+    """on_urgency for triage: an "emergency" — from the keywords or streamed by
+    Gemini ahead of the rest of its reply — starts the emergency flow right away."""
+    def on_urgency(level: str) -> None:
+        if level == "emergency":
+            logger.info("[Emergency] /triage: urgency=emergency — starting emergency flow")
+            _after_emergency(_extract_with_regex(text, language), language)
+    return on_urgency
+
+
+# ── Admission control ──────────────────────────────────────────────────────
+# Under overload (admission.py) Gemini-backed endpoints get a spent deadline:
+# every Gemini call is skipped, cached Gemini answers still count, and the
+# response comes from the local path, marked "degraded": true.
+def _admit(endpoint: str, deadline_ms: int | None) -> tuple[Deadline, bool]:
+    """(deadline, degraded) for a request on a Gemini-backed endpoint. Its Gemini
+    calls are counted under `endpoint` in /health → tokens."""
+    prompts.set_endpoint(endpoint)
+    if admission.admit(endpoint):
+        return Deadline.from_request(deadline_ms), False
+    return Deadline.spent(), True
+
+
+def _mark_degraded(result: dict, degraded: bool) -> dict:
+    """Flag a local-only answer — in "meta" for endpoints that have one."""
+    if degraded:
+        (result["meta"] if "meta" in result else result)["degraded"] = True
+    return result
 
 
 @app.get("/health")
@@ -74,39 +182,136 @@ def health():
         "llm_enabled": USE_LLM,
         "gemini_ready": gemini_enabled(),
         "model": os.getenv("MODEL_NAME", "gemini-2.5-flash"),
+        "cache": cache_stats(),
+        "promptCache": prompt_cache_stats(),
+        "explanations": explanation_stats(),
+        "singleflight": singleflight_stats(),
+        "circuitBreaker": breaker_stats(),
+        "rateLimit": rate_limit_stats(),
+        "parsing": parse_stats(),
+        "tokens": prompts.stats(),
+        "admission": admission.stats(),
+        "localFirst": shadow.stats(),
     }
 
 
 @app.post("/triage")
-def triage_endpoint(req: TriageRequest):
+async def triage_endpoint(req: TriageRequest):
     """
     Unified triage endpoint.
     Returns structured JSON: symptom_summary, urgency_level, urgency_reason,
     recommended_next_steps, warning_signs, clarifying_question, disclaimer.
     Always returns a safe response — never crashes, never hallucinates facilities.
+    Answers within `deadlineMs` (default REQUEST_SLO_SECONDS), falling back if needed.
     """
-    result = run_triage(req.text.strip(), req.language)
+    deadline, degraded = _admit("triage", req.deadlineMs)
+    text = req.text.strip()
+    result = await arun_triage(text, req.language, deadline, on_urgency=_escalate(text, req.language))
     # Strip internal meta from response, expose only request_id
     meta = result.pop("_meta", {})
     result["request_id"] = meta.get("request_id", "")
     result["fallback_used"] = meta.get("fallback_used", False)
     result["from_cache"] = meta.get("from_cache", False)
+    if degraded:
+        result["degraded"] = True
     return result
 
 
+@app.post("/triage/stream")
+async def triage_stream_endpoint(req: TriageRequest):
+    """
+    Progressive /triage as Server-Sent Events:
+    `local` (rule-based answer, immediately) → `urgency` (Gemini's urgency_level
+    as soon as it has streamed in — escalate / start the facility lookup on it)
+    → `gemini` (validated Gemini answer, only if it arrives within the deadline)
+    → `done` (which answer stands, request_id and `_meta`).
+    """
+    deadline, degraded = _admit("triage", req.deadlineMs)
+    text = req.text.strip()
+    escalate = _escalate(text, req.language)
+
+    async def events():
+        async for event, payload in astream_triage(text, req.language, deadline):
+            if event == "urgency":
+                escalate(payload["urgency_level"])
+            if event == "done":
+                meta = payload["_meta"]
+                payload = {
+                    **payload,
+                    "request_id": meta.get("request_id", ""),
+                    "fallback_used": meta.get("fallback_used", False),
+                    "from_cache": meta.get("from_cache", False),
+                }
+                if degraded:
+                    payload["degraded"] = True
+            yield f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @app.post("/intent")
-def intent_endpoint(req: IntentRequest):
+async def intent_endpoint(req: IntentRequest):
     """
     Gemini-primary intent gate.
     For SYMPTOMS: returns full extracted data so Node can skip /extract.
     For SMALL_TALK/CLARIFICATION_REQUIRED: returns Gemini-generated reply.
     """
+    deadline, degraded = _admit("intent", req.deadlineMs)
+    return _mark_degraded(await _run_intent(req.text, req.language, deadline), degraded)
+
+
+async def _run_intent(text: str, language: str, deadline: Deadline | None = None) -> dict:
     start = time.time()
     llm_used = False
     fallback_used = False
 
+    emergency = _emergency_precheck(text, language, "intent")
+    if emergency is not None:
+        _after_emergency(emergency, language)
+        return {
+            "intent": "SYMPTOMS",
+            "reply": None,
+            "extracted": emergency,
+            "llmUsed": False,
+            "fallbackUsed": False,
+            "path": PATH_LOCAL,
+            "emergency": True,
+            "latencyMs": round((time.time() - start) * 1000),
+        }
+
+    # ── Local-first: a confident regex extraction skips Gemini ─────────
+    local = _local_first_intent(text, language)
+    if local is not None:
+        return {
+            "intent": "SYMPTOMS",
+            "reply": None,
+            "extracted": local,
+            "llmUsed": False,
+            "fallbackUsed": False,
+            "path": PATH_LOCAL,
+            "latencyMs": round((time.time() - start) * 1000),
+        }
+
+    # ── Local model: confident small talk / clarification skips Gemini ─
+    predicted = confident(intent_model, text)
+    if predicted is not None and predicted[0] != "SYMPTOMS" and not _medical_signal(text):
+        intent = predicted[0]
+        return {
+            "intent": intent,
+            "reply": get_small_talk_reply(language) if intent == "SMALL_TALK" else get_clarification_reply(language),
+            "extracted": None,
+            "llmUsed": False,
+            "fallbackUsed": False,
+            "path": PATH_LOCAL,
+            "latencyMs": round((time.time() - start) * 1000),
+        }
+
     # ── Primary: Gemini combined intent + extraction ───────────────────
-    gemini_result = classify_intent_with_gemini(req.text, req.language)
+    gemini_result = await aclassify_intent_with_gemini(text, language, deadline)
 
     if gemini_result is not None:
         llm_used = gemini_result.get("llmUsed", True)
@@ -116,9 +321,10 @@ def intent_endpoint(req: IntentRequest):
         if intent == "SMALL_TALK":
             return {
                 "intent": "SMALL_TALK",
-                "reply": reply or get_small_talk_reply(req.language),
+                "reply": reply or get_small_talk_reply(language),
                 "extracted": None,
                 "llmUsed": llm_used,
+                "path": PATH_GEMINI,
                 "fallbackUsed": False,
                 "latencyMs": round((time.time() - start) * 1000),
             }
@@ -126,37 +332,25 @@ def intent_endpoint(req: IntentRequest):
         if intent == "CLARIFICATION_REQUIRED":
             return {
                 "intent": "CLARIFICATION_REQUIRED",
-                "reply": reply or get_clarification_reply(req.language),
+                "reply": reply or get_clarification_reply(language),
                 "extracted": None,
                 "llmUsed": llm_used,
+                "path": PATH_GEMINI,
                 "fallbackUsed": False,
                 "latencyMs": round((time.time() - start) * 1000),
             }
 
         # SYMPTOMS — return extracted data so Node skips /extract
-        extracted = {
-            "primaryComplaint": gemini_result.get("primaryComplaint", "unknown"),
-            "duration": gemini_result.get("duration", {"value": None, "unit": "unknown"}),
-            "severity": gemini_result.get("severity", "unknown"),
-            "associatedSymptoms": gemini_result.get("associatedSymptoms", []),
-            "redFlagsDetected": gemini_result.get("redFlagsDetected", []),
-            "extractionConfidence": gemini_result.get("confidence", 0.8),
-            "clarifyingQuestion": "duration" if gemini_result.get("followUpQuestion") else None,
-            "allDetectedSymptoms": (
-                [gemini_result.get("primaryComplaint")] +
-                gemini_result.get("associatedSymptoms", [])
-            ) if gemini_result.get("primaryComplaint", "unknown") != "unknown" else gemini_result.get("associatedSymptoms", []),
-        }
+        extracted = _gemini_extraction(gemini_result)
 
         # Safety gate: if extraction found nothing real, downgrade to CLARIFICATION
-        primary = extracted["primaryComplaint"]
-        red_flags = extracted["redFlagsDetected"]
-        if primary == "unknown" and len(red_flags) == 0 and extracted["duration"]["value"] is None:
+        if _nothing_extracted(extracted):
             return {
                 "intent": "CLARIFICATION_REQUIRED",
-                "reply": get_clarification_reply(req.language),
+                "reply": get_clarification_reply(language),
                 "extracted": None,
                 "llmUsed": llm_used,
+                "path": PATH_GEMINI,
                 "fallbackUsed": True,
                 "latencyMs": round((time.time() - start) * 1000),
             }
@@ -166,48 +360,53 @@ def intent_endpoint(req: IntentRequest):
             "reply": None,
             "extracted": extracted,
             "llmUsed": llm_used,
+            "path": PATH_GEMINI,
             "fallbackUsed": False,
             "latencyMs": round((time.time() - start) * 1000),
         }
 
     # ── Fallback: local regex intent ───────────────────────────────────
     fallback_used = True
-    intent = classify_intent(req.text, req.language)
+    intent = classify_intent(text, language)
 
     if intent == "SMALL_TALK":
         return {
             "intent": "SMALL_TALK",
-            "reply": get_small_talk_reply(req.language),
+            "reply": get_small_talk_reply(language),
             "extracted": None,
             "llmUsed": False,
             "fallbackUsed": True,
+            "path": PATH_FALLBACK,
             "latencyMs": round((time.time() - start) * 1000),
         }
 
     if intent == "CLARIFICATION_REQUIRED":
         return {
             "intent": "CLARIFICATION_REQUIRED",
-            "reply": get_clarification_reply(req.language),
+            "reply": get_clarification_reply(language),
             "extracted": None,
             "llmUsed": False,
             "fallbackUsed": True,
+            "path": PATH_FALLBACK,
             "latencyMs": round((time.time() - start) * 1000),
         }
 
     # SYMPTOMS via regex — run local extraction
-    extracted = extract_symptoms(req.text, req.language)
+    extracted = await aextract_symptoms(text, language, deadline)
     extracted.pop("llmUsed", None)
     extracted.pop("fallbackUsed", None)
+    extracted.pop("path", None)
 
     primary = extracted.get("primaryComplaint", "unknown")
     red_flags = extracted.get("redFlagsDetected", [])
     if primary == "unknown" and len(red_flags) == 0 and extracted.get("duration", {}).get("value") is None:
         return {
             "intent": "CLARIFICATION_REQUIRED",
-            "reply": get_clarification_reply(req.language),
+            "reply": get_clarification_reply(language),
             "extracted": None,
             "llmUsed": False,
             "fallbackUsed": True,
+            "path": PATH_FALLBACK,
             "latencyMs": round((time.time() - start) * 1000),
         }
 
@@ -217,23 +416,148 @@ def intent_endpoint(req: IntentRequest):
         "extracted": extracted,
         "llmUsed": False,
         "fallbackUsed": True,
+        "path": PATH_FALLBACK,
         "latencyMs": round((time.time() - start) * 1000),
     }
 
 
+def _gemini_extraction(gemini_result: dict) -> dict:
+    """/extract-shaped fields from a combined intent (or analyze) Gemini result."""
+    primary = gemini_result.get("primaryComplaint", "unknown")
+    associated = gemini_result.get("associatedSymptoms", [])
+    return {
+        "primaryComplaint": primary,
+        "duration": gemini_result.get("duration", {"value": None, "unit": "unknown"}),
+        "severity": gemini_result.get("severity", "unknown"),
+        "associatedSymptoms": associated,
+        "redFlagsDetected": gemini_result.get("redFlagsDetected", []),
+        "extractionConfidence": gemini_result.get("confidence", 0.8),
+        "clarifyingQuestion": "duration" if gemini_result.get("followUpQuestion") else None,
+        "allDetectedSymptoms": [primary] + associated if primary != "unknown" else associated,
+    }
+
+
+def _nothing_extracted(extracted: dict) -> bool:
+    """No complaint, red flag or duration — not enough to triage."""
+    return (extracted.get("primaryComplaint", "unknown") in (None, "unknown")
+            and not extracted.get("redFlagsDetected")
+            and (extracted.get("duration") or {}).get("value") is None)
+
+
+def _local_first_intent(text: str, language: str) -> dict | None:
+    """Local extraction when local-first mode trusts classify_intent + regex for this message.
+    A medicine / off-topic keyword makes it ineligible: scope has to be decided first."""
+    if not (LOCAL_FIRST and gemini_enabled()) or classify_intent(text, language) != "SYMPTOMS":
+        return None
+    if _local_classify_scope(text) == "OUT_OF_SCOPE":
+        return None
+    extracted = _extract_with_regex(text, language)
+    if gemini_needed(text, extracted) is not None:
+        return None
+    shadow.maybe_submit("intent", {"intent": "SYMPTOMS", **extracted},
+                        lambda: classify_intent_with_gemini(text, language))
+    return extracted
+
+
 @app.post("/extract")
-def extract(req: ExtractRequest):
+async def extract(req: ExtractRequest):
+    deadline, degraded = _admit("extract", req.deadlineMs)
+    return _mark_degraded(await _run_extract(req.text, req.language, deadline), degraded)
+
+
+async def _run_extract(text: str, language: str, deadline: Deadline | None = None) -> dict:
     start = time.time()
-    result = extract_symptoms(req.text, req.language)
+    emergency = _emergency_precheck(text, language, "extract")
+    if emergency is not None:
+        _after_emergency(emergency, language)
+        latency = round((time.time() - start) * 1000)
+        return {**emergency, "meta": {"llmUsed": False, "fallbackUsed": False, "path": PATH_LOCAL,
+                                      "emergency": True, "latencyMs": latency}}
+    result = await aextract_symptoms(text, language, deadline)
     latency = round((time.time() - start) * 1000)
     llm_used = result.pop("llmUsed", False)
     fallback_used = result.pop("fallbackUsed", True)
+    path = result.pop("path", PATH_GEMINI if llm_used else PATH_FALLBACK)
     return {
         **result,
-        "meta": {"llmUsed": llm_used, "fallbackUsed": fallback_used, "latencyMs": latency},
+        "meta": {"llmUsed": llm_used, "fallbackUsed": fallback_used, "path": path, "latencyMs": latency},
     }
 
 
+@app.post("/analyze")
+async def analyze_endpoint(req: IntentRequest):
+    """
+    Scope + intent + extraction (+ reply) from one Gemini call, cached under one key.
+    Replaces /scope → /intent → /extract for a message: same fields, one LLM call.
+    """
+    deadline, degraded = _admit("analyze", req.deadlineMs)
+    return _mark_degraded(await _run_analyze(req.text, req.language, deadline), degraded)
+
+
+async def _run_analyze(text: str, language: str, deadline: Deadline | None = None) -> dict:
+    start = time.time()
+
+    def _result(scope: str, intent: str | None = None, reply: str | None = None, extracted: dict | None = None,
+                llm_used: bool = False, fallback_used: bool = False, path: str = PATH_LOCAL, **extra) -> dict:
+        return {
+            "scope": scope,
+            "intent": intent,
+            "reply": reply,
+            "extracted": extracted,
+            "llmUsed": llm_used,
+            "fallbackUsed": fallback_used,
+            "path": path,
+            **extra,
+            "latencyMs": round((time.time() - start) * 1000),
+        }
+
+    emergency = _emergency_precheck(text, language, "analyze")
+    if emergency is not None:
+        _after_emergency(emergency, language)
+        return _result("MEDICAL", "SYMPTOMS", extracted=emergency, emergency=True)
+
+    # ── Local answers — same rules as /scope and /intent ───────────────
+    scope_pred = _confident_scope(text)
+    if scope_pred is not None and scope_pred[0] == "OUT_OF_SCOPE":
+        return _result("OUT_OF_SCOPE")
+    local = _local_first_intent(text, language)
+    if local is not None:
+        return _result("MEDICAL", "SYMPTOMS", extracted=local)
+    intent_pred = confident(intent_model, text)
+    if (scope_pred is not None and scope_pred[0] == "NON_MEDICAL_SAFE" and intent_pred is not None
+            and intent_pred[0] == "SMALL_TALK"):
+        return _result("NON_MEDICAL_SAFE", "SMALL_TALK", get_small_talk_reply(language))
+
+    # ── Primary: one Gemini call ───────────────────────────────────────
+    result = await aanalyze_with_gemini(text, language, deadline)
+    if result is not None:
+        scope, intent = result["scope"], result["intent"]
+        llm_used = result.get("llmUsed", True)
+        if scope == "OUT_OF_SCOPE":
+            return _result(scope, llm_used=llm_used, path=PATH_GEMINI)
+        if intent == "SYMPTOMS":
+            extracted = _gemini_extraction(result)
+            if _nothing_extracted(extracted):
+                return _result(scope, "CLARIFICATION_REQUIRED", get_clarification_reply(language),
+                               llm_used=llm_used, fallback_used=True, path=PATH_GEMINI)
+            return _result(scope, intent, extracted=extracted, llm_used=llm_used, path=PATH_GEMINI)
+        default = get_small_talk_reply(language) if intent == "SMALL_TALK" else get_clarification_reply(language)
+        return _result(scope, intent, result.get("reply") or default, llm_used=llm_used, path=PATH_GEMINI)
+
+    # ── Fallback: keyword scope + regex intent and extraction ──────────
+    scope = _local_classify_scope(text)
+    if scope == "OUT_OF_SCOPE":
+        return _result(scope, fallback_used=True, path=PATH_FALLBACK)
+    intent = classify_intent(text, language)
+    if intent == "SYMPTOMS":
+        extracted = _extract_with_regex(text, language)
+        if not _nothing_extracted(extracted):
+            return _result("MEDICAL", intent, extracted=extracted, fallback_used=True, path=PATH_FALLBACK)
+        intent = "CLARIFICATION_REQUIRED"
+    reply = get_small_talk_reply(language) if intent == "SMALL_TALK" else get_clarification_reply(language)
+    return _result(scope, intent, reply, fallback_used=True, path=PATH_FALLBACK)
+
+
 @app.post("/classify")
 def classify_endpoint(req: ClassifyRequest):
     start = time.time()
@@ -242,15 +566,43 @@ def classify_endpoint(req: ClassifyRequest):
     return {**result, "meta": {"llmUsed": False, "latencyMs": latency}}
 
 
+@app.post("/classify/batch")
+def classify_batch_endpoint(req: ClassifyBatchRequest):
+    """Bulk re-triage of already-extracted cases. results[i] matches /classify for records[i]."""
+    start = time.time()
+    results = classify_batch(req.records)
+    latency = round((time.time() - start) * 1000)
+    return {"results": results, "meta": {"llmUsed": False, "count": len(results), "latencyMs": latency}}
+
+
 @app.post("/explain")
-def explain(req: ExplainRequest):
+async def explain(req: ExplainRequest):
+    deadline, degraded = _admit("explain", req.deadlineMs)
+    emergency = bool(req.text) and is_emergency_by_keywords(req.text)
+    return _mark_degraded(await _run_explain(req.urgency, req.careLevel, req.structured, req.reasonCodes,
+                                             req.language, deadline, emergency), degraded)
+
+
+async def _run_explain(urgency: str, care_level: str, structured: dict, reason_codes: list, language: str,
+                       deadline: Deadline | None = None, emergency: bool = False) -> dict:
     start = time.time()
-    result = generate_explanation(
-        urgency=req.urgency,
-        care_level=req.careLevel,
-        structured=req.structured,
-        reason_codes=req.reasonCodes,
-        language=req.language,
+    if emergency:
+        # The message hit the emergency keyword automaton: never wait on Gemini
+        # here. The Gemini text is used if /intent or /extract already warmed it.
+        # Emergencies reached through the rules alone get the normal explanation.
+        result = cached_explanation(urgency, care_level, structured, reason_codes, language)
+        latency = round((time.time() - start) * 1000)
+        llm_used = result.pop("llmUsed", False)
+        result.pop("fallbackUsed", None)
+        return {**result, "meta": {"llmUsed": llm_used, "fallbackUsed": not llm_used, "emergency": True,
+                                   "latencyMs": latency}}
+    result = await agenerate_explanation(
+        urgency=urgency,
+        care_level=care_level,
+        structured=structured,
+        reason_codes=reason_codes,
+        language=language,
+        deadline=deadline,
     )
     latency = round((time.time() - start) * 1000)
     llm_used = result.pop("llmUsed", False)
@@ -272,42 +624,45 @@ def safety_check(req: ExtractRequest):
 class ScopeRequest(BaseModel):
     text: str
     language: str = "en"
+    deadlineMs: int | None = None
 
 
-GENERAL_ANSWER_PROMPT = """You are ArogyaSaarthi, a friendly health navigation assistant for rural India.
-The user is asking a general (non-medical) question. Answer briefly and helpfully in {language_name}.
-STRICT RULES:
-- Do NOT provide any medical advice, diagnosis, or medication suggestions.
-- If the question touches on health/medicine, decline and say you can only help with symptoms.
-- Keep the answer to 2-3 sentences max.
-- Be warm and friendly.
-- Do NOT mention drug names, dosages, or treatments.
-
-User message: {text}
-Answer in {language_name}:"""
-
 LANGUAGE_NAMES = {
     "en": "English", "hi": "Hindi", "mr": "Marathi", "ta": "Tamil", "te": "Telugu"
 }
 
 
 @app.post("/general-answer")
-def general_answer(req: ScopeRequest):
+async def general_answer(req: ScopeRequest):
     """Safe Gemini answer for NON_MEDICAL_SAFE scope. Never provides medical advice."""
+    deadline, degraded = _admit("generalAnswer", req.deadlineMs)
+    return _mark_degraded(await _run_general_answer(req.text, req.language, deadline), degraded)
+
+
+async def _run_general_answer(text: str, language: str, deadline: Deadline | None = None) -> dict:
     start = time.time()
+    if is_emergency_by_keywords(text):
+        fallback = _emergency_fallback(language)
+        return {
+            "reply": f"{fallback['symptom_summary']} {fallback['recommended_next_steps'][0]}",
+            "llmUsed": False,
+            "emergency": True,
+            "latencyMs": round((time.time() - start) * 1000),
+        }
     try:
-        from gemini_client import is_enabled as gemini_enabled, call_gemini
+        from gemini_client import is_enabled as gemini_enabled, acall_gemini
         if not gemini_enabled():
             return {"reply": None, "llmUsed": False}
 
-        prompt = GENERAL_ANSWER_PROMPT.format(
-            text=req.text,
-            language_name=LANGUAGE_NAMES.get(req.language, "English"),
+        prompt = prompts.GENERAL.render(
+            text=text,
+            language_name=LANGUAGE_NAMES.get(language, "English"),
         )
-        reply = call_gemini(prompt, timeout=15)
+        # Not cached (no site): free-form answers should stay fresh.
+        reply = await acall_gemini(prompt, timeout=15, deadline=deadline)
         if reply:
             # Safety check on reply
-            safety = check_safety(reply, req.language)
+            safety = check_safety(reply, language)
             if not safety.get("safe", True):
                 return {"reply": None, "llmUsed": True, "safetyBlocked": True}
             return {
@@ -318,53 +673,66 @@ def general_answer(req: ScopeRequest):
     except Exception as e:
         logger.warning(f"[GeneralAnswer] Gemini failed: {e}")
     return {"reply": None, "llmUsed": False, "latencyMs": round((time.time() - start) * 1000)}
-SCOPE_PROMPT = """You are a scope classifier for ArogyaSaarthi, a medical navigation assistant for rural India.
-Classify the user message into exactly one scope. Return ONLY valid JSON — no markdown, no explanation.
-
-Scopes:
-- MEDICAL: symptoms, triage, red flags, clinic/hospital/PHC/CHC, booking, home care, emergency, health conditions
-- NON_MEDICAL_SAFE: greetings, general small talk, basic factual non-medical questions (geography, math, weather, jokes)
-- OUT_OF_SCOPE: requests for drug names, prescriptions, diagnosis, medication advice, or topics completely unrelated to health navigation (finance, politics, creative writing)
-
-HARD RULES:
-- Any mention of "which medicine", "what drug", "prescribe", "diagnose me", "tablet", "dosage" → OUT_OF_SCOPE
-- Any symptom, body part complaint, clinic, hospital, PHC, booking → MEDICAL
-- Greetings, thanks, general knowledge → NON_MEDICAL_SAFE
 
-JSON schema:
-{{"scope": "MEDICAL|NON_MEDICAL_SAFE|OUT_OF_SCOPE", "confidence": 0.0-1.0}}
 
-Message: {text}
-JSON only:"""
+_SCOPE_SITE = PromptSite("scope", prompts.SCOPE.template, ttl=3600, schema=schemas.SCOPE)
 
 
 @app.post("/scope")
-def scope_endpoint(req: ScopeRequest):
+async def scope_endpoint(req: ScopeRequest):
     """Classify message scope: MEDICAL | NON_MEDICAL_SAFE | OUT_OF_SCOPE."""
+    deadline, degraded = _admit("scope", req.deadlineMs)
+    return _mark_degraded(await _run_scope(req.text, req.language, deadline), degraded)
+
+
+async def _run_scope(text: str, language: str, deadline: Deadline | None = None) -> dict:
     start = time.time()
+    if is_emergency_by_keywords(text):
+        return {
+            "scope": "MEDICAL",
+            "confidence": 1.0,
+            "llmUsed": False,
+            "path": PATH_LOCAL,
+            "emergency": True,
+            "latencyMs": round((time.time() - start) * 1000),
+        }
+
+    # ── Local model, when confident and not contradicted by keywords ───
+    predicted = _confident_scope(text)
+    if predicted is not None:
+        return {
+            "scope": predicted[0],
+            "confidence": round(predicted[1], 3),
+            "llmUsed": False,
+            "path": PATH_LOCAL,
+            "latencyMs": round((time.time() - start) * 1000),
+        }
 
     # ── Gemini primary ─────────────────────────────────────────────────
     try:
-        from gemini_client import is_enabled as gemini_enabled, call_gemini_json
+        from gemini_client import is_enabled as gemini_enabled, acall_gemini_json
         if gemini_enabled():
-            prompt = SCOPE_PROMPT.format(text=req.text)
-            data = call_gemini_json(prompt, timeout=15)
+            prompt = prompts.SCOPE.render(text=text, schema=schema_prompt(schemas.SCOPE))
+            data = await acall_gemini_json(prompt, timeout=15, deadline=deadline,
+                                           site=_SCOPE_SITE, inputs=(text, language))
             if data and data.get("scope") in ("MEDICAL", "NON_MEDICAL_SAFE", "OUT_OF_SCOPE"):
                 return {
                     "scope": data["scope"],
                     "confidence": float(data.get("confidence", 0.9)),
                     "llmUsed": True,
+                    "path": PATH_GEMINI,
                     "latencyMs": round((time.time() - start) * 1000),
                 }
     except Exception as e:
         logger.warning(f"[Scope] Gemini failed: {e}")
 
     # ── Local fallback ─────────────────────────────────────────────────
-    scope = _local_classify_scope(req.text)
+    scope = _local_classify_scope(text)
     return {
         "scope": scope,
         "confidence": 0.8,
         "llmUsed": False,
+        "path": PATH_FALLBACK,
         "latencyMs": round((time.time() - start) * 1000),
     }
 
@@ -384,13 +752,32 @@ _MEDICAL_KW = _re.compile(
 )
 
 _OUT_OF_SCOPE_KW = _re.compile(
-    r"\b(medicine|drug|tablet|capsule|dosage|prescription|prescribe|diagnose|diagnosis|"
+    r"\b(medicine|drug|tablet|capsule|dosage|prescription|prescribe|diagnose|diagnosis|dawa|dawai|davai|goli|"
     r"paracetamol|ibuprofen|antibiotic|steroid|insulin|metformin|aspirin|"
     r"stock|share|price|invest|politics|poem|song|write|essay|recipe|cook)\b",
     _re.IGNORECASE,
 )
 
 
+def _medical_signal(text: str) -> bool:
+    """Medical / symptom keywords — the local model never overrules these to small talk."""
+    return bool(_MEDICAL_KW.search(text)) or _has_symptom_signal(text)
+
+
+def _confident_scope(text: str) -> tuple[str, float] | None:
+    """Confident local model scope, unless the keyword rules contradict it: a
+    medicine / off-topic keyword must be OUT_OF_SCOPE, a medical one not
+    NON_MEDICAL_SAFE. None sends the message on to Gemini or the heuristic."""
+    predicted = confident(scope_model, text)
+    if predicted is None:
+        return None
+    if predicted[0] != "OUT_OF_SCOPE" and _OUT_OF_SCOPE_KW.search(text):
+        return None
+    if predicted[0] == "NON_MEDICAL_SAFE" and _medical_signal(text):
+        return None
+    return predicted
+
+
 def _local_classify_scope(text: str) -> str:
     if _OUT_OF_SCOPE_KW.search(text):
         return "OUT_OF_SCOPE"
@@ -399,6 +786,92 @@ def _local_classify_scope(text: str) -> str:
     return "NON_MEDICAL_SAFE"
 
 
+class PipelineRequest(BaseModel):
+    text: str
+    language: str = "en"
+    source: str = "text"
+    deadlineMs: int | None = None
+
+
+@app.post("/pipeline")
+async def pipeline_endpoint(req: PipelineRequest):
+    """
+    Fused analyze → extract → classify → explain in one request.
+    Returns the union of the per-stage responses plus per-stage timings.
+    Scope, intent and extraction come from one /analyze call; /extract only
+    runs if that returned no extraction. The chain stops as soon as the
+    message is not a symptom report. All stages share one deadline budget.
+    """
+    start = time.time()
+    text, language = req.text, req.language
+    deadline, degraded = _admit("pipeline", req.deadlineMs)
+    stages = {}
+
+    def _stage(name: str, result: dict) -> dict:
+        meta = result.get("meta", result)
+        stages[name] = {
+            "latencyMs": meta.get("latencyMs", 0),
+            "llmUsed": meta.get("llmUsed", False),
+            "fallbackUsed": meta.get("fallbackUsed", not meta.get("llmUsed", False)),
+        }
+        return result
+
+    def _done(**fields) -> dict:
+        return {
+            "scope": scope,
+            "intent": None,
+            "reply": None,
+            "extracted": None,
+            **fields,
+            "meta": {
+                "llmUsed": any(s["llmUsed"] for s in stages.values()),
+                "fallbackUsed": any(s["fallbackUsed"] for s in stages.values() if not s.get("skipped")),
+                "latencyMs": round((time.time() - start) * 1000),
+                "stages": stages,
+                **({"degraded": True} if degraded else {}),
+            },
+        }
+
+    # ── Analyze: scope + intent + extraction in one call ───────────────
+    analyze_res = _stage("analyze", await _run_analyze(text, language, deadline))
+    scope = analyze_res["scope"]
+    if scope == "OUT_OF_SCOPE":
+        return _done()
+    if scope == "NON_MEDICAL_SAFE":
+        general = await _run_general_answer(text, language, deadline)
+        _stage("generalAnswer", {**general, "fallbackUsed": not general.get("reply")})
+        return _done(intent="SMALL_TALK", reply=general.get("reply"))
+    intent = analyze_res["intent"]
+    if intent != "SYMPTOMS":
+        return _done(intent=intent, reply=analyze_res.get("reply"))
+
+    # ── Extract — skipped when /analyze already returned the extraction ─
+    extracted = analyze_res.get("extracted")
+    if extracted is not None:
+        stages["extract"] = {"latencyMs": 0, "llmUsed": False, "fallbackUsed": False, "skipped": True}
+    else:
+        extract_res = _stage("extract", await _run_extract(text, language, deadline))
+        extracted = {k: v for k, v in extract_res.items() if k != "meta"}
+        primary = extracted.get("primaryComplaint", "unknown")
+        if (primary in (None, "unknown") and not extracted.get("redFlagsDetected")
+                and not extracted.get("duration", {}).get("value")):
+            return _done(intent="CLARIFICATION_REQUIRED", reply=get_clarification_reply(language))
+
+    # ── Classify (deterministic rules) ─────────────────────────────────
+    t = time.time()
+    classification = classify(extracted)
+    stages["classify"] = {"latencyMs": round((time.time() - t) * 1000), "llmUsed": False, "fallbackUsed": False}
+
+    # ── Explain ────────────────────────────────────────────────────────
+    explain_res = _stage("explain", await _run_explain(
+        classification["urgency"], classification["careLevel"], extracted,
+        classification["reasonCodes"], language, deadline, bool(analyze_res.get("emergency")),
+    ))
+    explanation = {k: v for k, v in explain_res.items() if k != "meta"}
+
+    return _done(intent="SYMPTOMS", extracted=extracted, **classification, **explanation)
+
+
 if __name__ == "__main__":
     import uvicorn
     port = int(os.getenv("PORT", "8000"))
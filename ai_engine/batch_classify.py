@@ -0,0 +1,163 @@
+"""
+Vectorized triage_rules.classify for bulk re-triage (rules updates, audits).
+
+Records are encoded once into NumPy columns — symptom bitmask (uint64),
+duration bucket and severity rank, using the compiled rule set — then every
+red-flag and general rule is evaluated as a boolean array over the whole batch
+and the winning rule is picked with argmax. Per-record results are identical to
+classify(); records outside the compiled domain go through the interpreter.
+"""
+
+import numpy as np
+
+from triage_rules import (
+    COMPILED, CARE_ORDER, VALID_URGENCIES, VALID_CARE_LEVELS,
+    classify, _classify_interpreted,
+)
+
+_NO_BUCKET = -1   # duration unknown
+
+
+def classify_batch(records: list[dict]) -> list[dict]:
+    """classify() over many structured extractions. A record that classify()
+    would reject gets {"error": "<ExceptionType>"} instead of failing the batch."""
+    if len(COMPILED.bits) > 64 or len(COMPILED.red) + len(COMPILED.general) > 63:
+        return [_classify_one(r) for r in records]  # too wide for the uint64 encoding
+
+    masks, buckets, severities, compiled_idx, results = _encode(records)
+    if len(compiled_idx):
+        decisions = _evaluate(masks, buckets, severities)
+        for i, decision in zip(compiled_idx.tolist(), decisions):
+            results[i] = decision
+    return results
+
+
+def _classify_one(record) -> dict:
+    try:
+        return classify(record)
+    except Exception as e:
+        return {"error": type(e).__name__}
+
+
+def _encode(records: list[dict]) -> tuple:
+    """Columns for records inside the compiled domain; the rest are classified
+    here by the interpreter and already placed in `results`."""
+    n = len(records)
+    masks = np.zeros(n, dtype=np.uint64)
+    buckets = np.full(n, _NO_BUCKET, dtype=np.int16)
+    severities = np.zeros(n, dtype=np.int8)
+    inside = np.zeros(n, dtype=bool)
+    results = [None] * n
+
+    for i, structured in enumerate(records):
+        try:
+            symptoms = structured.get("allDetectedSymptoms", [])
+            if not symptoms and structured.get("primaryComplaint", "unknown") != "unknown":
+                symptoms = [structured["primaryComplaint"]]
+            key = COMPILED.key(
+                symptoms,
+                structured.get("duration", {}).get("value"),
+                structured.get("severity", "unknown"),
+            )
+        except Exception as e:
+            results[i] = {"error": type(e).__name__}
+            continue
+        if key is None:
+            try:
+                results[i] = _classify_interpreted(structured)
+            except Exception as e:
+                results[i] = {"error": type(e).__name__}
+            continue
+        mask, bucket, sev = key
+        masks[i] = mask
+        if bucket is not None:
+            buckets[i] = bucket
+        severities[i] = sev
+        inside[i] = True
+
+    idx = np.flatnonzero(inside)
+    return masks[idx], buckets[idx], severities[idx], idx, results
+
+
+def _rule_matrix(rules: list, masks: np.ndarray, buckets=None, severities=None) -> np.ndarray:
+    """(rules x records) boolean matrix: rule r matches record i."""
+    out = np.empty((len(rules), len(masks)), dtype=bool)
+    for r, rule in enumerate(rules):
+        rmask = np.uint64(rule.mask)
+        hit = (masks & rmask) == rmask if rule.is_and else (masks & rmask) != 0
+        if buckets is not None:
+            if rule.dur_min is not None:
+                hit &= buckets >= rule.dur_min          # unknown (-1) never passes
+            if rule.dur_max is not None:
+                hit &= (buckets == _NO_BUCKET) | (buckets <= rule.dur_max)
+            if rule.sev_min is not None:
+                hit &= severities >= rule.sev_min
+            if rule.sev_max is not None:
+                hit &= severities <= rule.sev_max
+        out[r] = hit
+    return out
+
+
+def _outputs(rules: list, urgency_guard: str, care_guard: str) -> list[tuple]:
+    """Each rule's (urgency, careLevel) after classify()'s validity guards."""
+    outs = []
+    for rule in rules:
+        urgency = rule.output.get("urgency", "MEDIUM")
+        care_level = rule.output.get("careLevel", "PHC")
+        outs.append((
+            urgency if urgency in VALID_URGENCIES else urgency_guard,
+            care_level if care_level in VALID_CARE_LEVELS else care_guard,
+        ))
+    return outs
+
+
+def _best(matrix: np.ndarray, rules: list) -> np.ndarray:
+    """Index of the first highest-ranked matching rule per record (argmax keeps the first)."""
+    care_span = max(CARE_ORDER.values(), default=0) + 1
+    score = np.array([r.rank[0] * care_span + r.rank[1] for r in rules], dtype=np.int64)
+    return np.argmax(np.where(matrix, score[:, None], -1), axis=0)
+
+
+def _evaluate(masks: np.ndarray, buckets: np.ndarray, severities: np.ndarray) -> list[dict]:
+    red, general = COMPILED.red, COMPILED.general
+    n_red = len(red)
+
+    red_m = _rule_matrix(red, masks)
+    gen_m = _rule_matrix(general, masks, buckets, severities)
+    any_red = red_m.any(axis=0) if n_red else np.zeros(len(masks), dtype=bool)
+    any_gen = gen_m.any(axis=0) if general else np.zeros(len(masks), dtype=bool)
+
+    # One integer per record identifying its matched-rule set (red bits, else
+    # general bits shifted past them; 0 = default) — reason lists are built
+    # once per distinct set.
+    weights = np.uint64(1) << np.arange(n_red + len(general), dtype=np.uint64)
+    red_bits = (red_m.astype(np.uint64) * weights[:n_red, None]).sum(axis=0) if n_red else 0
+    gen_bits = (gen_m.astype(np.uint64) * weights[n_red:, None]).sum(axis=0) if general else 0
+    pattern = np.where(any_red, red_bits, np.where(any_gen, gen_bits, 0)).astype(np.uint64)
+
+    # Winning rule: index into red + general, or -1 for the default rule.
+    winner = np.full(len(masks), -1, dtype=np.int64)
+    if general:
+        winner = np.where(any_gen, n_red + _best(gen_m, general), winner)
+    if n_red:
+        winner = np.where(any_red, _best(red_m, red), winner)
+
+    outputs = _outputs(red, "HIGH", "EMERGENCY") + _outputs(general, "MEDIUM", "PHC")
+    all_rules = red + general
+    default = COMPILED.default_decision()
+
+    reasons = {}
+    for p in np.unique(pattern).tolist():
+        rules = [all_rules[b] for b in range(len(all_rules)) if p >> b & 1]
+        reasons[p] = (tuple(r.id for r in rules), tuple(r.name for r in rules))
+
+    results = []
+    for p, w in zip(pattern.tolist(), winner.tolist()):
+        if w < 0:
+            urgency, care_level, codes, names = default
+        else:
+            urgency, care_level = outputs[w]
+            codes, names = reasons[p]
+        results.append({"urgency": urgency, "careLevel": care_level,
+                        "reasonCodes": list(codes), "matchedRules": list(names)})
+    return results
@@ -0,0 +1,108 @@
+"""
+Rule-set equivalence check: compiled triage_rules.classify and the vectorized
+batch_classify.classify_batch vs the reference interpreter
+(_classify_interpreted). Run after editing rules/triage_rules.json.
+
+Covers every symptom subset up to --max-size rule symptoms (plus an unknown
+symptom), --random larger random subsets, durations around every rule
+threshold, every severity, and the primaryComplaint-only input shape.
+
+Usage: python check_rules.py [--max-size 3] [--random 20000] [--seed 7]
+Exit code 1 if any input classifies differently.
+"""
+
+import argparse
+import gc
+import itertools
+import random
+import sys
+import time
+
+import triage_rules
+from batch_classify import classify_batch
+from triage_rules import COMPILED, RULES, classify, _classify_interpreted
+
+SEVERITIES = ["mild", "moderate", "severe", "unknown", "not_a_severity"]
+
+
+def _durations() -> list:
+    probes = {None, 0, -1, 0.5, 1000}
+    for t in COMPILED.thresholds:
+        probes.update({t, t - 1, t - 0.5, t + 0.5, t + 1})
+    return sorted(probes, key=lambda d: (d is not None, d or 0))
+
+
+def _symptom_sets(max_size: int, n_random: int, seed: int):
+    vocab = list(COMPILED.bits) + ["not_a_rule_symptom"]
+    for size in range(max_size + 1):
+        yield from (list(c) for c in itertools.combinations(vocab, size))
+    rng = random.Random(seed)
+    for _ in range(n_random):
+        yield rng.sample(vocab, rng.randint(max_size + 1, len(vocab)))
+
+
+def _inputs(symptoms: list, duration, severity: str):
+    yield {"allDetectedSymptoms": symptoms, "duration": {"value": duration}, "severity": severity}
+    if len(symptoms) == 1:
+        # Extractions that only carry primaryComplaint
+        yield {"allDetectedSymptoms": [], "primaryComplaint": symptoms[0],
+               "duration": {"value": duration}, "severity": severity}
+
+
+def check(max_size: int = 3, n_random: int = 20000, seed: int = 7) -> int:
+    """Compare compiled and batch engines with the interpreter. Returns the number of mismatches."""
+    durations = _durations()
+    checked = mismatches = 0
+    t_compiled = t_interpreted = 0.0
+    inputs, expected = [], []
+
+    for symptoms in _symptom_sets(max_size, n_random, seed):
+        for duration, severity in itertools.product(durations, SEVERITIES):
+            for structured in _inputs(symptoms, duration, severity):
+                t = time.perf_counter()
+                got = classify(structured)
+                t_compiled += time.perf_counter() - t
+                t = time.perf_counter()
+                want = _classify_interpreted(structured)
+                t_interpreted += time.perf_counter() - t
+                checked += 1
+                inputs.append(structured)
+                expected.append(want)
+                if got != want:
+                    mismatches += 1
+                    if mismatches <= 10:
+                        print(f"MISMATCH {structured}\n  compiled:    {got}\n  interpreter: {want}")
+
+    # Single-threaded CLI: pause cyclic GC so the timing measures the batch code,
+    # not collections triggered by the per-record result dicts. (The library
+    # itself never touches the process-wide GC; the server calls it concurrently.)
+    gc.disable()
+    try:
+        t = time.perf_counter()
+        batch = classify_batch(inputs)
+        t_batch = time.perf_counter() - t
+    finally:
+        gc.enable()
+    for structured, got, want in zip(inputs, batch, expected):
+        if got != want:
+            mismatches += 1
+            if mismatches <= 10:
+                print(f"BATCH MISMATCH {structured}\n  batch:       {got}\n  interpreter: {want}")
+
+    print(f"rules v{RULES.get('version')}: {len(COMPILED.red)} red-flag + {len(COMPILED.general)} general, "
+          f"{len(COMPILED.bits)} symptoms, duration thresholds {COMPILED.thresholds}")
+    print(f"checked {checked} inputs (single + batch), {mismatches} mismatches, "
+          f"decision table {len(COMPILED._table)}/{triage_rules.MAX_TABLE_ENTRIES} entries")
+    print(f"compiled {t_compiled / checked * 1e6:.2f} µs/call, "
+          f"interpreter {t_interpreted / checked * 1e6:.2f} µs/call, "
+          f"batch {checked / t_batch:,.0f} records/s")
+    return mismatches
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--max-size", type=int, default=3, help="exhaustive symptom subset size")
+    parser.add_argument("--random", type=int, default=20000, help="extra random larger subsets")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+    sys.exit(1 if check(args.max_size, args.random, args.seed) else 0)
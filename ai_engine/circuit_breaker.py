@@ -0,0 +1,169 @@
+"""
+Circuit breaker for the Gemini API.
+
+States:
+- closed    — calls flow; failures are tracked in a rolling window
+- open      — calls are refused instantly so callers use their local fallback
+- half_open — after the cool-down, a few probe calls test recovery
+
+Quota errors (429 / RESOURCE_EXHAUSTED) open the circuit immediately, for the
+server's retry delay if it sent one, else with exponential backoff. Timeouts
+and other errors open it when the rolling error rate or the consecutive
+failure count crosses a threshold.
+"""
+
+import re
+import threading
+import time
+from collections import deque
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+_RETRY_DELAY = re.compile(r"retry[\s_-]*(?:delay|after|in)[\"':\s]*([0-9]+(?:\.[0-9]+)?)\s*s", re.IGNORECASE)
+
+
+def retry_after_seconds(error: Exception) -> float | None:
+    """Retry delay the server suggested in a quota error message, if any."""
+    m = _RETRY_DELAY.search(str(error))
+    return float(m.group(1)) if m else None
+
+
+class CircuitBreaker:
+    """Thread-safe breaker. Callers check allow() before a call and report
+    the outcome with record_success() / record_failure()."""
+
+    def __init__(
+        self,
+        window_seconds: float = 30.0,
+        min_requests: int = 5,
+        error_rate: float = 0.5,
+        consecutive_failures: int = 3,
+        open_seconds: float = 15.0,
+        max_open_seconds: float = 300.0,
+        half_open_probes: int = 1,
+    ):
+        self.window_seconds = window_seconds
+        self.min_requests = min_requests
+        self.error_rate = error_rate
+        self.consecutive_failures = consecutive_failures
+        self.open_seconds = open_seconds
+        self.max_open_seconds = max_open_seconds
+        self.half_open_probes = half_open_probes
+
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._events = deque()        # (timestamp, ok: bool) within the window
+        self._consecutive = 0
+        self._trips = 0               # consecutive opens without a recovery (drives backoff)
+        self._open_until = 0.0
+        self._probes_in_flight = 0
+        self._last_reason = None
+        self._counts = {"refused": 0, "quota": 0, "timeout": 0, "error": 0, "opened": 0}
+
+    # ── Gate ───────────────────────────────────────────────────────────
+    def can_attempt(self) -> bool:
+        """Non-consuming check: would a call be let through right now?"""
+        with self._lock:
+            self._advance()
+            if self._state == CLOSED:
+                return True
+            if self._state == HALF_OPEN:
+                return self._probes_in_flight < self.half_open_probes
+            return False
+
+    def allow(self) -> bool:
+        """Consuming check made right before a call. In half-open this takes a probe slot."""
+        with self._lock:
+            self._advance()
+            if self._state == CLOSED:
+                return True
+            if self._state == HALF_OPEN and self._probes_in_flight < self.half_open_probes:
+                self._probes_in_flight += 1
+                return True
+            self._counts["refused"] += 1
+            return False
+
+    # ── Outcomes ───────────────────────────────────────────────────────
+    def record_success(self) -> None:
+        with self._lock:
+            self._consecutive = 0
+            if self._state == HALF_OPEN:
+                self._probes_in_flight = max(0, self._probes_in_flight - 1)
+                self._state = CLOSED
+                self._trips = 0
+                self._events.clear()
+            self._push(True)
+
+    def record_failure(self, kind: str = "error", retry_after: float | None = None) -> None:
+        """kind: "quota" | "timeout" | "error"."""
+        with self._lock:
+            self._counts[kind] = self._counts.get(kind, 0) + 1
+            self._consecutive += 1
+            self._push(False)
+            if self._state == HALF_OPEN:
+                self._probes_in_flight = max(0, self._probes_in_flight - 1)
+                self._trip(kind, retry_after)
+            elif self._state == CLOSED and (kind == "quota" or self._should_trip()):
+                self._trip(kind, retry_after)
+
+    def release(self) -> None:
+        """The call was abandoned (e.g. cancelled) — free its probe slot without a verdict."""
+        with self._lock:
+            if self._state == HALF_OPEN:
+                self._probes_in_flight = max(0, self._probes_in_flight - 1)
+
+    # ── Introspection ──────────────────────────────────────────────────
+    @property
+    def state(self) -> str:
+        with self._lock:
+            self._advance()
+            return self._state
+
+    def stats(self) -> dict:
+        with self._lock:
+            self._advance()
+            total = len(self._events)
+            failures = sum(1 for _, ok in self._events if not ok)
+            return {
+                "state": self._state,
+                "reason": self._last_reason,
+                "retryInSeconds": round(max(0.0, self._open_until - time.time()), 1) if self._state == OPEN else 0,
+                "windowRequests": total,
+                "windowErrorRate": round(failures / total, 3) if total else 0.0,
+                **self._counts,
+            }
+
+    # ── Internals (lock held) ──────────────────────────────────────────
+    def _push(self, ok: bool) -> None:
+        now = time.time()
+        self._events.append((now, ok))
+        cutoff = now - self.window_seconds
+        while self._events and self._events[0][0] < cutoff:
+            self._events.popleft()
+
+    def _should_trip(self) -> bool:
+        if self._consecutive >= self.consecutive_failures:
+            return True
+        total = len(self._events)
+        if total < self.min_requests:
+            return False
+        failures = sum(1 for _, ok in self._events if not ok)
+        return failures / total >= self.error_rate
+
+    def _trip(self, kind: str, retry_after: float | None) -> None:
+        backoff = min(self.max_open_seconds, self.open_seconds * (2 ** self._trips))
+        if retry_after is not None:
+            backoff = min(self.max_open_seconds, max(retry_after, 1.0))
+        self._state = OPEN
+        self._open_until = time.time() + backoff
+        self._trips += 1
+        self._probes_in_flight = 0
+        self._last_reason = kind
+        self._counts["opened"] += 1
+
+    def _advance(self) -> None:
+        if self._state == OPEN and time.time() >= self._open_until:
+            self._state = HALF_OPEN
+            self._probes_in_flight = 0
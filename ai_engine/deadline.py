@@ -0,0 +1,44 @@
+"""
+Request deadlines — one time budget shared by every Gemini call a request makes.
+
+Each endpoint builds a Deadline from the caller's `deadlineMs` (or the
+REQUEST_SLO_SECONDS default) and passes it down; every Gemini call then uses
+min(its own timeout cap, remaining budget), so a request answers — with the
+local fallback if need be — by the deadline instead of after 50+ seconds.
+"""
+
+import os
+import time
+
+REQUEST_SLO_SECONDS = float(os.getenv("REQUEST_SLO_SECONDS", "8"))
+MIN_CALL_SECONDS = 0.5   # less budget than this and a Gemini call is not worth starting
+
+
+class Deadline:
+    __slots__ = ("expires",)
+
+    def __init__(self, seconds: float):
+        self.expires = time.monotonic() + seconds
+
+    @classmethod
+    def from_request(cls, deadline_ms: int | None = None) -> "Deadline":
+        """Deadline from a request's optional `deadlineMs`, else the configured SLO."""
+        if deadline_ms is not None and deadline_ms > 0:
+            return cls(deadline_ms / 1000)
+        return cls(REQUEST_SLO_SECONDS)
+
+    @classmethod
+    def spent(cls) -> "Deadline":
+        """No budget at all: every Gemini call is skipped and callers answer locally."""
+        return cls(0)
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires - time.monotonic())
+
+    def allows(self, seconds: float = MIN_CALL_SECONDS) -> bool:
+        """True if at least `seconds` of budget is left."""
+        return self.remaining() >= seconds
+
+    def timeout(self, cap: float) -> float:
+        """Timeout for one call: its own cap, shortened to the remaining budget."""
+        return min(cap, self.remaining())
@@ -0,0 +1,181 @@
+"""
+Persistent response cache — SQLite in WAL mode on local disk.
+
+Shared by every worker process on the host and kept across restarts, so
+validated Gemini results survive deploys. Used as L2 behind the in-memory
+ResponseCache:
+- Per-entry TTL (expired rows are never returned and are purged periodically)
+- Entry cap with least-recently-used eviction
+- Each write is one autocommitted statement — atomic, safe with many processes
+- Any SQLite error is logged and treated as a miss: the cache never fails a request
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import zlib
+
+logger = logging.getLogger(__name__)
+
+COMPRESS_MIN_BYTES = 512
+MAINTENANCE_EVERY = 256      # writes between expiry / cap sweeps (per process)
+TOUCH_INTERVAL = 60.0        # refresh a hit's LRU timestamp at most once a minute
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    key      TEXT PRIMARY KEY,
+    value    BLOB NOT NULL,
+    zipped   INTEGER NOT NULL,
+    expires  REAL NOT NULL,
+    accessed REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entries_expires ON entries(expires);
+CREATE INDEX IF NOT EXISTS entries_accessed ON entries(accessed);
+"""
+
+
+class DiskCache:
+    """SQLite-backed TTL + LRU cache of JSON-serializable values."""
+
+    def __init__(self, path: str, ttl: float, max_entries: int = 100_000, name: str = "disk"):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.name = name
+        self._local = threading.local()   # one connection per thread
+        self._lock = threading.Lock()
+        self._writes = 0
+        self._hits = 0
+        self._misses = 0
+        self._errors = 0
+
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        except OSError as e:
+            self._fail("init", e)
+        conn = self._conn()
+        if conn is not None:
+            try:
+                conn.executescript(_SCHEMA)
+            except sqlite3.Error as e:
+                self._fail("init", e)
+
+    # ── Public API ─────────────────────────────────────────────────────
+    def get(self, key: str):
+        """Value for key, or None."""
+        found = self.get_with_ttl(key)
+        return found[0] if found else None
+
+    def get_with_ttl(self, key: str) -> tuple | None:
+        """(value, seconds_left) or None."""
+        conn = self._conn()
+        if conn is None:
+            return None
+        now = time.time()
+        try:
+            row = conn.execute(
+                "SELECT value, zipped, expires, accessed FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or row[2] <= now:
+                self._count(hit=False)
+                return None
+            if now - row[3] > TOUCH_INTERVAL:
+                conn.execute("UPDATE entries SET accessed = ? WHERE key = ?", (now, key))
+        except sqlite3.Error as e:
+            self._fail("get", e)
+            return None
+        self._count(hit=True)
+        payload = zlib.decompress(row[0]) if row[1] else row[0]
+        return json.loads(payload), row[2] - now
+
+    def set(self, key: str, value, ttl: float | None = None) -> None:
+        conn = self._conn()
+        if conn is None:
+            return
+        payload = json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        zipped = len(payload) >= COMPRESS_MIN_BYTES
+        if zipped:
+            payload = zlib.compress(payload)
+        now = time.time()
+        try:
+            conn.execute(
+                "INSERT OR REPLACE INTO entries (key, value, zipped, expires, accessed) VALUES (?, ?, ?, ?, ?)",
+                (key, payload, int(zipped), now + (self.ttl if ttl is None else ttl), now),
+            )
+        except sqlite3.Error as e:
+            self._fail("set", e)
+            return
+        with self._lock:
+            self._writes += 1
+            due = self._writes % MAINTENANCE_EVERY == 0
+        if due:
+            self.maintain()
+
+    def maintain(self) -> None:
+        """Purge expired rows, then evict least recently used rows above the cap."""
+        conn = self._conn()
+        if conn is None:
+            return
+        try:
+            expired = conn.execute("DELETE FROM entries WHERE expires <= ?", (time.time(),)).rowcount
+            evicted = 0
+            if self.max_entries:
+                evicted = conn.execute(
+                    "DELETE FROM entries WHERE key IN ("
+                    " SELECT key FROM entries ORDER BY accessed ASC"
+                    " LIMIT max(0, (SELECT COUNT(*) FROM entries) - ?))",
+                    (self.max_entries,),
+                ).rowcount
+            if expired or evicted:
+                logger.debug(f"[Cache:{self.name}] purged {expired} expired, evicted {evicted}")
+        except sqlite3.Error as e:
+            self._fail("maintain", e)
+
+    def stats(self) -> dict:
+        entries = None
+        conn = self._conn()
+        if conn is not None:
+            try:
+                entries = conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+            except sqlite3.Error:
+                pass
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "path": self.path,
+                "entries": entries,
+                "maxEntries": self.max_entries,
+                "hits": self._hits,
+                "misses": self._misses,
+                "hitRate": round(self._hits / lookups, 4) if lookups else 0.0,
+                "errors": self._errors,
+            }
+
+    # ── Internals ──────────────────────────────────────────────────────
+    def _conn(self) -> sqlite3.Connection | None:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            try:
+                conn = sqlite3.connect(self.path, timeout=0.2, isolation_level=None, check_same_thread=False)
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute("PRAGMA synchronous=NORMAL")
+            except sqlite3.Error as e:
+                self._fail("connect", e)
+                return None
+            self._local.conn = conn
+        return conn
+
+    def _count(self, hit: bool) -> None:
+        with self._lock:
+            if hit:
+                self._hits += 1
+            else:
+                self._misses += 1
+
+    def _fail(self, op: str, e: Exception) -> None:
+        with self._lock:
+            self._errors += 1
+        logger.warning(f"[Cache:{self.name}] {op} failed: {type(e).__name__}: {str(e)[:120]}")
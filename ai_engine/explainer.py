@@ -1,10 +1,17 @@
-"""Explanation generator — Hybrid: Gemini primary, template fallback. No diagnosis/medicine."""
+"""Explanation generator — Hybrid: Gemini primary, template fallback. No diagnosis/medicine.
+Keyed by (urgency, careLevel, timeToAct, top two symptoms, language): the
+pre-generated table (explanation_table.py) answers known combinations, the
+"explain" prompt cache recent Gemini ones; Gemini is called for the rest."""
 
+import hashlib
 import json
 import os
 import logging
 from safety import check_safety
-from gemini_client import is_enabled as gemini_enabled, call_gemini
+from deadline import Deadline
+from explanation_table import ExplanationTable
+import prompts
+from gemini_client import PromptSite, is_enabled as gemini_enabled, call_gemini, acall_gemini
 
 logger = logging.getLogger(__name__)
 
@@ -42,25 +49,8 @@ SYMPTOM_DISPLAY = {
 }
 
 
-EXPLANATION_PROMPT = """You are a compassionate health assistant for a rural health triage system in India.
-Write a short, friendly explanation for a patient based on the triage result below.
-
-STRICT RULES:
-- Do NOT diagnose any disease
-- Do NOT suggest any medicines or treatments
-- Do NOT contradict the urgency level given
-- Keep it under 85 words
-- Write in {language_name} language
-- Be warm, simple, and reassuring
-
-Triage result:
-- Urgency: {urgency}
-- Recommended care: {care_level}
-- Act within: {time_to_act}
-- Main reasons: {top_reasons}
-- Watch for: {watch_for}
-
-Write only the explanation text, nothing else."""
+# The text depends only on the key, so a long TTL is safe.
+_EXPLAIN_SITE = PromptSite("explain", prompts.EXPLAIN.template, ttl=86400)
 
 LANGUAGE_NAMES = {
     "en": "English", "hi": "Hindi", "mr": "Marathi", "ta": "Tamil", "te": "Telugu"
@@ -72,6 +62,28 @@ TIME_TO_ACT = {
     "LOW": "monitor at home",
 }
 
+WATCH_FOR = {
+    "HIGH": ["difficulty breathing", "chest pain", "loss of consciousness"],
+    "MEDIUM": ["breathing difficulty", "chest pain", "fainting"],
+    "LOW": ["worsening symptoms", "fever above 3 days", "difficulty breathing"],
+}
+
+
+def table_version() -> str:
+    """Hash of everything an explanation prompt is built from."""
+    shape = json.dumps([prompts.EXPLAIN.template, LANGUAGE_NAMES, TIME_TO_ACT, WATCH_FOR, SYMPTOM_DISPLAY],
+                       sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(shape.encode()).hexdigest()[:12]
+
+
+TABLE_PATH = os.getenv("EXPLANATION_TABLE_PATH", os.path.join(os.path.dirname(__file__), "data", "explanations.json"))
+_TABLE = ExplanationTable(TABLE_PATH, table_version())
+
+
+def explanation_stats() -> dict:
+    """Pre-generated table size and hit rate (runtime hits: /health → promptCache.sites.explain)."""
+    return _TABLE.stats()
+
 
 def generate_explanation(
     urgency: str,
@@ -79,9 +91,49 @@ def generate_explanation(
     structured: dict,
     reason_codes: list,
     language: str = "en",
+    deadline: Deadline | None = None,
 ) -> dict:
-    """Hybrid explanation: Gemini primary → template fallback."""
-    labels = _load_labels(language)
+    """Hybrid explanation: pre-generated table → Gemini (prompt-cached) → template fallback."""
+    ctx = _explanation_context(urgency, care_level, structured, language)
+    raw = _TABLE.get(ctx["key"])
+    enabled = raw is None and gemini_enabled()
+    if enabled:
+        raw = call_gemini(ctx["prompt"], timeout=20, deadline=deadline, site=_EXPLAIN_SITE, inputs=ctx["key"])
+    return _finish_explanation(urgency, care_level, language, ctx, raw, attempted=enabled or raw is not None)
+
+
+async def agenerate_explanation(
+    urgency: str,
+    care_level: str,
+    structured: dict,
+    reason_codes: list,
+    language: str = "en",
+    deadline: Deadline | None = None,
+) -> dict:
+    """Async generate_explanation."""
+    ctx = _explanation_context(urgency, care_level, structured, language)
+    raw = _TABLE.get(ctx["key"])
+    enabled = raw is None and gemini_enabled()
+    if enabled:
+        raw = await acall_gemini(ctx["prompt"], timeout=20, deadline=deadline, site=_EXPLAIN_SITE, inputs=ctx["key"])
+    return _finish_explanation(urgency, care_level, language, ctx, raw, attempted=enabled or raw is not None)
+
+
+def cached_explanation(
+    urgency: str,
+    care_level: str,
+    structured: dict,
+    reason_codes: list,
+    language: str = "en",
+) -> dict:
+    """Explanation without waiting on Gemini: a pre-generated or already cached Gemini text, else the template."""
+    ctx = _explanation_context(urgency, care_level, structured, language)
+    raw = _TABLE.get(ctx["key"]) or _EXPLAIN_SITE.get(_EXPLAIN_SITE.key(ctx["key"]))
+    return _finish_explanation(urgency, care_level, language, ctx, raw, attempted=raw is not None)
+
+
+def _explanation_context(urgency: str, care_level: str, structured: dict, language: str) -> dict:
+    """Everything the explanation depends on, plus the Gemini prompt built from it."""
     time_to_act = TIME_TO_ACT.get(urgency, "within 24 hours")
 
     # Build structured context for Gemini
@@ -91,28 +143,33 @@ def generate_explanation(
     top_reasons = [symptom_name] + [
         SYMPTOM_DISPLAY.get(s, {}).get(language, s) for s in associated[:1]
     ]
-    watch_for_map = {
-        "HIGH": ["difficulty breathing", "chest pain", "loss of consciousness"],
-        "MEDIUM": ["breathing difficulty", "chest pain", "fainting"],
-        "LOW": ["worsening symptoms", "fever above 3 days", "difficulty breathing"],
+    watch_for = WATCH_FOR.get(urgency, WATCH_FOR["MEDIUM"])
+
+    fields = {
+        "language_name": LANGUAGE_NAMES.get(language, "English"),
+        "urgency": urgency,
+        "care_level": care_level,
+        "time_to_act": time_to_act,
+        "top_reasons": ", ".join(top_reasons[:2]),
+        "watch_for": ", ".join(watch_for[:3]),
+    }
+    return {
+        "time_to_act": time_to_act, "top_reasons": top_reasons, "watch_for": watch_for,
+        "prompt": prompts.EXPLAIN.render(**fields),
+        # Table / prompt-cache key: everything the prompt depends on
+        "key": (urgency, care_level, time_to_act, primary, associated[0] if associated else "", language),
     }
-    watch_for = watch_for_map.get(urgency, watch_for_map["MEDIUM"])
 
+
+def _finish_explanation(urgency: str, care_level: str, language: str, ctx: dict, raw: str | None, attempted: bool) -> dict:
+    """Safety-check Gemini's text (if any), fall back to templates, and build the response."""
+    labels = _load_labels(language)
     llm_used = False
     fallback_used = False
     explanation = None
 
     # ── Primary: Gemini ────────────────────────────────────────────────
-    if gemini_enabled():
-        prompt = EXPLANATION_PROMPT.format(
-            language_name=LANGUAGE_NAMES.get(language, "English"),
-            urgency=urgency,
-            care_level=care_level,
-            time_to_act=time_to_act,
-            top_reasons=", ".join(top_reasons[:2]),
-            watch_for=", ".join(watch_for[:3]),
-        )
-        raw = call_gemini(prompt, timeout=20)
+    if attempted:
         if raw:
             safety_result = check_safety(raw, language)
             if safety_result["safe"]:
@@ -147,9 +204,9 @@ def generate_explanation(
         "disclaimer": disclaimer,
         "urgencyBadge": badge,
         "careLabel": care_label,
-        "timeToAct": time_to_act,
-        "topReasons": top_reasons[:2],
-        "watchFor": watch_for[:3],
+        "timeToAct": ctx["time_to_act"],
+        "topReasons": ctx["top_reasons"][:2],
+        "watchFor": ctx["watch_for"][:3],
         "actions": actions,
         "llmUsed": llm_used,
         "fallbackUsed": fallback_used,
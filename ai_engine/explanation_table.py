@@ -0,0 +1,113 @@
+"""
+Pre-generated explanation table — /explain as a dictionary lookup.
+
+An explanation depends only on (urgency, careLevel, timeToAct, top two
+symptoms, language), a small finite space. warm_explanations.py generates the
+common combinations offline with Gemini and writes them here as versioned
+JSON; explainer.py loads the table at startup and asks Gemini only for
+combinations it does not hold.
+
+The version is a hash of everything the prompt is built from (explainer.
+table_version): a table generated for another prompt is ignored. Every text is
+safety-checked again on load, so a tightened filter also applies to old tables.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+
+from safety import check_safety
+
+logger = logging.getLogger(__name__)
+
+# (urgency, careLevel, timeToAct, primary symptom, second symptom or "", language)
+Key = tuple[str, str, str, str, str, str]
+
+
+def entry_key(entry: dict) -> Key:
+    symptoms = (list(entry["symptoms"]) + ["", ""])[:2]
+    return (entry["urgency"], entry["careLevel"], entry["timeToAct"], symptoms[0], symptoms[1], entry["language"])
+
+
+def make_entry(key: Key, explanation: str) -> dict:
+    urgency, care_level, time_to_act, primary, second, language = key
+    return {
+        "urgency": urgency, "careLevel": care_level, "timeToAct": time_to_act,
+        "symptoms": [s for s in (primary, second) if s], "language": language,
+        "explanation": explanation,
+    }
+
+
+class ExplanationTable:
+    """Read-only key → explanation map with hit / miss counters."""
+
+    def __init__(self, path: str, version: str):
+        self.path = path
+        self.version = version
+        self.model = None
+        self.entries: dict[Key, str] = {}
+        self.rejected = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self._load()
+
+    def _load(self) -> None:
+        if not self.path or not os.path.exists(self.path):
+            logger.info(f"[Explanations] No pre-generated table at {self.path!r} — Gemini / template only")
+            return
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"[Explanations] Could not read {self.path}: {type(e).__name__}: {e}")
+            return
+        if data.get("version") != self.version:
+            logger.warning(f"[Explanations] Table version {data.get('version')} != {self.version} "
+                           f"(prompt changed) — ignoring it; re-run warm_explanations.py")
+            return
+        self.model = data.get("model")
+        for entry in data.get("entries", []):
+            if check_safety(entry["explanation"], entry["language"])["safe"]:
+                self.entries[entry_key(entry)] = entry["explanation"]
+            else:
+                self.rejected += 1
+        logger.info(f"[Explanations] Loaded {len(self.entries)} pre-generated explanations "
+                    f"({self.rejected} failed the safety filter)")
+
+    def get(self, key: Key) -> str | None:
+        text = self.entries.get(key)
+        with self._lock:
+            if text is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return text
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "version": self.version,
+                "model": self.model,
+                "entries": len(self.entries),
+                "rejected": self.rejected,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hitRate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+def save(path: str, version: str, model: str, entries: list[dict]) -> None:
+    """Write the table atomically (temp file + rename), sorted for stable diffs."""
+    entries = sorted(entries, key=entry_key)
+    data = {"version": version, "model": model,
+            "generatedAt": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()), "entries": entries}
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=1)
+        f.write("\n")
+    os.replace(tmp, path)
@@ -1,19 +1,58 @@
 """
 Gemini client — google-genai SDK with:
-- System prompt injection
-- Structured JSON output enforcement
-- Retry-with-repair on invalid JSON
-- In-memory cache (10 min TTL) keyed by (message_hash, language)
+- Sync (call_*) and asyncio (acall_*) APIs sharing one client / connection pool
+- Bounded async concurrency; timeouts cancel the in-flight request
+- Prompt registry (prompts.py): the system prompt goes as a system instruction,
+  only for the sites that need it; per-endpoint prompt / response token counters
+- Structured JSON output: with GEMINI_STRUCTURED_OUTPUT (default) JSON calls use
+  the SDK's JSON mode with a response schema from schemas.py, and prompts leave
+  the schema text out
+- Local JSON salvage (json_repair) and triage schema coercion before any
+  retry-with-repair round trip; the repair rate is reported by parse_stats()
+- Singleflight: identical in-flight requests share one Gemini call
+- Bounded LRU cache (10 min TTL, entry + byte caps) keyed by (message_hash, language)
+  over the normalized message (text_normalizer), so trivially different wordings share an entry;
+  optionally backed by a persistent SQLite tier shared across workers and restarts,
+  and by a near-duplicate (MinHash/LSH) tier guarded by the local extraction
+- Prompt-level cache for other call sites (PromptSite): per-site TTL and hit counters
 - 429 / quota error detection
+- Circuit breaker: quota errors, timeouts and error bursts short-circuit to local fallback
+- Negative cache: a message / prompt that just failed is not retried for a short while
+- Deadline budget: optional per-request Deadline caps every call's timeout
+- Rate limiter: RPM / TPM buckets with a priority queue (triage first); a call
+  that would wait past its budget fails fast to the local fallback
+- Load signals for admission control: in-flight calls and their queue waits
+- Streaming triage (GEMINI_STREAM_TRIAGE): an incremental JSON parser (json_stream)
+  hands urgency_level to the caller before the reply is complete
 - Never logs API key
 """
 
 import os
+import re
+import copy
 import json
+import time
+import asyncio
 import hashlib
 import logging
-import time
 import threading
+import weakref
+from bisect import bisect_right
+from typing import Callable
+
+from admission import controller as _admission
+from circuit_breaker import CircuitBreaker, OPEN, retry_after_seconds
+from deadline import Deadline, MIN_CALL_SECONDS
+from disk_cache import DiskCache
+from json_repair import loads as _salvage_json
+from json_stream import FieldStream
+import prompts
+import schemas
+from near_cache import NearDuplicateCache
+from rate_limiter import RateLimiter, RateLimited
+from response_cache import ResponseCache
+from singleflight import SingleFlight
+from text_normalizer import normalize, canonical_symptom_order
 
 logger = logging.getLogger(__name__)
 
@@ -21,67 +60,284 @@ _client = None
 _model_name = None
 _enabled = False
 
+# Max concurrent async Gemini requests per worker. Extra callers wait for a slot
+# (the wait counts against their timeout) instead of opening more connections.
+MAX_CONCURRENCY = int(os.getenv("GEMINI_MAX_CONCURRENCY", "256"))
+_async_slots = weakref.WeakKeyDictionary()  # event loop -> asyncio.Semaphore
+
+
+def _async_limit() -> asyncio.Semaphore:
+    """The shared concurrency limit for the running event loop."""
+    loop = asyncio.get_running_loop()
+    sem = _async_slots.get(loop)
+    if sem is None:
+        sem = _async_slots[loop] = asyncio.Semaphore(MAX_CONCURRENCY)
+    return sem
+
+
 # ── In-memory cache ────────────────────────────────────────────────────────
-_cache: dict = {}          # key -> {"value": dict, "expires": float}
-_cache_lock = threading.Lock()
 CACHE_TTL = 600            # 10 minutes
+CACHE_MAX_ENTRIES = int(os.getenv("GEMINI_CACHE_MAX_ENTRIES", "5000"))
+CACHE_MAX_BYTES = int(os.getenv("GEMINI_CACHE_MAX_BYTES", str(16 * 1024 * 1024)))
+_cache = ResponseCache(ttl=CACHE_TTL, max_entries=CACHE_MAX_ENTRIES, max_bytes=CACHE_MAX_BYTES, name="triage")
+
+# Optional L2: persistent, shared by all workers on the host (empty path = off).
+DISK_CACHE_PATH = os.getenv("GEMINI_DISK_CACHE_PATH", "").strip()
+DISK_CACHE_TTL = float(os.getenv("GEMINI_DISK_CACHE_TTL", str(24 * 3600)))
+DISK_CACHE_MAX_ENTRIES = int(os.getenv("GEMINI_DISK_CACHE_MAX_ENTRIES", "100000"))
+_disk_cache = (
+    DiskCache(DISK_CACHE_PATH, ttl=DISK_CACHE_TTL, max_entries=DISK_CACHE_MAX_ENTRIES, name="triage-disk")
+    if DISK_CACHE_PATH else None
+)
+
+
+# Opt-in: "fever and cough" and "cough and fever" share one key.
+CANONICAL_SYMPTOM_ORDER = os.getenv("GEMINI_CACHE_SYMPTOM_ORDER", "false").lower() == "true"
+_symptom_terms: set[str] | None = None
+
+
+def _key_text(message: str) -> str:
+    """Normalized message as used in cache keys."""
+    global _symptom_terms
+    text = normalize(message)
+    if CANONICAL_SYMPTOM_ORDER:
+        if _symptom_terms is None:
+            from nlp_extractor import symptom_terms  # deferred: nlp_extractor imports this module
+            _symptom_terms = symptom_terms()
+        text = canonical_symptom_order(text, _symptom_terms)
+    return text
+
+
+# Optional near-duplicate tier: reuses a validated triage for a reworded message,
+# but only when the local extraction of both messages matches (_near_guard).
+NEAR_CACHE_ENABLED = os.getenv("GEMINI_NEAR_CACHE", "false").lower() == "true"
+_near_cache = (
+    NearDuplicateCache(
+        threshold=float(os.getenv("GEMINI_NEAR_CACHE_THRESHOLD", "0.8")),
+        max_entries=int(os.getenv("GEMINI_NEAR_CACHE_MAX_ENTRIES", "100000")),
+        ttl=float(os.getenv("GEMINI_NEAR_CACHE_TTL", "3600")),
+        name="triage-near",
+    )
+    if NEAR_CACHE_ENABLED else None
+)
+
+
+def _near_guard(message: str, language: str) -> tuple | None:
+    """What two messages must share before one's triage is reused for the other:
+    symptom set, red flags, duration bucket (rule thresholds) and severity from
+    the regex extractor, plus language / model / triage version. None if no
+    symptom is detected — nothing to anchor a reuse on."""
+    from nlp_extractor import _extract_with_regex  # deferred: nlp_extractor imports this module
+    from triage_rules import COMPILED
+    extracted = _extract_with_regex(message, language)
+    symptoms = extracted["allDetectedSymptoms"]
+    if not symptoms:
+        return None
+    days = extracted["duration"]["value"]
+    return (
+        language, _model_name, _triage_version(),
+        tuple(sorted(symptoms)), tuple(sorted(extracted["redFlagsDetected"])),
+        None if days is None else bisect_right(COMPILED.thresholds, days),
+        extracted["severity"],
+    )
 
 
 def _cache_key(message: str, language: str) -> str:
-    raw = f"{message.strip().lower()}|{language}"
+    # Model, rules version and prompt version are part of the key, so a
+    # persisted answer is never served after any of them changes.
+    raw = f"{_key_text(message)}|{language}|{_model_name}|{_triage_version()}"
     return hashlib.sha256(raw.encode()).hexdigest()
 
 
 def cache_get(message: str, language: str) -> dict | None:
     key = _cache_key(message, language)
-    with _cache_lock:
-        entry = _cache.get(key)
-        if entry and entry["expires"] > time.time():
-            return entry["value"]
-        if entry:
-            del _cache[key]
-    return None
+    value = _cache.get(key)
+    if value is None and _disk_cache is not None:
+        found = _disk_cache.get_with_ttl(key)
+        if found is not None:
+            value, ttl_left = found
+            _cache.set(key, value, ttl=min(CACHE_TTL, ttl_left))
+    if value is None and _near_cache is not None:
+        guard = _near_guard(message, language)
+        if guard is not None:
+            value = _near_cache.get(message, guard)
+    return value
 
 
 def cache_set(message: str, language: str, value: dict) -> None:
     key = _cache_key(message, language)
-    with _cache_lock:
-        _cache[key] = {"value": value, "expires": time.time() + CACHE_TTL}
+    _cache.set(key, value)
+    if _disk_cache is not None:
+        _disk_cache.set(key, value)
+    if _near_cache is not None:
+        guard = _near_guard(message, language)
+        if guard is not None:
+            _near_cache.set(message, guard, value)
 
 
-# ── ArogyaSaarthi system prompt ────────────────────────────────────────────
-SYSTEM_PROMPT = """You are ArogyaSaarthi AI, a responsible AI health triage assistant designed for India.
-Your purpose is to guide users safely to the appropriate level of care based on symptoms.
+def cache_stats() -> dict:
+    """Hit/miss/eviction counters and current size of the triage cache (and its optional tiers)."""
+    stats = _cache.stats()
+    if _disk_cache is not None:
+        stats["disk"] = _disk_cache.stats()
+    if _near_cache is not None:
+        stats["near"] = _near_cache.stats()
+    return stats
 
-ABSOLUTE RULES — never violate these:
-- Do NOT diagnose any disease
-- Do NOT prescribe or name any medication or dosage
-- Do NOT replace a doctor
-- Do NOT invent symptoms or conditions not mentioned by the user
-- Do NOT output specific facility names, addresses, or phone numbers
-- If uncertain, be conservative (prefer moderate over low urgency)
-- Always include a disclaimer
 
-EMERGENCY DETECTION — if message contains any of these, urgency MUST be "emergency":
-chest pain, severe breathlessness, unconscious, not responding, seizure, convulsion,
-heavy bleeding, stroke, blue lips, suicidal, self-harm, infant high fever lethargic,
-severe allergic reaction, snake bite, poisoning
+# ── Prompt-level cache (intent, extraction, scope, explanation) ────────────
+PROMPT_CACHE_MAX_ENTRIES = int(os.getenv("GEMINI_PROMPT_CACHE_MAX_ENTRIES", "20000"))
+PROMPT_CACHE_MAX_BYTES = int(os.getenv("GEMINI_PROMPT_CACHE_MAX_BYTES", str(16 * 1024 * 1024)))
+_prompt_cache = ResponseCache(ttl=3600, max_entries=PROMPT_CACHE_MAX_ENTRIES,
+                              max_bytes=PROMPT_CACHE_MAX_BYTES, name="prompt")
+_prompt_sites: dict[str, "PromptSite"] = {}
 
-OUTPUT: Return ONLY valid JSON. No markdown. No explanation. No extra text.
-"""
 
-# ── JSON schema description for Gemini ────────────────────────────────────
-TRIAGE_SCHEMA_DESC = """{
-  "symptom_summary": "brief plain-language summary of user symptoms",
-  "urgency_level": "low | moderate | urgent | emergency",
-  "urgency_reason": "1-2 sentence explanation of urgency choice",
-  "recommended_next_steps": ["step1", "step2", "step3"],
-  "warning_signs": ["sign1", "sign2", "sign3"],
-  "clarifying_question": "one question string if info insufficient, else null",
-  "disclaimer": "This is not a medical diagnosis. If symptoms worsen or you feel unsafe, seek professional care."
-}"""
-
-ALLOWED_URGENCY = {"low", "moderate", "urgent", "emergency"}
+class PromptSite:
+    """A Gemini call site whose reply depends only on its template and inputs,
+    so replies can be cached. Pass it as `site=` with the template's inputs
+    (language included) to call_gemini / call_gemini_json; call sites that
+    must not be cached (e.g. /general-answer) simply don't pass one.
+    A JSON site's `schema` (schemas.py) is its response schema.
+    The TTL can be tuned with GEMINI_PROMPT_CACHE_TTL_<NAME> (0 disables)."""
+
+    def __init__(self, name: str, template: str, ttl: float, schema: dict | None = None):
+        self.name = name
+        self.schema = schema
+        self.ttl = float(os.getenv(f"GEMINI_PROMPT_CACHE_TTL_{name.upper()}", str(ttl)))
+        shape = json.dumps(schema, sort_keys=True) if schema else ""
+        self.template_id = hashlib.sha256(f"{template}|{shape}".encode()).hexdigest()[:12]
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        _prompt_sites[name] = self
+
+    def key(self, inputs: tuple) -> str | None:
+        if self.ttl <= 0:
+            return None
+        norm = "|".join(normalize(str(x)) for x in inputs)
+        return hashlib.sha256(f"{self.name}|{self.template_id}|{_model_name}|{norm}".encode()).hexdigest()
+
+    def get(self, key: str | None):
+        if key is None:
+            return None
+        value = _prompt_cache.get(key)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def set(self, key: str | None, value) -> None:
+        if key is not None and value is not None:
+            _prompt_cache.set(key, value, ttl=self.ttl)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hitRate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+def prompt_cache_stats() -> dict:
+    """Prompt cache size plus hit rate per call site."""
+    return {**_prompt_cache.stats(), "sites": {name: site.stats() for name, site in _prompt_sites.items()}}
+
+
+# ── In-flight request coalescing ───────────────────────────────────────────
+_triage_flights = SingleFlight("triage")     # keyed by _cache_key(message, language)
+_json_flights = SingleFlight("gemini_json")  # keyed by prompt hash
+
+
+def singleflight_stats() -> dict:
+    """Executions vs. coalesced callers for triage and generic JSON calls."""
+    return {"triage": _triage_flights.stats(), "json": _json_flights.stats()}
+
+
+# ── Circuit breaker + negative cache ───────────────────────────────────────
+_breaker = CircuitBreaker(
+    error_rate=float(os.getenv("GEMINI_BREAKER_ERROR_RATE", "0.5")),
+    open_seconds=float(os.getenv("GEMINI_BREAKER_OPEN_SECONDS", "15")),
+    max_open_seconds=float(os.getenv("GEMINI_BREAKER_MAX_OPEN_SECONDS", "300")),
+)
+
+# Keys (triage cache key / prompt hash) whose Gemini call just failed.
+NEGATIVE_TTL = float(os.getenv("GEMINI_NEGATIVE_TTL", "30"))
+_failures = ResponseCache(ttl=NEGATIVE_TTL, max_entries=2000, name="negative")
+
+
+# ── Deadline budget ────────────────────────────────────────────────────────
+MIN_REPAIR_SECONDS = 2.0   # budget needed to start the triage repair round
+_DEADLINE_CODES = {"deadline_exceeded", "repair_skipped_deadline", "rate_limited"}
+
+
+def _call_timeout(timeout: float, deadline: Deadline | None) -> float | None:
+    """Timeout for one call under the request deadline; None if the budget is spent."""
+    if deadline is None:
+        return timeout
+    if not deadline.allows(MIN_CALL_SECONDS):
+        return None
+    return deadline.timeout(timeout)
+
+
+def _wait_budget(deadline: Deadline | None) -> float | None:
+    """How long a coalesced follower may wait for the leader's result."""
+    return deadline.remaining() if deadline is not None else None
+
+
+def breaker_stats() -> dict:
+    """Circuit state, open reason, failure counters and negative-cache size."""
+    return {**_breaker.stats(), "negativeCache": len(_failures)}
+
+
+# ── Rate limiter (shared quota) ────────────────────────────────────────────
+# Priority class of a call = its call-site name (prompts.py): "triage" / "repair",
+# else its PromptSite name, else "general".
+_limiter = RateLimiter(
+    rpm=int(os.getenv("GEMINI_RATE_LIMIT_RPM", "0")),
+    tpm=int(os.getenv("GEMINI_RATE_LIMIT_TPM", "0")),
+)
+
+
+def _tokens_used(response) -> int | None:
+    usage = getattr(response, "usage_metadata", None)
+    return getattr(usage, "total_token_count", None)
+
+
+def _record_tokens(spec: prompts.Prompt, prompt: str, response) -> None:
+    """Prompt / response tokens of a completed call — reported usage, else estimated."""
+    usage = getattr(response, "usage_metadata", None)
+    sent = getattr(usage, "prompt_token_count", None)
+    received = getattr(usage, "candidates_token_count", None)
+    reported = sent is not None
+    if sent is None:
+        sent = spec.input_tokens(prompt)
+    if received is None:
+        received = prompts.estimate_tokens(getattr(response, "text", None) or "")
+    prompts.record_usage(spec.name, sent, received, reported)
+
+
+def _rate_limited(e: RateLimited) -> str:
+    logger.warning(f"[Gemini] Rate limited ({e}) — using local fallback")
+    return "rate_limited"
+
+
+def rate_limit_stats() -> dict:
+    """Bucket sizes, queue depth per priority class and queue wait times."""
+    return _limiter.stats()
+
+
+# ── Structured output ──────────────────────────────────────────────────────
+# ── Response schemas ───────────────────────────────────────────────────────
+STRUCTURED_OUTPUT = os.getenv("GEMINI_STRUCTURED_OUTPUT", "true").lower() == "true"
+TRIAGE_SCHEMA_DESC = schemas.describe(schemas.TRIAGE)
+
+ALLOWED_URGENCY = set(schemas.URGENCY_LEVELS)
 MEDICINE_KEYWORDS = [
     "paracetamol", "ibuprofen", "aspirin", "antibiotic", "metformin",
     "insulin", "steroid", "tablet", "capsule", "dosage", "mg ", "ml ",
@@ -100,6 +356,12 @@ def _init():
         logger.info("[Gemini] USE_LLM=false — disabled.")
         _enabled = False
         return
+    if provider == "stub":
+        from gemini_stub import StubClient
+        _client = StubClient()
+        _enabled = True
+        logger.info("[Gemini] Using the offline stub (LLM_PROVIDER=stub)")
+        return
     if provider != "gemini":
         logger.info(f"[Gemini] Provider '{provider}' — skipping Gemini init.")
         _enabled = False
@@ -124,95 +386,389 @@ def _init():
 _init()
 
 
-def is_enabled() -> bool:
+def is_configured() -> bool:
+    """Gemini is set up (USE_LLM, provider, key, SDK) — regardless of circuit state."""
     return _enabled and _client is not None
 
 
+def is_enabled() -> bool:
+    """Gemini is configured and the circuit lets calls through right now.
+    Callers that get False should go straight to their local fallback."""
+    return is_configured() and _breaker.can_attempt()
+
+
 def _is_quota_error(e: Exception) -> bool:
     msg = str(e).lower()
     return "429" in msg or "quota" in msg or "resource_exhausted" in msg
 
 
-def call_gemini(prompt: str, timeout: int = 20) -> str | None:
-    """Call Gemini with a plain prompt. Returns text or None."""
-    if not is_enabled():
+def _request_config(timeout: float | None = None, schema: dict | None = None, system: bool = False):
+    """Per-request config: the SDK enforces the timeout on the HTTP call itself;
+    a schema switches on JSON mode constrained to it; `system` sends the system
+    prompt as the system instruction."""
+    from google.genai import types
+    options = {}
+    if timeout is not None:
+        options["http_options"] = types.HttpOptions(timeout=int(timeout * 1000))
+    if system:
+        options["system_instruction"] = prompts.SYSTEM_PROMPT
+    if schema is not None:
+        options.update(response_mime_type="application/json", response_schema=schema)
+    return types.GenerateContentConfig(**options) if options else None
+
+
+def _response_schema(schema: dict | None) -> dict | None:
+    return schema if STRUCTURED_OUTPUT else None
+
+
+def schema_prompt(schema: dict, lead: str = "JSON schema:") -> str:
+    """Schema text for a prompt template's {schema} slot — empty in structured-output
+    mode, where the schema is sent as the response schema instead."""
+    if STRUCTURED_OUTPUT:
+        return ""
+    return f"{lead}\n{schemas.describe(schema)}\n\n"
+
+
+def _log_failure(where: str, e: Exception) -> None:
+    if _is_quota_error(e):
+        logger.warning("[Gemini] 429 quota exceeded")
+    else:
+        logger.warning(f"[Gemini] {where} failed: {type(e).__name__}: {str(e)[:120]}")
+
+
+def _record_failure(e: Exception, budget_limited: bool = False) -> None:
+    """Feed a failed call into the circuit breaker. A timeout that only happened
+    because the request's deadline shortened the call says nothing about Gemini."""
+    if _is_quota_error(e):
+        _breaker.record_failure("quota", retry_after_seconds(e))
+    elif isinstance(e, TimeoutError) or "timeout" in type(e).__name__.lower():
+        if budget_limited:
+            _breaker.release()
+            return
+        _breaker.record_failure("timeout")
+    else:
+        _breaker.record_failure("error")
+    if _breaker.state == OPEN:
+        logger.warning(f"[Gemini] Circuit open ({_breaker.stats()['reason']}) — using local fallback")
+
+
+# ── Streaming ──────────────────────────────────────────────────────────────
+FieldCallback = Callable[[str, object], None]
+
+
+class _Streamed:
+    """What callers read from a response (text, usage), assembled from a stream."""
+
+    def __init__(self, text: str, usage_metadata):
+        self.text = text
+        self.usage_metadata = usage_metadata
+
+
+def _feed_stream(fields: FieldStream, chunk, parts: list, on_field: FieldCallback) -> None:
+    text = getattr(chunk, "text", None) or ""
+    parts.append(text)
+    for key, value in fields.feed(text):
+        try:
+            on_field(key, value)
+        except Exception as e:
+            logger.warning(f"[Gemini] Stream field callback failed: {type(e).__name__}: {e}")
+
+
+def _collect_stream(chunks, on_field: FieldCallback) -> _Streamed:
+    fields, parts, usage = FieldStream(), [], None
+    for chunk in chunks:
+        _feed_stream(fields, chunk, parts, on_field)
+        usage = getattr(chunk, "usage_metadata", None) or usage
+    return _Streamed("".join(parts), usage)
+
+
+async def _acollect_stream(chunks, on_field: FieldCallback) -> _Streamed:
+    fields, parts, usage = FieldStream(), [], None
+    async for chunk in chunks:
+        _feed_stream(fields, chunk, parts, on_field)
+        usage = getattr(chunk, "usage_metadata", None) or usage
+    return _Streamed("".join(parts), usage)
+
+
+def call_gemini(prompt: str, timeout: int = 20, deadline: Deadline | None = None,
+                site: PromptSite | None = None, inputs: tuple = ()) -> str | None:
+    """Call Gemini with a plain prompt. Returns text or None.
+    With a `site`, replies are cached under (site, inputs)."""
+    key = site.key(inputs) if site else None
+    cached = site.get(key) if site else None
+    if cached is not None:
+        return cached
+    try:
+        text = _call_gemini(prompt, timeout, deadline, _site_name(site))
+    except RateLimited as e:
+        _rate_limited(e)
         return None
+    if site:
+        site.set(key, text)
+    return text
+
+
+async def acall_gemini(prompt: str, timeout: int = 20, deadline: Deadline | None = None,
+                       site: PromptSite | None = None, inputs: tuple = ()) -> str | None:
+    """Async call_gemini. On timeout the request is cancelled, not left running."""
+    key = site.key(inputs) if site else None
+    cached = site.get(key) if site else None
+    if cached is not None:
+        return cached
     try:
-        import concurrent.futures
-        full_prompt = f"{SYSTEM_PROMPT}\n\n{prompt}"
-
-        def _call():
-            response = _client.models.generate_content(
-                model=_model_name,
-                contents=full_prompt,
-            )
-            return response.text
-
-        with concurrent.futures.ThreadPoolExecutor(max_workers=1) as ex:
-            text = ex.submit(_call).result(timeout=timeout)
-        return text.strip() if text else None
-    except Exception as e:
-        if _is_quota_error(e):
-            logger.warning("[Gemini] 429 quota exceeded")
-        else:
-            logger.warning(f"[Gemini] call_gemini failed: {type(e).__name__}: {str(e)[:120]}")
+        text = await _acall_gemini(prompt, timeout, deadline, _site_name(site))
+    except RateLimited as e:
+        _rate_limited(e)
         return None
+    if site:
+        site.set(key, text)
+    return text
 
 
-def call_gemini_json(prompt: str, timeout: int = 20) -> dict | None:
-    """Call Gemini expecting JSON. Strips markdown fences. Returns dict or None."""
-    raw = call_gemini(prompt, timeout=timeout)
-    if raw is None:
+def _site_name(site: "PromptSite | None") -> str:
+    return site.name if site else "general"
+
+
+def _call_gemini(prompt: str, timeout: int, deadline: Deadline | None, site_name: str = "general",
+                 schema: dict | None = None, on_field: FieldCallback | None = None) -> str | None:
+    """One Gemini call (JSON mode if a response schema is given). `site_name` picks
+    the prompts.py entry (system instruction, token estimate) and the priority class.
+    With `on_field` the reply is streamed and each top-level JSON field is passed
+    to it as soon as it is complete; the full text is still returned at the end.
+    Raises RateLimited if no quota frees up within the call's budget."""
+    call_timeout = _call_timeout(timeout, deadline)
+    if call_timeout is None:
+        logger.warning("[Gemini] call_gemini skipped — request deadline reached")
+        return None
+    if not is_configured() or not _breaker.can_attempt():
         return None
-    return _parse_json(raw)
+    spec = prompts.get(site_name)
+    tokens = spec.estimate_tokens(prompt)
+    _admission.call_started()
+    try:
+        waited = _limiter.acquire(site_name, tokens, max(0.0, call_timeout - MIN_CALL_SECONDS))
+        _admission.record_wait(waited)
+        call_timeout -= waited
+        if not _breaker.allow():
+            _limiter.refund(tokens)
+            return None
+        try:
+            request = dict(model=_model_name, contents=prompt,
+                           config=_request_config(call_timeout, schema, spec.system))
+            if on_field is None:
+                response = _client.models.generate_content(**request)
+            else:
+                response = _collect_stream(_client.models.generate_content_stream(**request), on_field)
+            _breaker.record_success()
+            _limiter.settle(tokens, _tokens_used(response))
+            _record_tokens(spec, prompt, response)
+            text = response.text
+            return text.strip() if text else None
+        except Exception as e:
+            _log_failure("call_gemini", e)
+            _record_failure(e, budget_limited=call_timeout < timeout)
+            return None
+    finally:
+        _admission.call_finished()
 
 
-def _parse_json(raw: str) -> dict | None:
+async def _acall_gemini(prompt: str, timeout: int, deadline: Deadline | None,
+                        site_name: str = "general", schema: dict | None = None,
+                        on_field: FieldCallback | None = None) -> str | None:
+    """Async _call_gemini; waits for quota without blocking the event loop."""
+    call_timeout = _call_timeout(timeout, deadline)
+    if call_timeout is None:
+        logger.warning("[Gemini] acall_gemini skipped — request deadline reached")
+        return None
+    if not is_configured() or not _breaker.can_attempt():
+        return None
+    spec = prompts.get(site_name)
+    tokens = spec.estimate_tokens(prompt)
+    _admission.call_started()
+    try:
+        waited = await _limiter.aacquire(site_name, tokens, max(0.0, call_timeout - MIN_CALL_SECONDS))
+        call_timeout -= waited
+        if not _breaker.allow():
+            _limiter.refund(tokens)
+            return None
+
+        async def _call():
+            queued = time.monotonic()
+            async with _async_limit():
+                _admission.record_wait(waited + time.monotonic() - queued)
+                request = dict(model=_model_name, contents=prompt,
+                               config=_request_config(schema=schema, system=spec.system))
+                if on_field is None:
+                    return await _client.aio.models.generate_content(**request)
+                return await _acollect_stream(await _client.aio.models.generate_content_stream(**request), on_field)
+
+        try:
+            response = await asyncio.wait_for(_call(), timeout=call_timeout)
+            _breaker.record_success()
+            _limiter.settle(tokens, _tokens_used(response))
+            _record_tokens(spec, prompt, response)
+            text = response.text
+            return text.strip() if text else None
+        except asyncio.TimeoutError as e:
+            logger.warning(f"[Gemini] acall_gemini timed out after {call_timeout:.1f}s")
+            _record_failure(e, budget_limited=call_timeout < timeout)
+            return None
+        except asyncio.CancelledError:
+            _breaker.release()  # caller went away — no verdict on Gemini's health
+            raise
+        except Exception as e:
+            _log_failure("acall_gemini", e)
+            _record_failure(e, budget_limited=call_timeout < timeout)
+            return None
+    finally:
+        _admission.call_finished()
+
+
+def call_gemini_json(prompt: str, timeout: int = 20, deadline: Deadline | None = None,
+                     site: PromptSite | None = None, inputs: tuple = (),
+                     schema: dict | None = None) -> dict | None:
+    """Call Gemini expecting JSON. Returns dict or None.
+    The response schema is `schema`, else the site's (structured-output mode).
+    Identical prompts already in flight share one Gemini call.
+    With a `site`, parsed replies are cached under (site, inputs)."""
+    cache_key = site.key(inputs) if site else None
+    cached = site.get(cache_key) if site else None
+    if cached is not None:
+        return cached
+    key = _prompt_key(prompt)
+    if _failures.get(key) is not None:
+        return None
+    response_schema = _response_schema(schema or (site.schema if site else None))
+
+    def _call():
+        raw = _call_gemini(prompt, timeout, deadline, _site_name(site), response_schema)
+        return _parse_json(raw) if raw is not None else None
+
     try:
-        text = raw.strip()
-        if text.startswith("```"):
-            lines = [l for l in text.split("\n") if not l.strip().startswith("```")]
-            text = "\n".join(lines).strip()
-        # Find first { to last }
-        start = text.find("{")
-        end = text.rfind("}") + 1
-        if start >= 0 and end > start:
-            text = text[start:end]
-        return json.loads(text)
-    except (json.JSONDecodeError, ValueError) as e:
-        logger.warning(f"[Gemini] JSON parse failed: {e} — raw[:200]: {raw[:200]}")
+        data, leader = _json_flights.do(key, _call, timeout=_wait_budget(deadline))
+    except TimeoutError:
+        return None
+    except RateLimited as e:
+        _rate_limited(e)
         return None
+    if leader and data is None:
+        _note_failure(key, deadline=deadline)
+    if leader and site:
+        site.set(cache_key, data)
+    return data if leader else copy.deepcopy(data)
+
+
+async def acall_gemini_json(prompt: str, timeout: int = 20, deadline: Deadline | None = None,
+                            site: PromptSite | None = None, inputs: tuple = (),
+                            schema: dict | None = None) -> dict | None:
+    """Async call_gemini_json."""
+    cache_key = site.key(inputs) if site else None
+    cached = site.get(cache_key) if site else None
+    if cached is not None:
+        return cached
+    key = _prompt_key(prompt)
+    if _failures.get(key) is not None:
+        return None
+    response_schema = _response_schema(schema or (site.schema if site else None))
+
+    async def _call():
+        raw = await _acall_gemini(prompt, timeout, deadline, _site_name(site), response_schema)
+        return _parse_json(raw) if raw is not None else None
+
+    try:
+        data, leader = await _json_flights.ado(key, _call, timeout=_wait_budget(deadline))
+    except asyncio.TimeoutError:
+        return None
+    except RateLimited as e:
+        _rate_limited(e)
+        return None
+    if leader and data is None:
+        _note_failure(key, deadline=deadline)
+    if leader and site:
+        site.set(cache_key, data)
+    return data if leader else copy.deepcopy(data)
+
+
+def _prompt_key(prompt: str) -> str:
+    return hashlib.sha256(prompt.encode()).hexdigest()
+
+
+def _note_failure(key: str, code: str = "failed", deadline: Deadline | None = None) -> None:
+    """Remember a failed call for NEGATIVE_TTL — unless the circuit refused it or
+    the request ran out of budget: then Gemini never got a fair try, and the next
+    request may retry it."""
+    if code in _DEADLINE_CODES or (deadline is not None and not deadline.allows()):
+        return
+    if _breaker.can_attempt():
+        _failures.set(key, code)
+
+
+def _parse_json(raw: str) -> dict | None:
+    """The JSON object in a reply — strict parse, else local salvage (json_repair)."""
+    data, repaired = _salvage_json(raw)
+    if data is None:
+        _count_parse("unparseable")
+        logger.warning(f"[Gemini] JSON parse failed — raw[:200]: {raw[:200]}")
+        return None
+    if repaired:
+        _count_parse("salvaged")
+        logger.info("[Gemini] Malformed JSON repaired locally")
+    return data
+
+
+# ── Parse / repair metrics ─────────────────────────────────────────────────
+_parse_lock = threading.Lock()
+_parse_counts = {"salvaged": 0, "unparseable": 0, "triageReplies": 0, "coerced": 0, "repairRoundTrips": 0}
+
+
+def _count_parse(field: str) -> None:
+    with _parse_lock:
+        _parse_counts[field] += 1
+
+
+def parse_stats() -> dict:
+    """Locally salvaged / unparseable replies, coerced triage replies, and the
+    fraction of triage calls that still needed a repair round trip."""
+    with _parse_lock:
+        counts = dict(_parse_counts)
+    triage = counts["triageReplies"]
+    return {**counts, "repairRate": round(counts["repairRoundTrips"] / triage, 4) if triage else 0.0}
 
 
 # ── Triage-specific Gemini call with validation + retry ───────────────────
 
-TRIAGE_PROMPT_TEMPLATE = """Patient message (language: {language}):
-\"{text}\"
+# With GEMINI_STREAM_TRIAGE the triage reply is streamed: urgency_level (second in
+# the schema) reaches the caller's on_urgency before the rest of the JSON arrives.
+# Only the complete, validated reply is cached.
+STREAM_TRIAGE = os.getenv("GEMINI_STREAM_TRIAGE", "true").lower() == "true"
+UrgencyCallback = Callable[[str], None]
 
-Return ONLY valid JSON matching this exact schema — no markdown, no extra text:
-{schema}
 
-Rules:
-- urgency_level must be exactly one of: low, moderate, urgent, emergency
-- recommended_next_steps: 2-5 items, NO medicine names
-- warning_signs: 3-5 items
-- clarifying_question: one question string if symptoms are vague, else null
-- disclaimer: always include "This is not a medical diagnosis. If symptoms worsen or you feel unsafe, seek professional care."
-"""
+def _urgency_watcher(on_urgency: UrgencyCallback | None) -> FieldCallback | None:
+    """Stream field callback passing a recognisable urgency_level to on_urgency."""
+    if on_urgency is None or not STREAM_TRIAGE:
+        return None
 
-REPAIR_PROMPT_TEMPLATE = """Your previous response was not valid JSON or had schema errors.
-Return ONLY valid JSON strictly following this schema — no markdown, no explanation:
-{schema}
+    def on_field(key: str, value) -> None:
+        level = str(value).lower().strip() if key == "urgency_level" else ""
+        level = URGENCY_SYNONYMS.get(level, level)
+        if level in ALLOWED_URGENCY:
+            on_urgency(level)
 
-Original patient message: \"{text}\"
-"""
+    return on_field
 
 
-def call_triage(text: str, language: str = "en", request_id: str = "") -> tuple[dict | None, bool, str | None]:
+def call_triage(text: str, language: str = "en", request_id: str = "",
+                deadline: Deadline | None = None,
+                on_urgency: UrgencyCallback | None = None) -> tuple[dict | None, bool, str | None]:
     """
     Call Gemini for triage. Returns (result_dict, from_cache, error_code).
-    Validates schema. Retries once with repair prompt if invalid.
+    Validates schema. Retries once with repair prompt if invalid and the
+    deadline leaves room for it.
     Returns (None, False, error_code) on total failure.
+    Concurrent calls for the same (message, language) share one Gemini round.
+    on_urgency(level) is called with the streamed urgency_level, before the reply
+    is complete (and before validation); coalesced callers don't get it.
     """
     # Cache check
     cached = cache_get(text, language)
@@ -220,75 +776,248 @@ def call_triage(text: str, language: str = "en", request_id: str = "") -> tuple[
         logger.info(f"[Gemini][{request_id}] Cache hit")
         return cached, True, None
 
-    if not is_enabled():
+    if not is_configured():
         return None, False, "gemini_disabled"
+    blocked = _triage_blocked(text, language, request_id, deadline)
+    if blocked:
+        return None, False, blocked
+
+    key = _cache_key(text, language)
+    try:
+        result, leader = _triage_flights.do(
+            key, lambda: _call_triage_uncached(text, language, request_id, deadline, on_urgency),
+            timeout=_wait_budget(deadline),
+        )
+    except TimeoutError:
+        return None, False, "deadline_exceeded"
+    if not leader:
+        logger.info(f"[Gemini][{request_id}] Coalesced with in-flight triage")
+        result = copy.deepcopy(result)
+    elif result[0] is None:
+        _note_failure(key, result[2])
+    return result
+
+
+async def acall_triage(text: str, language: str = "en", request_id: str = "",
+                       deadline: Deadline | None = None,
+                       on_urgency: UrgencyCallback | None = None) -> tuple[dict | None, bool, str | None]:
+    """Async call_triage — same cache, coalescing, validation and repair retry."""
+    cached = cache_get(text, language)
+    if cached:
+        logger.info(f"[Gemini][{request_id}] Cache hit")
+        return cached, True, None
+
+    if not is_configured():
+        return None, False, "gemini_disabled"
+    blocked = _triage_blocked(text, language, request_id, deadline)
+    if blocked:
+        return None, False, blocked
+
+    key = _cache_key(text, language)
+    try:
+        result, leader = await _triage_flights.ado(
+            key, lambda: _acall_triage_uncached(text, language, request_id, deadline, on_urgency),
+            timeout=_wait_budget(deadline),
+        )
+    except asyncio.TimeoutError:
+        return None, False, "deadline_exceeded"
+    if not leader:
+        logger.info(f"[Gemini][{request_id}] Coalesced with in-flight triage")
+        result = copy.deepcopy(result)
+    elif result[0] is None:
+        _note_failure(key, result[2])
+    return result
+
+
+def _triage_blocked(text: str, language: str, request_id: str, deadline: Deadline | None) -> str | None:
+    """Error code if this triage should not reach Gemini right now, else None."""
+    if deadline is not None and not deadline.allows():
+        logger.info(f"[Gemini][{request_id}] Deadline reached — skipping Gemini")
+        return "deadline_exceeded"
+    if not _breaker.can_attempt():
+        logger.info(f"[Gemini][{request_id}] Circuit {_breaker.state} — skipping Gemini")
+        return "circuit_open"
+    if _failures.get(_cache_key(text, language)) is not None:
+        logger.info(f"[Gemini][{request_id}] Same message failed recently — skipping Gemini")
+        return "recent_failure"
+    return None
 
-    prompt = TRIAGE_PROMPT_TEMPLATE.format(
-        text=text,
-        language=language,
-        schema=TRIAGE_SCHEMA_DESC,
-    )
 
+def _call_triage_uncached(text: str, language: str, request_id: str, deadline: Deadline | None,
+                          on_urgency: UrgencyCallback | None = None) -> tuple[dict | None, bool, str | None]:
+    on_field = _urgency_watcher(on_urgency)
     # Attempt 1
-    raw = call_gemini(prompt, timeout=25)
+    try:
+        raw = _call_gemini(_triage_prompt(text, language), 25, deadline, "triage",
+                           _response_schema(schemas.TRIAGE), on_field)
+    except RateLimited as e:
+        return None, False, _rate_limited(e)
     if raw is None:
-        return None, False, "gemini_failed"
+        return None, False, _call_failure_code("gemini_failed", deadline)
+    data = _accept_triage(raw, text, language, request_id, repair=False)
+    if data is not None:
+        return data, False, None
 
-    data = _parse_json(raw)
-    valid, issues = _validate_triage_schema(data)
+    # Attempt 2 — repair, only if the budget can cover another round
+    if not _repair_fits(deadline, request_id):
+        return None, False, "repair_skipped_deadline"
+    try:
+        raw2 = _call_gemini(_repair_prompt(text), 25, deadline, "repair",
+                            _response_schema(schemas.TRIAGE), on_field)
+    except RateLimited as e:
+        return None, False, _rate_limited(e)
+    if raw2 is None:
+        return None, False, _call_failure_code("gemini_repair_failed", deadline)
+    data2 = _accept_triage(raw2, text, language, request_id, repair=True)
+    if data2 is not None:
+        return data2, False, None
+    return None, False, "validation_failed"
 
-    if valid:
-        cache_set(text, language, data)
+
+async def _acall_triage_uncached(text: str, language: str, request_id: str, deadline: Deadline | None,
+                                 on_urgency: UrgencyCallback | None = None) -> tuple[dict | None, bool, str | None]:
+    on_field = _urgency_watcher(on_urgency)
+    try:
+        raw = await _acall_gemini(_triage_prompt(text, language), 25, deadline, "triage",
+                                  _response_schema(schemas.TRIAGE), on_field)
+    except RateLimited as e:
+        return None, False, _rate_limited(e)
+    if raw is None:
+        return None, False, _call_failure_code("gemini_failed", deadline)
+    data = _accept_triage(raw, text, language, request_id, repair=False)
+    if data is not None:
         return data, False, None
 
-    logger.warning(f"[Gemini][{request_id}] Validation failed: {issues} — retrying with repair prompt")
+    if not _repair_fits(deadline, request_id):
+        return None, False, "repair_skipped_deadline"
+    try:
+        raw2 = await _acall_gemini(_repair_prompt(text), 25, deadline, "repair",
+                                   _response_schema(schemas.TRIAGE), on_field)
+    except RateLimited as e:
+        return None, False, _rate_limited(e)
+    if raw2 is None:
+        return None, False, _call_failure_code("gemini_repair_failed", deadline)
+    data2 = _accept_triage(raw2, text, language, request_id, repair=True)
+    if data2 is not None:
+        return data2, False, None
+    return None, False, "validation_failed"
+
+
+def _call_failure_code(default: str, deadline: Deadline | None) -> str:
+    """Error code for a call that returned None — "circuit_open" if the breaker
+    refused or tripped, "deadline_exceeded" if the request ran out of budget."""
+    if not _breaker.can_attempt():
+        return "circuit_open"
+    if deadline is not None and not deadline.allows():
+        return "deadline_exceeded"
+    return default
+
+
+def _repair_fits(deadline: Deadline | None, request_id: str) -> bool:
+    if deadline is None or deadline.allows(MIN_REPAIR_SECONDS):
+        return True
+    logger.warning(f"[Gemini][{request_id}] {deadline.remaining():.1f}s left — skipping repair retry")
+    return False
+
+
+_TRIAGE_VERSION = None
+
 
-    # Attempt 2 — repair
-    repair_prompt = REPAIR_PROMPT_TEMPLATE.format(
-        schema=TRIAGE_SCHEMA_DESC,
+def _triage_version() -> str:
+    """Rules version + a hash of the prompts that shape a triage answer."""
+    global _TRIAGE_VERSION
+    if _TRIAGE_VERSION is None:
+        from triage_rules import RULES
+        shape = (f"{prompts.SYSTEM_PROMPT}|{prompts.TRIAGE.template}|{prompts.REPAIR.template}|"
+                 f"{TRIAGE_SCHEMA_DESC}|{STRUCTURED_OUTPUT}")
+        _TRIAGE_VERSION = f"{RULES.get('version', '0')}:{hashlib.sha256(shape.encode()).hexdigest()[:12]}"
+    return _TRIAGE_VERSION
+
+
+def _triage_prompt(text: str, language: str) -> str:
+    return prompts.TRIAGE.render(
         text=text,
+        language=language,
+        schema=schema_prompt(schemas.TRIAGE, "Return ONLY valid JSON matching this exact schema — "
+                                             "no markdown, no extra text:"),
     )
-    raw2 = call_gemini(repair_prompt, timeout=25)
-    if raw2 is None:
-        return None, False, "gemini_repair_failed"
 
-    data2 = _parse_json(raw2)
-    valid2, issues2 = _validate_triage_schema(data2)
 
-    if valid2:
-        cache_set(text, language, data2)
-        return data2, False, None
+def _repair_prompt(text: str) -> str:
+    return prompts.REPAIR.render(
+        schema=schema_prompt(schemas.TRIAGE, "Return ONLY valid JSON strictly following this schema — "
+                                             "no markdown, no explanation:"),
+        text=text,
+    )
 
-    logger.warning(f"[Gemini][{request_id}] Repair also invalid: {issues2}")
-    return None, False, "validation_failed"
+
+def _accept_triage(raw: str, text: str, language: str, request_id: str, repair: bool) -> dict | None:
+    """Parse + coerce + validate a triage reply. Caches and returns it if valid, else None."""
+    _count_parse("repairRoundTrips" if repair else "triageReplies")
+    data = _coerce_triage(_parse_json(raw))
+    valid, issues = _validate_triage_schema(data)
+    if valid:
+        cache_set(text, language, data)
+        return data
+    if repair:
+        logger.warning(f"[Gemini][{request_id}] Repair also invalid: {issues}")
+    else:
+        logger.warning(f"[Gemini][{request_id}] Validation failed: {issues} — retrying with repair prompt")
+    return None
 
 
-def _validate_triage_schema(data: dict | None) -> tuple[bool, list[str]]:
-    """Validate triage response schema. Returns (is_valid, list_of_issues)."""
-    if not isinstance(data, dict):
-        return False, ["not a dict"]
+# Near-miss urgency labels → the allowed value they mean. Never maps downwards
+# from anything that could mean urgent.
+URGENCY_SYNONYMS = {
+    "mild": "low", "minor": "low", "routine": "low", "non-urgent": "low", "non urgent": "low",
+    "medium": "moderate", "mid": "moderate", "intermediate": "moderate",
+    "high": "urgent", "severe": "urgent", "serious": "urgent",
+    "critical": "emergency", "immediate": "emergency", "life-threatening": "emergency",
+    "life threatening": "emergency",
+}
+MAX_LIST_ITEMS = schemas.TRIAGE["properties"]["recommended_next_steps"]["max_items"]
+DEFAULT_DISCLAIMER = "This is not a medical diagnosis. If symptoms worsen or you feel unsafe, seek professional care."
 
-    issues = []
-    required = ["symptom_summary", "urgency_level", "urgency_reason",
-                "recommended_next_steps", "warning_signs", "disclaimer"]
-    for key in required:
-        if key not in data:
-            issues.append(f"missing key: {key}")
 
-    if issues:
-        return False, issues
+def _coerce_triage(data: dict | None) -> dict | None:
+    """Fix near-miss schema issues in place: urgency case / synonyms, a string where
+    a list belongs, over-long lists, a missing disclaimer. Items are only trimmed
+    if none of the dropped ones mention a medicine, so the medicine check in
+    _validate_triage_schema still sees everything it would have."""
+    if not isinstance(data, dict):
+        return data
+    before = json.dumps(data, sort_keys=True, ensure_ascii=False)
 
     ul = str(data.get("urgency_level", "")).lower().strip()
-    if ul not in ALLOWED_URGENCY:
-        issues.append(f"invalid urgency_level: {ul}")
+    if ul in ALLOWED_URGENCY or ul in URGENCY_SYNONYMS:
+        data["urgency_level"] = URGENCY_SYNONYMS.get(ul, ul)
 
-    steps = data.get("recommended_next_steps", [])
-    if not isinstance(steps, list) or not (2 <= len(steps) <= 6):
-        issues.append(f"recommended_next_steps must be list of 2-6 items, got {len(steps) if isinstance(steps, list) else type(steps)}")
+    for key in ("recommended_next_steps", "warning_signs"):
+        items = data.get(key)
+        if isinstance(items, str):
+            items = [p.strip(" -•*\t") for p in re.split(r"\n|;", items)]
+        if isinstance(items, list):
+            items = [str(item).strip() for item in items if isinstance(item, (str, int, float)) and str(item).strip()]
+            dropped = " ".join(items[MAX_LIST_ITEMS:]).lower()
+            if not any(kw in dropped for kw in MEDICINE_KEYWORDS):
+                items = items[:MAX_LIST_ITEMS]
+            data[key] = items
 
-    warns = data.get("warning_signs", [])
-    if not isinstance(warns, list) or not (2 <= len(warns) <= 6):
-        issues.append(f"warning_signs must be list of 2-6 items")
+    if not data.get("disclaimer"):
+        data["disclaimer"] = DEFAULT_DISCLAIMER
+
+    if json.dumps(data, sort_keys=True, ensure_ascii=False) != before:
+        _count_parse("coerced")
+    return data
+
+
+def _validate_triage_schema(data: dict | None) -> tuple[bool, list[str]]:
+    """Validate a triage reply against schemas.TRIAGE plus the medicine-keyword
+    filter. Returns (is_valid, list_of_issues)."""
+    issues = schemas.check(schemas.TRIAGE, data)
+    if not isinstance(data, dict) or any(issue.startswith("missing key") for issue in issues):
+        return False, issues
+    steps = data.get("recommended_next_steps", [])
 
     # Medicine keyword filter
     all_text = " ".join([
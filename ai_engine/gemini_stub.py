@@ -0,0 +1,130 @@
+"""
+Offline stand-in for the Gemini client (LLM_PROVIDER=stub).
+
+Answers like the SDK in structured-output mode: a call with a response schema
+gets a minimal schema-conforming JSON reply (schemas.example), any other call a
+short plain-text reply. No network, no key, instant — for local development
+and for checking the structured-output path offline:
+
+    python gemini_stub.py
+
+runs every JSON call type (triage, intent, analyze, extract, scope) through
+gemini_client against the stub and checks that each request carried its
+response schema, that no prompt pasted the schema text, that every reply
+parsed and validated without a repair round trip, and that the streamed
+triage handed over its urgency_level.
+"""
+
+import json
+import threading
+import types
+
+import schemas
+
+
+class _Usage:
+    def __init__(self, prompt: str, text: str):
+        self.prompt_token_count = len(prompt) // 4
+        self.candidates_token_count = len(text) // 4
+        self.total_token_count = self.prompt_token_count + self.candidates_token_count
+
+
+class _Response:
+    def __init__(self, prompt: str, text: str):
+        self.text = text
+        self.usage_metadata = _Usage(prompt, text)
+
+
+class StubClient:
+    """Drop-in for google.genai.Client: generate_content / generate_content_stream
+    on .models and .aio.models."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = []    # (contents, response schema or None)
+        self.models = types.SimpleNamespace(generate_content=self._generate, generate_content_stream=self._stream)
+        self.aio = types.SimpleNamespace(models=types.SimpleNamespace(
+            generate_content=self._agenerate, generate_content_stream=self._astream))
+
+    def _generate(self, model: str, contents, config=None) -> _Response:
+        schema = getattr(config, "response_schema", None)
+        system = getattr(config, "system_instruction", None) or ""
+        with self._lock:
+            self.requests.append((str(contents), schema))
+        text = json.dumps(schemas.example(schema)) if schema else "Please rest, drink fluids and visit your nearest PHC."
+        return _Response(f"{system}{contents}", text)
+
+    async def _agenerate(self, model: str, contents, config=None) -> _Response:
+        return self._generate(model, contents, config)
+
+    def _stream(self, model: str, contents, config=None):
+        """The reply in chunks of 16 characters; usage on the last one."""
+        response = self._generate(model, contents, config)
+        text = response.text
+        for i in range(0, len(text), 16):
+            chunk = _Response("", text[i:i + 16])
+            chunk.usage_metadata = response.usage_metadata if i + 16 >= len(text) else None
+            yield chunk
+
+    async def _astream(self, model: str, contents, config=None):
+        async def chunks():
+            for chunk in self._stream(model, contents, config):
+                yield chunk
+        return chunks()
+
+
+if __name__ == "__main__":
+    import asyncio
+    import os
+    import sys
+
+    os.environ["LLM_PROVIDER"] = "stub"
+    os.environ["GEMINI_STRUCTURED_OUTPUT"] = "true"
+    import gemini_client
+    from intent_gate import aanalyze_with_gemini, aclassify_intent_with_gemini
+    from nlp_extractor import _aextract_with_gemini
+    import prompts
+    from app import _SCOPE_SITE
+
+    import gemini_stub    # the module gemini_client installed, not this __main__ copy
+    client = gemini_client._client
+    assert isinstance(client, gemini_stub.StubClient), "LLM_PROVIDER=stub did not install the stub"
+    text = "fever for two days and a bad cough"
+    streamed = []
+
+    async def _run() -> dict:
+        return {
+            "triage": await gemini_client.acall_triage(text, "en", on_urgency=streamed.append),
+            "intent": await aclassify_intent_with_gemini(text, "en"),
+            "analyze": await aanalyze_with_gemini(text, "en"),
+            "extract": await _aextract_with_gemini(text, "en"),
+            "scope": await gemini_client.acall_gemini_json(
+                prompts.SCOPE.render(text=text, schema=gemini_client.schema_prompt(schemas.SCOPE)),
+                site=_SCOPE_SITE, inputs=(text, "en")),
+        }
+
+    results = asyncio.run(_run())
+    failures = []
+    triage, _, error = results.pop("triage")
+    if triage is None:
+        failures.append(f"triage failed: {error}")
+    elif streamed != [triage["urgency_level"]]:
+        failures.append(f"streamed urgency {streamed} does not match the triage answer")
+    failures += [f"{name} returned nothing usable" for name, result in results.items() if result is None]
+    if len(client.requests) != 5:
+        failures.append(f"expected 5 Gemini requests, saw {len(client.requests)}")
+    for prompt, schema in client.requests:
+        if schema is None:
+            failures.append(f"request without a response schema: {prompt[-80:]!r}")
+        if '"properties"' in prompt or "JSON schema:" in prompt:
+            failures.append(f"schema text pasted into prompt: {prompt[-80:]!r}")
+    if prompts.SYSTEM_PROMPT in "".join(prompt for prompt, _ in client.requests):
+        failures.append("system prompt pasted into a prompt")
+    stats = gemini_client.parse_stats()
+    if stats["repairRoundTrips"] or stats["salvaged"]:
+        failures.append(f"unexpected repair / salvage: {stats}")
+
+    for line in failures:
+        print(f"FAIL {line}")
+    print(f"{len(client.requests)} structured requests, parsing {stats}")
+    sys.exit(1 if failures else 0)
@@ -1,11 +1,18 @@
 ﻿"""Intent Gate — Gemini primary, local regex fallback.
 Returns: SMALL_TALK | CLARIFICATION_REQUIRED | SYMPTOMS
 For SYMPTOMS: also returns structured extraction data (combined intent+extract in one call).
+analyze_with_gemini: scope + intent + extraction + reply in one call (/analyze).
 """
 
 import re
 import logging
 
+from deadline import Deadline
+from gemini_client import PromptSite, schema_prompt
+import prompts
+import schemas
+from text_normalizer import normalize_for_matching
+
 logger = logging.getLogger(__name__)
 
 GREETINGS = {
@@ -88,45 +95,15 @@ LANGUAGE_NAMES = {
     "en": "English", "hi": "Hindi", "mr": "Marathi", "ta": "Tamil", "te": "Telugu"
 }
 
-INTENT_PROMPT = """You are a health assistant for a rural triage system in India.
-Analyze the patient message and return ONLY valid JSON — no markdown, no explanation.
-
-STRICT RULES:
-- Do NOT diagnose any disease
-- Do NOT suggest medicines or treatments
-- Do NOT assign urgency or care level
-- Only classify intent and extract what the patient explicitly mentions
-
-JSON schema:
-{{
-  "intent": "SMALL_TALK or SYMPTOMS or CLARIFICATION_REQUIRED",
-  "reply": "friendly reply in {language_name} for SMALL_TALK or CLARIFICATION_REQUIRED, null for SYMPTOMS",
-  "primaryComplaint": "main symptom or unknown",
-  "duration": {{"value": number or null, "unit": "days or hours or weeks or unknown"}},
-  "severity": "mild or moderate or severe or unknown",
-  "associatedSymptoms": [],
-  "redFlagsDetected": [],
-  "confidence": 0.0 to 1.0,
-  "followUpQuestion": "one clarifying question or null"
-}}
-
-Intent rules:
-- SMALL_TALK: greetings, thanks, ok, bye, test, or NO health content
-- CLARIFICATION_REQUIRED: vague health complaint with no specific symptom
-- SYMPTOMS: contains at least one specific symptom (fever, cough, chest pain, etc.)
-
-For SMALL_TALK reply: warm, ask to describe symptoms. Language: {language_name}
-For CLARIFICATION_REQUIRED reply: ask ONE specific follow-up. Language: {language_name}
-For SYMPTOMS: reply must be null
+_INTENT_SITE = PromptSite("intent", prompts.INTENT.template, ttl=900, schema=schemas.INTENT)
 
-Patient language: {language}
-Patient message: {text}
+SCOPES = tuple(schemas.SCOPES)
 
-JSON only:"""
+_ANALYZE_SITE = PromptSite("analyze", prompts.ANALYZE.template, ttl=900, schema=schemas.ANALYZE)
 
 
 def _is_greeting(text: str, language: str) -> bool:
-    t = text.strip().lower()
+    t = normalize_for_matching(text)
     for pattern in GREETINGS["en"]:
         if re.search(pattern, t, re.IGNORECASE):
             return True
@@ -178,7 +155,7 @@ def classify_intent(text: str, language: str = "en") -> str:
     return "CLARIFICATION_REQUIRED"
 
 
-def classify_intent_with_gemini(text: str, language: str = "en") -> dict | None:
+def classify_intent_with_gemini(text: str, language: str = "en", deadline: Deadline | None = None) -> dict | None:
     """
     Gemini-powered combined intent detection + symptom extraction.
     Returns structured dict or None on failure.
@@ -187,66 +164,145 @@ def classify_intent_with_gemini(text: str, language: str = "en") -> dict | None:
         from gemini_client import is_enabled as gemini_enabled, call_gemini_json
         if not gemini_enabled():
             return None
+        data = call_gemini_json(_intent_prompt(text, language), timeout=20, deadline=deadline,
+                                site=_INTENT_SITE, inputs=(text, language))
+        return _normalize_intent_response(data, language)
+    except Exception as e:
+        logger.warning(f"[IntentGate] classify_intent_with_gemini failed: {type(e).__name__}: {str(e)[:120]}")
+        return None
+
 
-        prompt = INTENT_PROMPT.format(
-            text=text,
-            language=language,
-            language_name=LANGUAGE_NAMES.get(language, "English"),
-        )
-        data = call_gemini_json(prompt, timeout=20)
-        if data is None:
+async def aclassify_intent_with_gemini(text: str, language: str = "en", deadline: Deadline | None = None) -> dict | None:
+    """Async classify_intent_with_gemini."""
+    try:
+        from gemini_client import is_enabled as gemini_enabled, acall_gemini_json
+        if not gemini_enabled():
             return None
+        data = await acall_gemini_json(_intent_prompt(text, language), timeout=20, deadline=deadline,
+                                       site=_INTENT_SITE, inputs=(text, language))
+        return _normalize_intent_response(data, language)
+    except Exception as e:
+        logger.warning(f"[IntentGate] aclassify_intent_with_gemini failed: {type(e).__name__}: {str(e)[:120]}")
+        return None
+
 
-        if "intent" not in data:
-            logger.warning("[IntentGate] Gemini response missing 'intent' key")
+def analyze_with_gemini(text: str, language: str = "en", deadline: Deadline | None = None) -> dict | None:
+    """
+    Scope + intent + extraction + reply from one Gemini call, cached under one key.
+    Returns the classify_intent_with_gemini dict plus "scope", or None on failure.
+    """
+    try:
+        from gemini_client import is_enabled as gemini_enabled, call_gemini_json
+        if not gemini_enabled():
             return None
+        data = call_gemini_json(_analyze_prompt(text, language), timeout=20, deadline=deadline,
+                                site=_ANALYZE_SITE, inputs=(text, language))
+        return _normalize_analysis(data, language)
+    except Exception as e:
+        logger.warning(f"[IntentGate] analyze_with_gemini failed: {type(e).__name__}: {str(e)[:120]}")
+        return None
 
-        intent = data.get("intent", "CLARIFICATION_REQUIRED")
-        if intent not in ("SMALL_TALK", "SYMPTOMS", "CLARIFICATION_REQUIRED"):
-            intent = "CLARIFICATION_REQUIRED"
-
-        # Normalize duration
-        dur = data.get("duration", {})
-        if not isinstance(dur, dict):
-            dur = {"value": None, "unit": "unknown"}
-        if dur.get("unit") == "weeks" and dur.get("value"):
-            dur = {"value": dur["value"] * 7, "unit": "days"}
-        elif dur.get("unit") == "hours" and dur.get("value"):
-            dur = {"value": max(1, dur["value"] // 24), "unit": "days"}
-
-        # Safety check on Gemini reply for non-SYMPTOMS
-        reply = data.get("reply")
-        if reply and intent != "SYMPTOMS":
-            from safety import check_safety
-            safety_result = check_safety(reply, language)
-            if not safety_result["safe"]:
-                logger.warning("[IntentGate] Gemini reply failed safety — using template")
-                reply = (SMALL_TALK_REPLIES if intent == "SMALL_TALK" else CLARIFICATION_REPLIES).get(
-                    language,
-                    (SMALL_TALK_REPLIES if intent == "SMALL_TALK" else CLARIFICATION_REPLIES)["en"]
-                )
-
-        if intent == "SYMPTOMS":
-            reply = None
-
-        return {
-            "intent": intent,
-            "reply": reply,
-            "primaryComplaint": data.get("primaryComplaint", "unknown") or "unknown",
-            "duration": dur,
-            "severity": data.get("severity", "unknown") or "unknown",
-            "associatedSymptoms": data.get("associatedSymptoms", []) or [],
-            "redFlagsDetected": data.get("redFlagsDetected", []) or [],
-            "confidence": float(data.get("confidence", 0.8)),
-            "followUpQuestion": data.get("followUpQuestion"),
-            "llmUsed": True,
-        }
 
+async def aanalyze_with_gemini(text: str, language: str = "en", deadline: Deadline | None = None) -> dict | None:
+    """Async analyze_with_gemini."""
+    try:
+        from gemini_client import is_enabled as gemini_enabled, acall_gemini_json
+        if not gemini_enabled():
+            return None
+        data = await acall_gemini_json(_analyze_prompt(text, language), timeout=20, deadline=deadline,
+                                       site=_ANALYZE_SITE, inputs=(text, language))
+        return _normalize_analysis(data, language)
     except Exception as e:
-        logger.warning(f"[IntentGate] classify_intent_with_gemini failed: {type(e).__name__}: {str(e)[:120]}")
+        logger.warning(f"[IntentGate] aanalyze_with_gemini failed: {type(e).__name__}: {str(e)[:120]}")
         return None
 
 
+def _analyze_prompt(text: str, language: str) -> str:
+    return prompts.ANALYZE.render(
+        text=text,
+        language=language,
+        language_name=LANGUAGE_NAMES.get(language, "English"),
+        schema=schema_prompt(schemas.ANALYZE),
+    )
+
+
+def _normalize_analysis(data: dict | None, language: str) -> dict | None:
+    """Intent normalization plus a validated scope. None if unusable."""
+    result = _normalize_intent_response(data, language)
+    if result is None:
+        return None
+    scope = data.get("scope")
+    if scope not in SCOPES:
+        logger.warning(f"[IntentGate] Gemini analysis has invalid scope: {scope!r}")
+        return None
+    # A reported symptom outranks NON_MEDICAL_SAFE, never OUT_OF_SCOPE: a medicine
+    # or dosage request stays a redirect even when it names a symptom.
+    if scope == "NON_MEDICAL_SAFE" and result["intent"] == "SYMPTOMS":
+        scope = "MEDICAL"
+    result["scope"] = scope
+    return result
+
+
+def _intent_prompt(text: str, language: str) -> str:
+    return prompts.INTENT.render(
+        text=text,
+        language=language,
+        language_name=LANGUAGE_NAMES.get(language, "English"),
+        schema=schema_prompt(schemas.INTENT),
+    )
+
+
+def _normalize_intent_response(data: dict | None, language: str) -> dict | None:
+    """Validate + normalize Gemini's intent JSON. None if unusable."""
+    if data is None:
+        return None
+
+    if "intent" not in data:
+        logger.warning("[IntentGate] Gemini response missing 'intent' key")
+        return None
+
+    intent = data.get("intent", "CLARIFICATION_REQUIRED")
+    if intent not in ("SMALL_TALK", "SYMPTOMS", "CLARIFICATION_REQUIRED"):
+        intent = "CLARIFICATION_REQUIRED"
+
+    # Normalize duration
+    dur = data.get("duration", {})
+    if not isinstance(dur, dict):
+        dur = {"value": None, "unit": "unknown"}
+    if dur.get("unit") == "weeks" and dur.get("value"):
+        dur = {"value": dur["value"] * 7, "unit": "days"}
+    elif dur.get("unit") == "hours" and dur.get("value"):
+        dur = {"value": max(1, dur["value"] // 24), "unit": "days"}
+
+    # Safety check on Gemini reply for non-SYMPTOMS
+    reply = data.get("reply")
+    if reply and intent != "SYMPTOMS":
+        from safety import check_safety
+        safety_result = check_safety(reply, language)
+        if not safety_result["safe"]:
+            logger.warning("[IntentGate] Gemini reply failed safety — using template")
+            reply = (SMALL_TALK_REPLIES if intent == "SMALL_TALK" else CLARIFICATION_REPLIES).get(
+                language,
+                (SMALL_TALK_REPLIES if intent == "SMALL_TALK" else CLARIFICATION_REPLIES)["en"]
+            )
+
+    if intent == "SYMPTOMS":
+        reply = None
+
+    return {
+        "intent": intent,
+        "reply": reply,
+        "primaryComplaint": data.get("primaryComplaint", "unknown") or "unknown",
+        "duration": dur,
+        "severity": data.get("severity", "unknown") or "unknown",
+        "associatedSymptoms": data.get("associatedSymptoms", []) or [],
+        "redFlagsDetected": data.get("redFlagsDetected", []) or [],
+        "confidence": float(data.get("confidence", 0.8)),
+        "followUpQuestion": data.get("followUpQuestion"),
+        "llmUsed": True,
+    }
+
+
 def get_small_talk_reply(language: str = "en") -> str:
     return SMALL_TALK_REPLIES.get(language, SMALL_TALK_REPLIES["en"])
 
@@ -0,0 +1,152 @@
+"""
+Tolerant JSON parsing for LLM replies — local repair before any repair prompt.
+
+Deterministic fixes for the usual ways a model's JSON is slightly off:
+- prose or markdown fences around the object (ignored)
+- trailing or missing commas
+- single-quoted or curly-quoted strings, raw newlines inside strings
+- Python literals (True / False / None), unquoted keys and bare-word values
+- truncation: an unfinished string, key or value is dropped and the open
+  brackets are closed
+
+A truncated string or bare word ("nul", "tru", "12" at the end of the input)
+is dropped rather than kept half-written, so a cut-off reply loses that field
+and still fails schema validation if it was required. A single quote closes a
+string only before a delimiter, so an apostrophe ('can't breathe') does not.
+"""
+
+import json
+import re
+
+_OPEN_QUOTES = {'"': '"', "'": "'", "“": "”", "‘": "’"}
+_ESCAPES = {"n": "\n", "t": "\t", "r": "\r", "b": "\b", "f": "\f", "/": "/"}
+_LITERALS = {"true": "true", "false": "false", "null": "null",
+             "True": "true", "False": "false", "None": "null"}
+_NUMBER = re.compile(r"-?(0|[1-9]\d*)(\.\d+)?([eE][+-]?\d+)?")
+_DELIMITERS = set(',:{}[]"\'“‘') | set(" \t\r\n")
+_APOSTROPHES = {"'", "’"}
+_AFTER_CLOSE = re.compile(r"\s*[,:}\]]")
+
+
+def loads(raw: str) -> tuple[dict | None, bool]:
+    """(object, repaired): strict json.loads of the outermost {...} first, then
+    the repaired text. (None, False) if nothing usable is found."""
+    text = raw.strip()
+    start, end = text.find("{"), text.rfind("}") + 1
+    if start < 0:
+        return None, False
+    if end > start:
+        try:
+            data = json.loads(text[start:end])
+            if isinstance(data, dict):
+                return data, False
+        except ValueError:
+            pass
+    try:
+        data = json.loads(repair(text[start:]))
+    except ValueError:
+        return None, False
+    return (data, True) if isinstance(data, dict) else (None, False)
+
+
+def repair(text: str) -> str:
+    """Best-effort valid JSON for the object starting at text[0] == "{"."""
+    tokens = []          # (kind, json_text); kind: "str" | "lit" | punctuation
+    stack = []           # expected closing brackets
+    i, n = 0, len(text)
+    while i < n:
+        c = text[i]
+        if c in _OPEN_QUOTES:
+            value, i, closed = _read_string(text, i)
+            if not closed:
+                break
+            _emit(tokens, ("str", json.dumps(value, ensure_ascii=False)))
+            continue
+        if c in "{[":
+            stack.append("}" if c == "{" else "]")
+            _emit(tokens, (c, c))
+        elif c in "}]":
+            if stack and stack[-1] == c:
+                _drop_dangling(tokens, stack)
+                stack.pop()
+                tokens.append((c, c))
+                if not stack:
+                    break
+        elif c in ",:":
+            if not tokens or tokens[-1][0] not in (",", ":", "{", "["):
+                tokens.append((c, c))
+        elif not c.isspace():
+            j = i
+            while j < n and text[j] not in _DELIMITERS:
+                j += 1
+            if j == n:
+                break             # cut off mid-word: drop it like an unclosed string
+            _emit(tokens, _bare_word(text[i:j], text, j))
+            i = j
+            continue
+        i += 1
+
+    _drop_dangling(tokens, stack)
+    while stack:
+        tokens.append((stack[-1], stack.pop()))
+        if stack:
+            _drop_dangling(tokens, stack)
+    return "".join(t for _, t in tokens)
+
+
+def _emit(tokens: list, token: tuple) -> None:
+    """Append a value-starting token, adding a missing comma after a previous value."""
+    if tokens and tokens[-1][0] in ("str", "lit", "}", "]"):
+        tokens.append((",", ","))
+    tokens.append(token)
+
+
+def _read_string(text: str, i: int) -> tuple[str, int, bool]:
+    """(value, index after the closing quote, closed) for the string opening at text[i]."""
+    close = _OPEN_QUOTES[text[i]]
+    out = []
+    i += 1
+    while i < len(text):
+        c = text[i]
+        if c == "\\" and i + 1 < len(text):
+            nxt = text[i + 1]
+            if nxt == "u" and re.fullmatch(r"[0-9a-fA-F]{4}", text[i + 2:i + 6]):
+                out.append(chr(int(text[i + 2:i + 6], 16)))
+                i += 6
+                continue
+            out.append(_ESCAPES.get(nxt, nxt))
+            i += 2
+            continue
+        if c == close and (close not in _APOSTROPHES or _AFTER_CLOSE.match(text, i + 1)):
+            return "".join(out), i + 1, True
+        out.append(c)
+        i += 1
+    return "".join(out), i, False
+
+
+def _bare_word(word: str, text: str, end: int) -> tuple[str, str]:
+    """An unquoted token: a key (followed by ':'), a literal, a number, or text."""
+    rest = text[end:].lstrip()
+    if rest.startswith(":"):
+        return "str", json.dumps(word, ensure_ascii=False)
+    if word in _LITERALS:
+        return "lit", _LITERALS[word]
+    if _NUMBER.fullmatch(word):
+        return "lit", word
+    return "str", json.dumps(word, ensure_ascii=False)
+
+
+def _drop_dangling(tokens: list, stack: list) -> None:
+    """Remove a trailing comma, or a key with no value, before a closing bracket."""
+    while tokens:
+        kind = tokens[-1][0]
+        if kind == ",":
+            tokens.pop()
+        elif kind == ":":
+            tokens.pop()          # the colon
+            if tokens:
+                tokens.pop()      # its key
+        elif kind == "str" and stack and stack[-1] == "}" and len(tokens) > 1 and tokens[-2][0] in ("{", ","):
+            tokens.pop()          # a key whose colon never came
+        else:
+            break
@@ -0,0 +1,101 @@
+"""
+Incremental JSON parsing for streamed LLM replies.
+
+FieldStream is fed the reply chunk by chunk and returns each top-level field of
+the JSON object as soon as its value is complete — a string at its closing
+quote, an array / object at its closing bracket, a number or literal at the
+following comma or brace. Text before the opening brace (prose, a markdown
+fence) is skipped. A value that does not parse is not emitted; the complete
+reply is still parsed and validated as a whole (json_repair, schemas.check)
+once the stream ends.
+"""
+
+import json
+
+_KEY, _COLON, _VALUE, _AFTER = "key", "colon", "value", "after"
+
+
+class FieldStream:
+    """feed(chunk) -> [(key, value), ...] newly completed top-level fields."""
+
+    def __init__(self):
+        self.text = ""
+        self.fields = {}
+        self.done = False
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._state = _KEY
+        self._key = None
+        self._start = None       # index where the current key / value began
+
+    def feed(self, chunk: str) -> list[tuple[str, object]]:
+        self.text += chunk
+        out = []
+        text = self.text
+        while self._pos < len(text) and not self.done:
+            i = self._pos
+            c = text[i]
+            self._pos += 1
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif c == "\\":
+                    self._escape = True
+                elif c == '"':
+                    self._in_string = False
+                    if self._depth == 1:
+                        self._string_closed(i, out)
+                continue
+            if self._depth == 0:
+                if c == "{":
+                    self._depth = 1
+                continue
+            if c == '"':
+                self._in_string = True
+                if self._depth == 1 and self._state in (_KEY, _VALUE):
+                    self._start = i
+            elif c in "{[":
+                if self._depth == 1 and self._state == _VALUE:
+                    self._start = i
+                self._depth += 1
+            elif c in "}]":
+                self._depth -= 1
+                if self._depth == 1 and self._state == _VALUE:
+                    self._emit(text[self._start:i + 1], out)
+                elif self._depth == 0:
+                    if self._state == _VALUE and self._start is not None:
+                        self._emit(text[self._start:i], out)
+                    self.done = True
+            elif self._depth == 1:
+                if c == ":" and self._state == _COLON:
+                    self._state, self._start = _VALUE, None
+                elif c == ",":
+                    if self._state == _VALUE and self._start is not None:
+                        self._emit(text[self._start:i], out)
+                    self._state = _KEY
+                elif not c.isspace() and self._state == _VALUE and self._start is None:
+                    self._start = i       # number or literal
+        return out
+
+    def _string_closed(self, i: int, out: list) -> None:
+        if self._state == _KEY:
+            try:
+                self._key = json.loads(self.text[self._start:i + 1])
+            except ValueError:
+                self._key = None
+            self._state = _COLON
+        elif self._state == _VALUE:
+            self._emit(self.text[self._start:i + 1], out)
+
+    def _emit(self, raw: str, out: list) -> None:
+        self._state, self._start = _AFTER, None
+        if self._key is None:
+            return
+        try:
+            value = json.loads(raw)
+        except ValueError:
+            return
+        self.fields[self._key] = value
+        out.append((self._key, value))
@@ -0,0 +1,123 @@
+"""
+Local scope / intent classifier — hashed character n-grams + a linear layer.
+
+- Features: character 2–4-grams of the normalized message (text_normalizer),
+  hashed with CRC32 into N_FEATURES buckets — no vocabulary to ship, and the
+  same features for all five languages and romanized Hindi
+- Model: one softmax layer per head, stored as models/<head>.npy with shape
+  (N_FEATURES + 1, n_labels) — the last row is the bias
+- Scoring: the hashed feature counts dotted with the weight matrix, done as a
+  gather-sum over the active rows (~tens of µs per message)
+
+Weights are trained offline by train_local_classifier.py. If a weight file is
+missing (or LOCAL_MODEL=false) the head is unavailable and callers keep using
+Gemini / keyword rules. confident() only returns answers at or above
+LOCAL_MODEL_MIN_CONFIDENCE — higher for the labels that end a request without
+triage (EARLY_EXIT_LABELS), and never one of those for a message that names a
+symptom (any language's extractor dictionary) or, except clarification, for a
+vague health complaint.
+"""
+
+import os
+import zlib
+import logging
+
+import numpy as np
+
+from intent_gate import _has_symptom_signal, _is_vague_health
+from nlp_extractor import mentions_symptom
+from text_normalizer import normalize
+
+logger = logging.getLogger(__name__)
+
+LOCAL_MODEL = os.getenv("LOCAL_MODEL", "true").lower() == "true"
+MIN_CONFIDENCE = float(os.getenv("LOCAL_MODEL_MIN_CONFIDENCE", "0.95"))
+
+N_FEATURES = 1 << 13
+NGRAMS = (2, 3, 4)
+MODEL_DIR = os.path.join(os.path.dirname(__file__), "models")
+
+SCOPE_LABELS = ("MEDICAL", "NON_MEDICAL_SAFE", "OUT_OF_SCOPE")
+INTENT_LABELS = ("SYMPTOMS", "SMALL_TALK", "CLARIFICATION_REQUIRED")
+
+# A wrong one of these skips triage for a patient, so they need more confidence
+# (LOCAL_MODEL_MIN_CONFIDENCE_<LABEL>) and must not contradict a symptom.
+EARLY_EXIT_LABELS = ("NON_MEDICAL_SAFE", "SMALL_TALK", "CLARIFICATION_REQUIRED")
+LABEL_MIN_CONFIDENCE = {
+    label: float(os.getenv(f"LOCAL_MODEL_MIN_CONFIDENCE_{label}", "0.99")) for label in EARLY_EXIT_LABELS
+}
+
+
+def features(text: str) -> np.ndarray:
+    """Hashed n-gram bucket of every character n-gram (repeats kept, so counts add up)."""
+    padded = f" {normalize(text)} "
+    grams = [padded[i:i + n] for n in NGRAMS for i in range(len(padded) - n + 1)]
+    return np.fromiter((zlib.crc32(g.encode()) % N_FEATURES for g in grams), dtype=np.int64, count=len(grams))
+
+
+def softmax(logits: np.ndarray) -> np.ndarray:
+    z = np.exp(logits - logits.max(axis=-1, keepdims=True))
+    return z / z.sum(axis=-1, keepdims=True)
+
+
+class LinearHead:
+    """One classification head: labels + weight matrix, loaded once."""
+
+    def __init__(self, name: str, labels: tuple, weights: np.ndarray | None = None):
+        self.name = name
+        self.labels = labels
+        self.weights = weights if weights is not None else self._load()
+
+    @property
+    def available(self) -> bool:
+        return self.weights is not None
+
+    def predict(self, text: str) -> tuple[str, float] | None:
+        """(label, probability) or None if the head has no weights."""
+        if self.weights is None:
+            return None
+        probs = self.probabilities(features(text))
+        best = int(probs.argmax())
+        return self.labels[best], float(probs[best])
+
+    def probabilities(self, feats: np.ndarray) -> np.ndarray:
+        return softmax(self.weights[feats].sum(axis=0) + self.weights[-1])
+
+    def _load(self) -> np.ndarray | None:
+        path = os.path.join(MODEL_DIR, f"{self.name}.npy")
+        try:
+            weights = np.load(path)
+        except (OSError, ValueError) as e:
+            logger.info(f"[LocalModel] {self.name} weights not loaded ({type(e).__name__}) — head disabled")
+            return None
+        if weights.shape != (N_FEATURES + 1, len(self.labels)):
+            logger.warning(f"[LocalModel] {path} has shape {weights.shape} — head disabled")
+            return None
+        return weights.astype(np.float32, copy=False)
+
+
+scope_model = LinearHead("scope", SCOPE_LABELS)
+intent_model = LinearHead("intent", INTENT_LABELS)
+
+
+def confident(model: LinearHead, text: str) -> tuple[str, float] | None:
+    """The model's (label, probability) if local answers are enabled and it may answer."""
+    if not LOCAL_MODEL:
+        return None
+    return decide(model, text)
+
+
+def decide(model: LinearHead, text: str, min_confidence: float = MIN_CONFIDENCE) -> tuple[str, float] | None:
+    """The prediction the service would serve: confident enough for its label and
+    not an early exit for a message with a symptom / vague health complaint."""
+    prediction = model.predict(text)
+    if prediction is None:
+        return None
+    label, prob = prediction
+    if prob < max(min_confidence, LABEL_MIN_CONFIDENCE.get(label, 0.0)):
+        return None
+    if label in EARLY_EXIT_LABELS and (mentions_symptom(text) or _has_symptom_signal(text)):
+        return None
+    if label in ("NON_MEDICAL_SAFE", "SMALL_TALK") and _is_vague_health(text):
+        return None
+    return prediction
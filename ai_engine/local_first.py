@@ -0,0 +1,144 @@
+"""
+Local-first mode for /extract and /intent.
+
+With LOCAL_FIRST=true the regex extractor (and classify_intent) answer first;
+Gemini is only called when the local answer is not trustworthy enough:
+- no symptom found
+- extractionConfidence below LOCAL_FIRST_MIN_CONFIDENCE
+- message longer than LOCAL_FIRST_MAX_CHARS
+- message mixes scripts (e.g. Devanagari + Latin)
+
+A ShadowSampler re-runs Gemini on a fraction (LOCAL_FIRST_SHADOW_RATE) of the
+messages answered locally, on a background thread, and records how often it
+agrees — the numbers to tune the threshold with (/health → localFirst).
+"""
+
+import os
+import queue
+import random
+import logging
+import threading
+
+from text_normalizer import scripts
+
+logger = logging.getLogger(__name__)
+
+LOCAL_FIRST = os.getenv("LOCAL_FIRST", "false").lower() == "true"
+MIN_CONFIDENCE = float(os.getenv("LOCAL_FIRST_MIN_CONFIDENCE", "0.9"))
+MAX_CHARS = int(os.getenv("LOCAL_FIRST_MAX_CHARS", "160"))
+SHADOW_RATE = float(os.getenv("LOCAL_FIRST_SHADOW_RATE", "0.02"))
+SHADOW_QUEUE = 64     # pending shadow calls; more are dropped, never queued on the request path
+
+# Path reported in responses: answered by the local extractor, by Gemini, or
+# by the local extractor after Gemini failed / was unavailable.
+PATH_LOCAL = "local"
+PATH_GEMINI = "gemini"
+PATH_FALLBACK = "fallback"
+
+
+def gemini_needed(text: str, extracted: dict) -> str | None:
+    """Why this message still needs Gemini, or None if the local extraction can answer."""
+    if not LOCAL_FIRST:
+        return "disabled"
+    if not extracted.get("allDetectedSymptoms"):
+        return "no_symptom"
+    if extracted.get("extractionConfidence", 0) < MIN_CONFIDENCE:
+        return "low_confidence"
+    if len(text) > MAX_CHARS:
+        return "long_message"
+    if len(scripts(text)) > 1:
+        return "mixed_script"
+    return None
+
+
+def _same_extraction(local: dict, remote: dict) -> dict:
+    return {
+        "primaryComplaint": local.get("primaryComplaint") == remote.get("primaryComplaint"),
+        "symptoms": set(local.get("allDetectedSymptoms") or []) == set(
+            [remote.get("primaryComplaint")] + list(remote.get("associatedSymptoms") or [])
+        ) - {"unknown"},
+        "duration": (local.get("duration") or {}).get("value") == (remote.get("duration") or {}).get("value"),
+        "severity": local.get("severity") == remote.get("severity"),
+        "redFlags": set(local.get("redFlagsDetected") or []) == set(remote.get("redFlagsDetected") or []),
+    }
+
+
+def _same_intent(local: dict, remote: dict) -> dict:
+    return {"intent": local.get("intent") == remote.get("intent"), **_same_extraction(local, remote)}
+
+
+_COMPARE = {"extract": _same_extraction, "intent": _same_intent}
+
+
+class ShadowSampler:
+    """Background agreement sampling of locally answered messages against Gemini."""
+
+    def __init__(self, rate: float = SHADOW_RATE, max_pending: int = SHADOW_QUEUE):
+        self.rate = rate
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stats = {kind: {"sampled": 0, "dropped": 0, "compared": 0, "failed": 0,
+                              "agreed": 0, "fields": {}} for kind in _COMPARE}
+
+    def maybe_submit(self, kind: str, local: dict, call_gemini) -> bool:
+        """Queue call_gemini() (sync, returns Gemini's normalized answer or None) for
+        comparison with `local` — for a random `rate` fraction of calls. Never blocks."""
+        if self.rate <= 0 or random.random() >= self.rate:
+            return False
+        self._ensure_worker()
+        try:
+            self._queue.put_nowait((kind, dict(local), call_gemini))
+        except queue.Full:
+            self._count(kind, "dropped")
+            return False
+        self._count(kind, "sampled")
+        return True
+
+    def stats(self) -> dict:
+        with self._lock:
+            out = {"enabled": LOCAL_FIRST, "minConfidence": MIN_CONFIDENCE, "shadowRate": self.rate}
+            for kind, s in self._stats.items():
+                compared = s["compared"]
+                out[kind] = {
+                    **{k: v for k, v in s.items() if k != "fields"},
+                    "agreementRate": round(s["agreed"] / compared, 4) if compared else None,
+                    "fieldAgreement": {f: round(n / compared, 4) for f, n in s["fields"].items()} if compared else {},
+                }
+            return out
+
+    # ── Internals ──────────────────────────────────────────────────────
+    def _ensure_worker(self) -> None:
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="local-first-shadow", daemon=True)
+                self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            kind, local, call_gemini = self._queue.get()
+            try:
+                remote = call_gemini()
+            except Exception as e:
+                logger.warning(f"[LocalFirst] Shadow call failed: {type(e).__name__}: {str(e)[:120]}")
+                remote = None
+            if remote is None:
+                self._count(kind, "failed")
+                continue
+            fields = _COMPARE[kind](local, remote)
+            with self._lock:
+                s = self._stats[kind]
+                s["compared"] += 1
+                s["agreed"] += all(fields.values())
+                for name, same in fields.items():
+                    s["fields"][name] = s["fields"].get(name, 0) + same
+            if not all(fields.values()):
+                logger.info(f"[LocalFirst] Shadow {kind} disagreement: "
+                            f"{[name for name, same in fields.items() if not same]}")
+
+    def _count(self, kind: str, field: str) -> None:
+        with self._lock:
+            self._stats[kind][field] += 1
+
+
+shadow = ShadowSampler()
@@ -0,0 +1,239 @@
+"""
+Near-duplicate response cache — MinHash + LSH over character n-grams.
+
+Catches rewordings that exact hashing misses ("mujhe 2 din se bukhar hai" vs
+"2 din se bukhar hai mujhe"):
+- Signature: NUM_PERM MinHash values over the word-bounded character trigrams
+  of the normalized message, so word order does not change it
+- LSH: BANDS bands of ROWS values; each band is indexed in its own
+  open-addressing hash table held in NumPy arrays (no per-entry Python objects)
+- A hit needs estimated Jaccard similarity >= threshold AND an identical
+  caller-supplied guard (e.g. the locally extracted symptoms) — similar text
+  alone is never enough
+- Fixed capacity with LRU eviction and per-entry TTL; memory is allocated up front
+"""
+
+import json
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from text_normalizer import normalize
+
+NUM_PERM = 64
+BANDS = 8
+ROWS = NUM_PERM // BANDS      # 8 rows per band → candidate threshold ≈ (1/8)^(1/8) ≈ 0.77
+SHINGLE = 3
+MAX_PROBE_HITS = 64           # candidates read per band bucket
+
+_EMPTY = -1
+_rng = np.random.default_rng(20240601)
+_A = _rng.integers(1, 2**63, NUM_PERM, dtype=np.uint64) << np.uint64(1) | np.uint64(1)
+_B = _rng.integers(0, 2**63, NUM_PERM, dtype=np.uint64)
+_BAND_MIX = _rng.integers(1, 2**63, ROWS, dtype=np.uint64) | np.uint64(1)
+
+
+def signature(text: str) -> np.ndarray | None:
+    """MinHash signature (uint32[NUM_PERM]) of a message, or None if it has no shingles."""
+    shingles = set()
+    for token in normalize(text).split():
+        padded = f" {token} "
+        shingles.update(padded[i:i + SHINGLE] for i in range(len(padded) - SHINGLE + 1))
+    if not shingles:
+        return None
+    h = np.fromiter((hash(s) & 0xFFFFFFFF for s in shingles), dtype=np.uint64, count=len(shingles))
+    # Multiply-shift hashing: high 32 bits of (a*h + b) mod 2^64 per permutation.
+    return ((_A[:, None] * h[None, :] + _B[:, None]) >> np.uint64(32)).min(axis=1).astype(np.uint32)
+
+
+def _band_hashes(sig: np.ndarray) -> list[int]:
+    bands = sig.reshape(BANDS, ROWS).astype(np.uint64)
+    h = (bands * _BAND_MIX).sum(axis=1)
+    # splitmix64 finalizer: the table uses the low bits as the home cell.
+    h ^= h >> np.uint64(30)
+    h *= np.uint64(0xBF58476D1CE4E5B9)
+    h ^= h >> np.uint64(27)
+    h *= np.uint64(0x94D049BB133111EB)
+    h ^= h >> np.uint64(31)
+    return h.tolist()
+
+
+class NearDuplicateCache:
+    """Thread-safe similarity cache of JSON-serializable values."""
+
+    def __init__(self, threshold: float = 0.8, max_entries: int = 100_000, ttl: float = 3600,
+                 name: str = "near"):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.name = name
+        self._lock = threading.Lock()
+
+        # Slots: signatures, guards, payloads and expiry per stored entry.
+        self._sigs = np.zeros((max_entries, NUM_PERM), dtype=np.uint32)
+        self._expires = np.zeros(max_entries, dtype=np.float64)
+        self._guards = [None] * max_entries
+        self._values = [None] * max_entries
+        self._lru: OrderedDict[int, None] = OrderedDict()   # slot → None, oldest first
+        self._free = list(range(max_entries - 1, -1, -1))
+
+        # Band tables: linear probing, load factor <= 0.5.
+        size = 1 << max(4, (2 * max_entries - 1).bit_length())
+        self._mask = size - 1
+        self._tab_keys = np.zeros((BANDS, size), dtype=np.uint64)
+        self._tab_slots = np.full((BANDS, size), _EMPTY, dtype=np.int32)
+
+        self._hits = 0
+        self._misses = 0
+        self._guard_rejects = 0
+        self._evictions = 0
+
+    # ── Public API ─────────────────────────────────────────────────────
+    def get(self, text: str, guard):
+        """Cached value of the most similar entry with an equal guard, or None."""
+        sig = signature(text)
+        if sig is None:
+            return None
+        bands = _band_hashes(sig)
+        now = time.time()
+        with self._lock:
+            candidates = self._candidates(bands)
+            best, best_sim, rejected = None, self.threshold, False
+            if candidates:
+                slots = np.fromiter(candidates, dtype=np.int64, count=len(candidates))
+                sims = np.count_nonzero(self._sigs[slots] == sig, axis=1) / NUM_PERM
+                for slot, sim in zip(slots.tolist(), sims.tolist()):
+                    if sim < best_sim or self._expires[slot] <= now:
+                        continue
+                    if self._guards[slot] != guard:
+                        rejected = True
+                        continue
+                    best, best_sim = slot, sim
+            if best is None:
+                self._misses += 1
+                self._guard_rejects += rejected
+                return None
+            self._hits += 1
+            self._lru.move_to_end(best)
+            payload = self._values[best]
+        return json.loads(payload)
+
+    def set(self, text: str, guard, value) -> None:
+        sig = signature(text)
+        if sig is None:
+            return
+        bands = _band_hashes(sig)
+        payload = json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+        with self._lock:
+            slot = self._same(bands, sig, guard)
+            if slot is None:
+                if not self._free:
+                    self._evict(next(iter(self._lru)))
+                slot = self._free.pop()
+                self._sigs[slot] = sig
+                self._guards[slot] = guard
+                for b, h in enumerate(bands):
+                    self._insert(b, h, slot)
+            self._expires[slot] = time.time() + self.ttl
+            self._values[slot] = payload
+            self._lru[slot] = None
+            self._lru.move_to_end(slot)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "entries": len(self._lru),
+                "maxEntries": self.max_entries,
+                "threshold": self.threshold,
+                "hits": self._hits,
+                "misses": self._misses,
+                "hitRate": round(self._hits / lookups, 4) if lookups else 0.0,
+                "guardRejects": self._guard_rejects,
+                "evictions": self._evictions,
+            }
+
+    # ── Band tables ────────────────────────────────────────────────────
+    def _candidates(self, bands: list[int]) -> "set[int]":
+        found = set()
+        for b, h in enumerate(bands):
+            keys, slots = self._tab_keys[b], self._tab_slots[b]
+            i, hits = h & self._mask, 0
+            while hits < MAX_PROBE_HITS:
+                slot = int(slots[i])
+                if slot == _EMPTY:
+                    break
+                if int(keys[i]) == h:
+                    found.add(slot)
+                    hits += 1
+                i = (i + 1) & self._mask
+        return found
+
+    def _same(self, bands: list[int], sig: np.ndarray, guard) -> int | None:
+        """Slot already holding this exact signature and guard (re-set replaces it)."""
+        for slot in self._candidates(bands[:1]):
+            if self._guards[slot] == guard and np.array_equal(self._sigs[slot], sig):
+                return slot
+        return None
+
+    def _insert(self, b: int, h: int, slot: int) -> None:
+        keys, slots = self._tab_keys[b], self._tab_slots[b]
+        i = h & self._mask
+        while slots[i] != _EMPTY:
+            i = (i + 1) & self._mask
+        keys[i] = h
+        slots[i] = slot
+
+    def _remove(self, b: int, h: int, slot: int) -> None:
+        """Delete (h, slot) from band b with backward-shift, leaving no tombstones."""
+        keys, slots = self._tab_keys[b], self._tab_slots[b]
+        mask = self._mask
+        i = h & mask
+        while slots[i] != slot:
+            if slots[i] == _EMPTY:
+                return
+            i = (i + 1) & mask
+        j = i
+        while True:
+            j = (j + 1) & mask
+            if slots[j] == _EMPTY:
+                break
+            home = int(keys[j]) & mask
+            # The entry at j may move to i only if its home is not in (i, j].
+            if (i < j and i < home <= j) or (i > j and (home > i or home <= j)):
+                continue
+            keys[i] = keys[j]
+            slots[i] = slots[j]
+            i = j
+        slots[i] = _EMPTY
+
+    def _evict(self, slot: int) -> None:
+        for b, h in enumerate(_band_hashes(self._sigs[slot])):
+            self._remove(b, h, slot)
+        del self._lru[slot]
+        self._guards[slot] = None
+        self._values[slot] = None
+        self._free.append(slot)
+        self._evictions += 1
+
+
+if __name__ == "__main__":
+    import random
+    import sys
+
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    rng = random.Random(7)
+    words = ["mujhe", "din", "se", "bukhar", "hai", "fever", "cough", "since", "days", "pain",
+             "chest", "stomach", "severe", "mild", "headache", "बुखार", "खांसी", "दिन", "से", "है"]
+    cache = NearDuplicateCache(max_entries=n)
+    t = time.perf_counter()
+    for i in range(n):
+        cache.set(" ".join(rng.choices(words, k=6)) + f" {i}", ("g", i % 50), {"i": i})
+    print(f"filled {n:,} entries in {time.perf_counter() - t:.1f}s")
+    queries = [" ".join(rng.choices(words, k=6)) + f" {rng.randrange(n)}" for _ in range(5000)]
+    t = time.perf_counter()
+    for q in queries:
+        cache.get(q, ("g", 0))
+    print(f"lookup {(time.perf_counter() - t) / len(queries) * 1e6:.0f} µs/query, {cache.stats()}")
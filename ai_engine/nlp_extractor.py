@@ -4,38 +4,18 @@ Gemini extracts structured JSON. If unavailable, local regex runs instead."""
 import re
 import os
 import logging
+from collections import namedtuple
 
 logger = logging.getLogger(__name__)
 
-from gemini_client import is_enabled as gemini_enabled, call_gemini_json
+from deadline import Deadline
+from text_normalizer import normalize_for_matching
+from local_first import LOCAL_FIRST, gemini_needed, shadow, PATH_LOCAL, PATH_GEMINI, PATH_FALLBACK
+from gemini_client import PromptSite, is_enabled as gemini_enabled, call_gemini_json, acall_gemini_json, schema_prompt
+import prompts
+import schemas
 
-EXTRACTION_PROMPT = """You are a medical symptom extraction assistant for a rural health triage system in India.
-Extract structured symptom information from the patient's message below.
-
-STRICT RULES:
-- Do NOT diagnose any disease
-- Do NOT suggest any medicines or treatments
-- Do NOT classify urgency or severity beyond what the patient states
-- Only extract what the patient explicitly mentions
-- Output ONLY valid JSON, no explanation, no markdown
-
-Required JSON schema:
-{{
-  "primaryComplaint": "string or unknown",
-  "duration": {{"value": number or null, "unit": "days or hours or weeks or unknown"}},
-  "severity": "mild or moderate or severe or unknown",
-  "associatedSymptoms": ["list of symptoms mentioned"],
-  "redFlagsDetected": ["list of red-flag symptoms like chest pain, breathlessness, unconscious, seizure, severe bleeding"],
-  "languageDetected": "en or hi or mr or ta or te",
-  "confidence": 0.0 to 1.0,
-  "needsFollowUp": true or false,
-  "followUpQuestion": "string or null"
-}}
-
-Patient language hint: {language}
-Patient message: {text}
-
-Respond with JSON only."""
+_EXTRACT_SITE = PromptSite("extract", prompts.EXTRACT.template, ttl=900, schema=schemas.EXTRACTION)
 
 # ── Symptom dictionaries per language ──────────────────────────────────────
 
@@ -262,39 +242,303 @@ RED_FLAG_SYMPTOMS = {
 def _match(pattern: str, text: str) -> bool:
     """Match pattern against text. For Indic scripts, \b doesn't work — use Unicode word boundary."""
     try:
-        # Replace \b with Unicode-aware boundary for non-ASCII patterns
-        if re.search(r'[^\x00-\x7F]', pattern):
-            # Strip \b for Indic/Unicode patterns and do plain substring search
-            clean = pattern.replace(r'\b', '').replace(r'\B', '')
-            return bool(re.search(clean, text, re.IGNORECASE | re.UNICODE))
-        return bool(re.search(pattern, text, re.IGNORECASE | re.UNICODE))
+        return bool(re.search(_prepare_pattern(pattern), text, re.IGNORECASE | re.UNICODE))
     except re.error:
         return False
 
 
-def extract_symptoms(text: str, language: str = "en") -> dict:
+def _prepare_pattern(pattern: str) -> str:
+    """Strip \b from Indic/Unicode patterns (plain substring search); ASCII patterns are kept as-is."""
+    if re.search(r'[^\x00-\x7F]', pattern):
+        return pattern.replace(r'\b', '').replace(r'\B', '')
+    return pattern
+
+
+# ── Compiled single-pass matcher ───────────────────────────────────────────
+# All symptom, severity and duration patterns for a language (plus English)
+# are compiled once at import into one scanner. A trie of the patterns'
+# literal prefixes finds each candidate position; a chain of named
+# lookaheads then reports every pattern matching there, so overlapping hits
+# ("severe bleeding" → severe_bleeding + bleeding + severity=severe) are kept.
+
+_FLAGS = re.IGNORECASE | re.UNICODE
+_NUMERIC_START = re.compile(r"[(](?:[?]P<v[0-9]+>)?\\d[+]?[)]")
+_TODAY_KEYWORDS = ["morning", "सुबह", "subah", "सकाळ", "காலை", "ఉదయం", "today", "आज", "aaj", "இன்று", "ఈరోజు"]
+
+# kind: "symptom" | "severity" | "duration". For duration hits key is the unit
+# ("days"/"weeks"/"hours") and rank is the pattern's priority (lower wins).
+MatchHit = namedtuple("MatchHit", ["kind", "key", "start", "end", "value", "rank"])
+
+
+def _top_level_branches(pattern: str) -> list[str]:
+    """`pattern` split at its top-level `|` (outside groups and character classes)."""
+    branches, depth, in_class, start, i = [], 0, False, 0, 0
+    while i < len(pattern):
+        c = pattern[i]
+        if c == "\\":
+            i += 2
+            continue
+        if in_class:
+            in_class = c != "]"
+        elif c == "[":
+            in_class = True
+        elif c == "(":
+            depth += 1
+        elif c == ")":
+            depth -= 1
+        elif c == "|" and depth == 0:
+            branches.append(pattern[start:i])
+            start = i + 1
+        i += 1
+    branches.append(pattern[start:])
+    return branches
+
+
+def _literal_prefix(pattern: str) -> str:
+    """Leading literal text every match of `pattern` must start with ("" if none)."""
+    i = 0
+    while pattern.startswith(r"\b", i):
+        i += 2
+    out = []
+    while i < len(pattern):
+        c = pattern[i]
+        if c in "\\.^$*+?{}[]|()":
+            break
+        if i + 1 < len(pattern) and pattern[i + 1] in "?*{":
+            break
+        out.append(c)
+        i += 1
+    return "".join(out)
+
+
+def _trie_regex(words: list[str]) -> str:
+    """Regex alternation of `words` factored as a character trie."""
+    trie = {}
+    for word in words:
+        node = trie
+        for ch in word:
+            node = node.setdefault(ch, {})
+        node[""] = True
+
+    def build(node):
+        if "" in node:
+            return ""  # a shorter prefix already covers every longer one
+        alts = [re.escape(ch) + build(child) for ch, child in sorted(node.items())]
+        return alts[0] if len(alts) == 1 else "(?:" + "|".join(alts) + ")"
+
+    return build(trie) if trie else "(?!)"
+
+
+def _build_chain(alternatives: list[str], indexes) -> tuple:
+    regex = re.compile("".join(f"(?:(?=(?P<g{idx}>{alternatives[idx]})))?" for idx in indexes), _FLAGS)
+    return regex, [(regex.groupindex[f"g{idx}"], idx) for idx in indexes]
+
+
+class SymptomMatcher:
+    """Compiled scanner for one language (plus English). `scan()` returns every hit in text order."""
+
+    def __init__(self, language: str):
+        langs = [language, "en"] if language != "en" else ["en"]
+        self._entries = []  # group index -> (kind, key, rank, value_group, fixed_value)
+        alternatives = []
+
+        def add(kind, key, rank, pattern, fixed_value=None):
+            pattern = _prepare_pattern(pattern)
+            try:
+                re.compile(pattern)
+            except re.error:
+                return
+            idx = len(self._entries)
+            value_group = None
+            if kind == "duration" and fixed_value is None:
+                value_group = f"v{idx}"
+                pattern = pattern.replace(r"(\d+)", rf"(?P<{value_group}>\d+)", 1)
+            self._entries.append((kind, key, rank, value_group, fixed_value))
+            alternatives.append(pattern)
+
+        for symptom_key, lang_patterns in SYMPTOM_KEYWORDS.items():
+            for lang in langs:
+                for pattern in lang_patterns.get(lang, []):
+                    add("symptom", symptom_key, 0, pattern)
+
+        for sev_level in ["severe", "moderate", "mild"]:
+            for lang in langs:
+                for pattern in SEVERITY_KEYWORDS.get(sev_level, {}).get(lang, []):
+                    add("severity", sev_level, 0, pattern)
+
+        rank = 0
+        for lang in langs:
+            for pattern, unit in DURATION_PATTERNS.get(lang, []):
+                if unit:
+                    add("duration", unit, rank, pattern)
+                else:
+                    fixed = 0 if any(kw in pattern for kw in _TODAY_KEYWORDS) else 1
+                    add("duration", "days", rank, pattern, fixed_value=fixed)
+                rank += 1
+
+        # Finder: a trie of each pattern's literal prefix, so locating the next
+        # candidate position costs per character, not per pattern. It may
+        # over-report; the chains below do the exact check. A pattern with
+        # top-level alternatives ("कल\s*से|kal\s*se") gets one prefix per
+        # branch; if any branch has none, the whole pattern is loose.
+        prefixes, loose, buckets = [], [], {}
+        for idx, pattern in enumerate(alternatives):
+            branch_prefixes = [_literal_prefix(branch) for branch in _top_level_branches(pattern)]
+            if all(branch_prefixes):
+                prefixes.extend(branch_prefixes)
+                for first in {prefix[0].lower() for prefix in branch_prefixes}:
+                    buckets.setdefault(first, []).append(idx)
+            else:
+                loose.append(idx)
+        finder_alts = [
+            r"\d" if _NUMERIC_START.match(alternatives[i]) and len(_top_level_branches(alternatives[i])) == 1
+            else f"(?:{alternatives[i]})"
+            for i in loose
+        ]
+        self._finder = re.compile("|".join(sorted(set(finder_alts)) + [_trie_regex(prefixes)]), _FLAGS)
+
+        # Chains: one optional named lookahead per pattern, reporting every
+        # pattern that matches at a candidate position. Patterns are bucketed
+        # by the first character of their prefix; prefix-less ones always run.
+        self._chains = {ch: _build_chain(alternatives, idxs) for ch, idxs in buckets.items()}
+        self._loose_chain = _build_chain(alternatives, loose) if loose else None
+        self._by_char = {}
+
+    def scan(self, text: str) -> list[MatchHit]:
+        hits = []
+        pos = 0
+        while True:
+            m = self._finder.search(text, pos)
+            if m is None:
+                break
+            at = m.start()
+            for chain in self._chains_for(text[at]):
+                regex, groups = chain
+                cm = regex.match(text, at)
+                regs = cm.regs
+                for group, idx in groups:
+                    start, end = regs[group]
+                    if start < 0:
+                        continue
+                    kind, key, rank, value_group, fixed = self._entries[idx]
+                    value = int(cm.group(value_group)) if value_group else fixed
+                    hits.append(MatchHit(kind, key, start, end, value, rank))
+            pos = at + 1
+        return hits
+
+    def _chains_for(self, ch: str) -> list:
+        chains = self._by_char.get(ch)
+        if chains is None:
+            # First time this character is seen: find the buckets it case-insensitively equals.
+            chains = [chain for first, chain in self._chains.items() if re.fullmatch(re.escape(first), ch, _FLAGS)]
+            if self._loose_chain:
+                chains.append(self._loose_chain)
+            self._by_char[ch] = chains
+        return chains
+
+
+_MATCHERS = {lang: SymptomMatcher(lang) for lang in ("en", "hi", "mr", "ta", "te")}
+
+
+def get_matcher(language: str) -> SymptomMatcher:
+    """Compiled matcher for a language. Unknown languages use the English dictionary only."""
+    return _MATCHERS.get(language, _MATCHERS["en"])
+
+
+def mentions_symptom(text: str) -> bool:
+    """True if any language's symptom dictionary matches — for callers that do
+    not know the message language (the local classifier's guard)."""
+    text_lower = normalize_for_matching(text)
+    return any(hit.kind == "symptom" for lang in ("hi", "mr", "ta", "te") for hit in _MATCHERS[lang].scan(text_lower))
+
+
+def symptom_terms() -> set[str]:
+    """Single-word symptom keywords (any language) — the tokens the cache key
+    may reorder when GEMINI_CACHE_SYMPTOM_ORDER is on."""
+    terms = set()
+    for by_lang in SYMPTOM_KEYWORDS.values():
+        for patterns in by_lang.values():
+            for pattern in patterns:
+                word = pattern.replace(r"\b", "")
+                if word and not re.search(r"[\s\\()\[\]?*+|.{}]", word):
+                    terms.add(word.casefold())
+    return terms
+
+
+def extract_symptoms(text: str, language: str = "en", deadline: Deadline | None = None) -> dict:
     """
-    Hybrid extraction: Gemini primary → regex fallback.
-    Always returns llmUsed and fallbackUsed flags.
+    Hybrid extraction: Gemini primary → regex fallback, or regex first in
+    local-first mode (local_first.py). Always returns llmUsed, fallbackUsed
+    and path ("local" | "gemini" | "fallback").
     """
-    # ── Primary: Gemini ────────────────────────────────────────────────
     if gemini_enabled():
-        result = _extract_with_gemini(text, language)
+        local = _local_first(text, language)
+        if local is not None:
+            return local
+        # ── Primary: Gemini ────────────────────────────────────────────
+        result = _extract_with_gemini(text, language, deadline)
         if result is not None:
+            result["path"] = PATH_GEMINI
             return result
         logger.warning("[Extractor] Gemini failed — falling back to regex extraction.")
 
     # ── Fallback: local regex ──────────────────────────────────────────
+    return _regex_fallback(text, language)
+
+
+async def aextract_symptoms(text: str, language: str = "en", deadline: Deadline | None = None) -> dict:
+    """Async extract_symptoms."""
+    if gemini_enabled():
+        local = _local_first(text, language)
+        if local is not None:
+            return local
+        result = await _aextract_with_gemini(text, language, deadline)
+        if result is not None:
+            result["path"] = PATH_GEMINI
+            return result
+        logger.warning("[Extractor] Gemini failed — falling back to regex extraction.")
+
+    return _regex_fallback(text, language)
+
+
+def _local_first(text: str, language: str) -> dict | None:
+    """Regex extraction if local-first mode trusts it for this message, else None."""
+    if not LOCAL_FIRST:
+        return None
+    result = _extract_with_regex(text, language)
+    if gemini_needed(text, result) is not None:
+        return None
+    shadow.maybe_submit("extract", result, lambda: _extract_with_gemini(text, language))
+    result.update(llmUsed=False, fallbackUsed=False, path=PATH_LOCAL)
+    return result
+
+
+def _regex_fallback(text: str, language: str) -> dict:
     result = _extract_with_regex(text, language)
-    result["llmUsed"] = False
-    result["fallbackUsed"] = True
+    result.update(llmUsed=False, fallbackUsed=True, path=PATH_FALLBACK)
     return result
 
 
-def _extract_with_gemini(text: str, language: str) -> dict | None:
+def _extract_with_gemini(text: str, language: str, deadline: Deadline | None = None) -> dict | None:
     """Call Gemini for extraction. Returns normalized dict or None on failure."""
-    prompt = EXTRACTION_PROMPT.format(text=text, language=language)
-    data = call_gemini_json(prompt, timeout=20)
+    prompt = _extraction_prompt(text, language)
+    return _normalize_gemini_extraction(call_gemini_json(
+        prompt, timeout=20, deadline=deadline, site=_EXTRACT_SITE, inputs=(text, language)))
+
+
+async def _aextract_with_gemini(text: str, language: str, deadline: Deadline | None = None) -> dict | None:
+    prompt = _extraction_prompt(text, language)
+    return _normalize_gemini_extraction(await acall_gemini_json(
+        prompt, timeout=20, deadline=deadline, site=_EXTRACT_SITE, inputs=(text, language)))
+
+
+def _extraction_prompt(text: str, language: str) -> str:
+    return prompts.EXTRACT.render(text=text, language=language,
+                                  schema=schema_prompt(schemas.EXTRACTION, "Required JSON schema:"))
+
+
+def _normalize_gemini_extraction(data: dict | None) -> dict | None:
+    """Validate + normalize Gemini's extraction JSON. None if unusable."""
     if data is None:
         return None
 
@@ -343,69 +587,41 @@ def _extract_with_gemini(text: str, language: str) -> dict | None:
 
 
 def _extract_with_regex(text: str, language: str = "en") -> dict:
-    """Original regex/dictionary extraction — unchanged logic."""
-    text_lower = text.lower().strip()
-    langs_to_check = [language, "en"] if language != "en" else ["en"]
-
-    detected_symptoms = []
-    red_flags = []
-    confidence_score = 0.0
-    matches_count = 0
-
-    for symptom_key, lang_patterns in SYMPTOM_KEYWORDS.items():
-        for lang in langs_to_check:
-            patterns = lang_patterns.get(lang, [])
-            for pattern in patterns:
-                if _match(pattern, text_lower):
-                    if symptom_key not in detected_symptoms:
-                        detected_symptoms.append(symptom_key)
-                        matches_count += 1
-                    if symptom_key in RED_FLAG_SYMPTOMS:
-                        if symptom_key not in red_flags:
-                            red_flags.append(symptom_key)
-                    break
+    """Regex/dictionary extraction — one pass of the compiled matcher over the text."""
+    text_lower = normalize_for_matching(text)
+
+    found_symptoms = set()
+    found_severities = set()
+    best_duration = None
+    for hit in get_matcher(language).scan(text_lower):
+        if hit.kind == "symptom":
+            found_symptoms.add(hit.key)
+        elif hit.kind == "severity":
+            found_severities.add(hit.key)
+        elif best_duration is None or hit.rank < best_duration.rank:
+            best_duration = hit
+
+    # Dictionary order, not text order — primaryComplaint must stay stable.
+    detected_symptoms = [k for k in SYMPTOM_KEYWORDS if k in found_symptoms]
+    red_flags = [k for k in detected_symptoms if k in RED_FLAG_SYMPTOMS]
+    matches_count = len(detected_symptoms)
 
     duration = {"value": None, "unit": None}
-    for lang in langs_to_check:
-        patterns = DURATION_PATTERNS.get(lang, [])
-        for pattern, unit in patterns:
-            try:
-                m = re.search(pattern, text_lower, re.IGNORECASE | re.UNICODE)
-                if m:
-                    if unit and m.groups():
-                        val = int(m.group(1))
-                        if unit == "weeks":
-                            duration = {"value": val * 7, "unit": "days"}
-                        elif unit == "hours":
-                            duration = {"value": max(1, val // 24), "unit": "days"}
-                        else:
-                            duration = {"value": val, "unit": "days"}
-                    else:
-                        if any(kw in pattern for kw in ["morning", "सुबह", "subah", "सकाळ", "காலை", "ఉదయం", "today", "आज", "aaj", "இன்று", "ఈరోజు"]):
-                            duration = {"value": 0, "unit": "days"}
-                        else:
-                            duration = {"value": 1, "unit": "days"}
-                    matches_count += 1
-                    break
-            except re.error:
-                continue
-        if duration["value"] is not None:
-            break
+    if best_duration is not None:
+        val = best_duration.value
+        if best_duration.key == "weeks":
+            duration = {"value": val * 7, "unit": "days"}
+        elif best_duration.key == "hours":
+            duration = {"value": max(1, val // 24), "unit": "days"}
+        else:
+            duration = {"value": val, "unit": "days"}
+        matches_count += 1
 
     severity = "unknown"
     for sev_level in ["severe", "moderate", "mild"]:
-        found = False
-        for lang in langs_to_check:
-            patterns = SEVERITY_KEYWORDS.get(sev_level, {}).get(lang, [])
-            for pattern in patterns:
-                if _match(pattern, text_lower):
-                    severity = sev_level
-                    matches_count += 1
-                    found = True
-                    break
-            if found:
-                break
-        if found:
+        if sev_level in found_severities:
+            severity = sev_level
+            matches_count += 1
             break
 
     if matches_count == 0:
@@ -0,0 +1,276 @@
+"""
+Prompt registry — every Gemini call site's prompt and token budget in one place.
+
+Each entry holds:
+- template: the site's prompt; the message goes in {text}, the schema text
+  (only when structured output is off) in {schema}
+- system: whether SYSTEM_PROMPT goes with the call, as the request's system
+  instruction (never pasted into the prompt). Only triage needs it — the
+  classifiers, the extractor and the text generators carry their own rules.
+- max_input_chars: longer messages are clipped before they reach the prompt
+- output_tokens: expected reply size, charged up front to the TPM bucket
+
+Prompt / response tokens are counted per endpoint and per call site — from
+the usage Gemini reports, else estimated — for /health → tokens.
+"""
+
+import contextvars
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+CHARS_PER_TOKEN = 4
+PROMPTS: dict[str, "Prompt"] = {}
+
+# Endpoint the current request's Gemini calls are counted under (set by app._admit;
+# tasks spawned by the request inherit it).
+_endpoint = contextvars.ContextVar("gemini_endpoint", default="internal")
+
+
+def set_endpoint(name: str) -> None:
+    _endpoint.set(name)
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN
+
+
+class Prompt:
+    """One call site: template, system-instruction flag, input cap, reply estimate."""
+
+    def __init__(self, name: str, template: str, system: bool = False,
+                 max_input_chars: int | None = None, output_tokens: int = 400):
+        self.name = name
+        self.template = template
+        self.system = system
+        self.max_input_chars = max_input_chars
+        self.output_tokens = output_tokens
+        PROMPTS[name] = self
+
+    def render(self, **fields) -> str:
+        """The prompt for these fields, with "text" clipped to max_input_chars."""
+        if "text" in fields:
+            fields["text"] = self.clip(fields["text"])
+        return self.template.format(**fields)
+
+    def clip(self, text: str) -> str:
+        limit = self.max_input_chars
+        if limit is None or len(text) <= limit:
+            return text
+        clipped = text[:limit].rsplit(" ", 1)[0] or text[:limit]
+        logger.info(f"[Prompts] {self.name}: message clipped {len(text)} → {len(clipped)} chars")
+        return clipped
+
+    def input_tokens(self, prompt: str) -> int:
+        """Prompt tokens sent: the prompt plus the system instruction, if any."""
+        return estimate_tokens(prompt) + (SYSTEM_TOKENS if self.system else 0)
+
+    def estimate_tokens(self, prompt: str) -> int:
+        """Prompt + expected reply tokens, for the rate limiter's TPM bucket."""
+        return self.input_tokens(prompt) + self.output_tokens
+
+    def stats(self) -> dict:
+        return {
+            "systemPrompt": self.system,
+            "maxInputChars": self.max_input_chars,
+            "templateTokens": self.input_tokens(self.template),
+            "outputTokensEstimate": self.output_tokens,
+        }
+
+
+def get(name: str) -> Prompt:
+    """The registry entry for a call site; "general" for an unknown one."""
+    return PROMPTS.get(name) or PROMPTS["general"]
+
+
+# ── Token accounting ───────────────────────────────────────────────────────
+_lock = threading.Lock()
+_by_endpoint: dict[str, dict] = {}
+_by_site: dict[str, dict] = {}
+
+
+def record_usage(site: str, prompt_tokens: int, response_tokens: int, reported: bool) -> None:
+    """Count one completed Gemini call under the current endpoint and `site`."""
+    with _lock:
+        for table, key in ((_by_endpoint, _endpoint.get()), (_by_site, site)):
+            row = table.setdefault(key, {"calls": 0, "promptTokens": 0, "responseTokens": 0, "estimated": 0})
+            row["calls"] += 1
+            row["promptTokens"] += prompt_tokens
+            row["responseTokens"] += response_tokens
+            row["estimated"] += 0 if reported else 1
+
+
+def stats() -> dict:
+    """Per-endpoint and per-site token counters, plus each site's budget."""
+    with _lock:
+        endpoints = {name: _with_averages(row) for name, row in _by_endpoint.items()}
+        used = {name: _with_averages(row) for name, row in _by_site.items()}
+    return {
+        "endpoints": endpoints,
+        "sites": {name: {**prompt.stats(), **used.get(name, {})} for name, prompt in PROMPTS.items()},
+    }
+
+
+def _with_averages(row: dict) -> dict:
+    calls = row["calls"]
+    return {
+        **row,
+        "avgPromptTokens": round(row["promptTokens"] / calls) if calls else 0,
+        "avgResponseTokens": round(row["responseTokens"] / calls) if calls else 0,
+    }
+
+
+# ── System instruction (triage only) ───────────────────────────────────────
+SYSTEM_PROMPT = """You are ArogyaSaarthi AI, a responsible AI health triage assistant designed for India.
+Your purpose is to guide users safely to the appropriate level of care based on symptoms.
+
+ABSOLUTE RULES — never violate these:
+- Do NOT diagnose any disease
+- Do NOT prescribe or name any medication or dosage
+- Do NOT replace a doctor
+- Do NOT invent symptoms or conditions not mentioned by the user
+- Do NOT output specific facility names, addresses, or phone numbers
+- If uncertain, be conservative (prefer moderate over low urgency)
+- Always include a disclaimer
+
+EMERGENCY DETECTION — if message contains any of these, urgency MUST be "emergency":
+chest pain, severe breathlessness, unconscious, not responding, seizure, convulsion,
+heavy bleeding, stroke, blue lips, suicidal, self-harm, infant high fever lethargic,
+severe allergic reaction, snake bite, poisoning
+
+OUTPUT: Return ONLY valid JSON. No markdown. No explanation. No extra text.
+"""
+SYSTEM_TOKENS = estimate_tokens(SYSTEM_PROMPT)
+
+
+# ── Triage ─────────────────────────────────────────────────────────────────
+TRIAGE = Prompt("triage", """Patient message (language: {language}):
+\"{text}\"
+
+{schema}Rules:
+- urgency_level must be exactly one of: low, moderate, urgent, emergency
+- recommended_next_steps: 2-5 items, NO medicine names
+- warning_signs: 3-5 items
+- clarifying_question: one question string if symptoms are vague, else null
+- disclaimer: always include "This is not a medical diagnosis. If symptoms worsen or you feel unsafe, seek professional care."
+""", system=True, max_input_chars=2000, output_tokens=350)
+
+REPAIR = Prompt("repair", """Your previous response was not valid JSON or had schema errors.
+{schema}Original patient message: \"{text}\"
+""", system=True, max_input_chars=2000, output_tokens=350)
+
+
+# ── Intent / analyze / extraction / scope ──────────────────────────────────
+INTENT = Prompt("intent", """You are a health assistant for a rural triage system in India.
+Analyze the patient message and return ONLY valid JSON — no markdown, no explanation.
+
+STRICT RULES:
+- Do NOT diagnose any disease
+- Do NOT suggest medicines or treatments
+- Do NOT assign urgency or care level
+- Only classify intent and extract what the patient explicitly mentions
+
+{schema}Intent rules:
+- SMALL_TALK: greetings, thanks, ok, bye, test, or NO health content
+- CLARIFICATION_REQUIRED: vague health complaint with no specific symptom
+- SYMPTOMS: contains at least one specific symptom (fever, cough, chest pain, etc.)
+
+For SMALL_TALK reply: warm, ask to describe symptoms. Language: {language_name}
+For CLARIFICATION_REQUIRED reply: ask ONE specific follow-up. Language: {language_name}
+For SYMPTOMS: reply must be null
+
+Patient language: {language}
+Patient message: {text}
+
+JSON only:""", max_input_chars=2000, output_tokens=200)
+
+ANALYZE = Prompt("analyze", """You are the message analyzer for ArogyaSaarthi, a health navigation assistant for rural India.
+In one pass, classify the message's scope and intent and extract what the patient explicitly mentions.
+Return ONLY valid JSON — no markdown, no explanation.
+
+STRICT RULES:
+- Do NOT diagnose any disease
+- Do NOT suggest medicines or treatments
+- Do NOT assign urgency or care level
+
+{schema}Scope rules:
+- MEDICAL: symptoms, triage, red flags, clinic/hospital/PHC/CHC, booking, home care, emergency, health conditions
+- NON_MEDICAL_SAFE: greetings, small talk, basic factual non-medical questions
+- OUT_OF_SCOPE: requests for drug names, prescriptions, dosage, diagnosis, or topics unrelated to health navigation (finance, politics, creative writing)
+
+Intent rules:
+- SMALL_TALK: greetings, thanks, ok, bye, test, or NO health content
+- CLARIFICATION_REQUIRED: vague health complaint with no specific symptom
+- SYMPTOMS: contains at least one specific symptom (fever, cough, chest pain, etc.); reply must be null
+- reply for SMALL_TALK / CLARIFICATION_REQUIRED: friendly, in {language_name}
+
+Patient language: {language}
+Patient message: {text}
+
+JSON only:""", max_input_chars=2000, output_tokens=250)
+
+EXTRACT = Prompt("extract", """You are a medical symptom extraction assistant for a rural health triage system in India.
+Extract structured symptom information from the patient's message below.
+
+STRICT RULES:
+- Do NOT diagnose any disease
+- Do NOT suggest any medicines or treatments
+- Do NOT classify urgency or severity beyond what the patient states
+- Only extract what the patient explicitly mentions
+- Output ONLY valid JSON, no explanation, no markdown
+
+{schema}Patient language hint: {language}
+Patient message: {text}
+
+Respond with JSON only.""", max_input_chars=2000, output_tokens=150)
+
+SCOPE = Prompt("scope", """You are a scope classifier for ArogyaSaarthi, a medical navigation assistant for rural India.
+Classify the user message into exactly one scope. Return ONLY valid JSON — no markdown, no explanation.
+
+Scopes:
+- MEDICAL: symptoms, triage, red flags, clinic/hospital/PHC/CHC, booking, home care, emergency, health conditions
+- NON_MEDICAL_SAFE: greetings, general small talk, basic factual non-medical questions (geography, math, weather, jokes)
+- OUT_OF_SCOPE: requests for drug names, prescriptions, diagnosis, medication advice, or topics completely unrelated to health navigation (finance, politics, creative writing)
+
+HARD RULES:
+- Any mention of "which medicine", "what drug", "prescribe", "diagnose me", "tablet", "dosage" → OUT_OF_SCOPE
+- Any symptom, body part complaint, clinic, hospital, PHC, booking → MEDICAL
+- Greetings, thanks, general knowledge → NON_MEDICAL_SAFE
+
+{schema}Message: {text}
+JSON only:""", max_input_chars=1000, output_tokens=20)
+
+
+# ── Free text (explanation, general answer) ────────────────────────────────
+EXPLAIN = Prompt("explain", """You are a compassionate health assistant for a rural health triage system in India.
+Write a short, friendly explanation for a patient based on the triage result below.
+
+STRICT RULES:
+- Do NOT diagnose any disease
+- Do NOT suggest any medicines or treatments
+- Do NOT contradict the urgency level given
+- Keep it under 85 words
+- Write in {language_name} language
+- Be warm, simple, and reassuring
+
+Triage result:
+- Urgency: {urgency}
+- Recommended care: {care_level}
+- Act within: {time_to_act}
+- Main reasons: {top_reasons}
+- Watch for: {watch_for}
+
+Write only the explanation text, nothing else.""", output_tokens=250)
+
+GENERAL = Prompt("general", """You are ArogyaSaarthi, a friendly health navigation assistant for rural India.
+The user is asking a general (non-medical) question. Answer briefly and helpfully in {language_name}.
+STRICT RULES:
+- Do NOT provide any medical advice, diagnosis, or medication suggestions.
+- If the question touches on health/medicine, decline and say you can only help with symptoms.
+- Keep the answer to 2-3 sentences max.
+- Be warm and friendly.
+- Do NOT mention drug names, dosages, or treatments.
+
+User message: {text}
+Answer in {language_name}:""", max_input_chars=1000, output_tokens=150)
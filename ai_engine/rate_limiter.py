@@ -0,0 +1,286 @@
+"""
+Client-side rate limiter for the shared Gemini quota.
+
+- Two token buckets refilled continuously: requests per minute (RPM) and
+  tokens per minute (TPM); a call takes one request and its estimated tokens
+- Callers that cannot go now wait in a priority queue — by class (triage
+  first, general answers last), FIFO within a class — so a burst of
+  low-priority calls cannot take the quota a triage needs
+- A caller whose estimated wait exceeds its budget fails fast (RateLimited)
+  and uses its local fallback instead of queueing
+- Token estimates are settled against the usage Gemini reports
+
+Sync callers (threads) and async callers (event loops) share the buckets and
+the queue. A limit of 0 disables that bucket; both 0 disables the limiter.
+"""
+
+import asyncio
+import heapq
+import itertools
+import threading
+import time
+from collections import deque
+
+# Lower rank is served first.
+PRIORITIES = {
+    "triage": 0, "repair": 0,
+    "intent": 1, "extract": 1, "analyze": 1,
+    "explain": 2,
+    "scope": 3,
+    "general": 4,
+}
+_WAIT_SAMPLES = 1024     # recent waits kept for the percentiles
+
+
+class RateLimited(Exception):
+    """No quota within the caller's wait budget."""
+
+
+class _Bucket:
+    __slots__ = ("capacity", "rate", "level", "updated")
+
+    def __init__(self, per_minute: int):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now: float) -> None:
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def cost(self, amount: float) -> float:
+        """A call bigger than the whole bucket only needs a full bucket."""
+        return min(amount, self.capacity)
+
+    def eta(self, amount: float) -> float:
+        """Seconds until `amount` is available."""
+        return max(0.0, (self.cost(amount) - self.level) / self.rate)
+
+
+class _Waiter:
+    __slots__ = ("priority", "tokens", "granted", "cancelled", "event", "loop", "future")
+
+    def __init__(self, priority: str, tokens: int):
+        self.priority = priority
+        self.tokens = tokens
+        self.granted = False
+        self.cancelled = False
+        self.event = None     # sync callers
+        self.loop = None      # async callers
+        self.future = None
+
+    def wake(self) -> None:
+        if self.event is not None:
+            self.event.set()
+        elif not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(_resolve, self.future)
+
+
+def _resolve(future: asyncio.Future) -> None:
+    if not future.done():
+        future.set_result(None)
+
+
+class RateLimiter:
+    """Thread-safe RPM + TPM limiter. acquire() / aacquire() before a call,
+    settle() with the actual token usage after it (refund() if it never ran)."""
+
+    def __init__(self, rpm: int = 0, tpm: int = 0, name: str = "gemini"):
+        self.name = name
+        self.rpm = rpm
+        self.tpm = tpm
+        self._requests = _Bucket(rpm) if rpm > 0 else None
+        self._tokens = _Bucket(tpm) if tpm > 0 else None
+        self._lock = threading.Lock()
+        self._queue = []                  # heap of (rank, seq, waiter)
+        self._seq = itertools.count()
+        self._depth = {name: 0 for name in PRIORITIES}
+
+        self._granted = 0
+        self._queued = 0
+        self._rejected = 0
+        self._timed_out = 0
+        self._waits = deque(maxlen=_WAIT_SAMPLES)   # seconds, calls that queued
+
+    @property
+    def enabled(self) -> bool:
+        return self._requests is not None or self._tokens is not None
+
+    # ── Public API ─────────────────────────────────────────────────────
+    def acquire(self, priority: str, tokens: int, max_wait: float) -> float:
+        """Block until the call may go. Returns seconds waited; raises RateLimited
+        if that would take longer than max_wait."""
+        start = time.monotonic()
+        waiter = self._enqueue(priority, tokens, max_wait, start)
+        if waiter is None:
+            return 0.0
+        waiter.event = threading.Event()
+        while True:
+            pause = self._poll(waiter, start + max_wait)
+            if pause is None:
+                return self._waited(start)
+            waiter.event.wait(pause)
+
+    async def aacquire(self, priority: str, tokens: int, max_wait: float) -> float:
+        """Async acquire — waits without blocking the event loop."""
+        start = time.monotonic()
+        waiter = self._enqueue(priority, tokens, max_wait, start)
+        if waiter is None:
+            return 0.0
+        waiter.loop = asyncio.get_running_loop()
+        waiter.future = waiter.loop.create_future()
+        try:
+            while True:
+                pause = self._poll(waiter, start + max_wait)
+                if pause is None:
+                    return self._waited(start)
+                await asyncio.wait([waiter.future], timeout=pause)
+        except asyncio.CancelledError:
+            self._abandon(waiter)
+            raise
+
+    def settle(self, estimated: int, used: int | None) -> None:
+        """Correct the token bucket once the real usage is known."""
+        if self._tokens is None or not used:
+            return
+        with self._lock:
+            self._tokens.level = min(self._tokens.capacity, self._tokens.level + estimated - used)
+
+    def refund(self, tokens: int) -> None:
+        """Return a grant that was never used (e.g. the circuit refused the call)."""
+        with self._lock:
+            if self._requests is not None:
+                self._requests.level = min(self._requests.capacity, self._requests.level + 1)
+            if self._tokens is not None:
+                self._tokens.level = min(self._tokens.capacity, self._tokens.level + self._tokens.cost(tokens))
+            self._dispatch(time.monotonic())
+
+    def stats(self) -> dict:
+        with self._lock:
+            waits = sorted(self._waits)
+            return {
+                "enabled": self.enabled,
+                "requestsPerMinute": self.rpm,
+                "tokensPerMinute": self.tpm,
+                "queueDepth": sum(self._depth.values()),
+                "queueByPriority": dict(self._depth),
+                "granted": self._granted,
+                "queued": self._queued,
+                "rejected": self._rejected,
+                "timedOut": self._timed_out,
+                "waitMs": {
+                    "mean": round(sum(waits) / len(waits) * 1000) if waits else 0,
+                    "p95": round(waits[int(len(waits) * 0.95)] * 1000) if waits else 0,
+                    "max": round(waits[-1] * 1000) if waits else 0,
+                },
+            }
+
+    # ── Internals ──────────────────────────────────────────────────────
+    def _enqueue(self, priority: str, tokens: int, max_wait: float, now: float) -> _Waiter | None:
+        """Take quota right away (None) or queue a waiter; RateLimited if the wait won't fit."""
+        if not self.enabled:
+            return None
+        priority = priority if priority in PRIORITIES else "general"
+        with self._lock:
+            self._dispatch(now)
+            if not self._queue and self._fits(tokens):
+                self._take(tokens)
+                return None
+            if self._eta(PRIORITIES[priority], tokens) > max_wait:
+                self._rejected += 1
+                raise RateLimited(f"{self.name}: {priority} call would wait more than {max_wait:.1f}s")
+            waiter = _Waiter(priority, tokens)
+            heapq.heappush(self._queue, (PRIORITIES[priority], next(self._seq), waiter))
+            self._depth[priority] += 1
+            self._queued += 1
+            return waiter
+
+    def _poll(self, waiter: _Waiter, give_up_at: float) -> float | None:
+        """None once granted, else how long to sleep before checking again."""
+        now = time.monotonic()
+        with self._lock:
+            self._dispatch(now)
+            if waiter.granted:
+                return None
+            if now >= give_up_at:
+                self._cancel(waiter)
+                self._timed_out += 1
+                raise RateLimited(f"{self.name}: {waiter.priority} call timed out in the queue")
+            return max(0.001, min(give_up_at - now, self._head_eta()))
+
+    def _abandon(self, waiter: _Waiter) -> None:
+        with self._lock:
+            if not waiter.granted:
+                self._cancel(waiter)
+                return
+        self.refund(waiter.tokens)
+
+    def _cancel(self, waiter: _Waiter) -> None:
+        waiter.cancelled = True
+        self._depth[waiter.priority] -= 1
+        self._dispatch(time.monotonic())
+
+    def _waited(self, start: float) -> float:
+        waited = time.monotonic() - start
+        with self._lock:
+            self._waits.append(waited)
+        return waited
+
+    def _dispatch(self, now: float) -> None:
+        """Grant queued calls in priority order while the buckets allow."""
+        self._refill(now)
+        while self._queue:
+            waiter = self._queue[0][2]
+            if waiter.cancelled:
+                heapq.heappop(self._queue)
+                continue
+            if not self._fits(waiter.tokens):
+                break
+            heapq.heappop(self._queue)
+            self._take(waiter.tokens)
+            self._depth[waiter.priority] -= 1
+            waiter.granted = True
+            waiter.wake()
+
+    def _refill(self, now: float) -> None:
+        for bucket in (self._requests, self._tokens):
+            if bucket is not None:
+                bucket.refill(now)
+
+    def _fits(self, tokens: int) -> bool:
+        return ((self._requests is None or self._requests.level >= 1)
+                and (self._tokens is None or self._tokens.level >= self._tokens.cost(tokens)))
+
+    def _take(self, tokens: int) -> None:
+        if self._requests is not None:
+            self._requests.level -= 1
+        if self._tokens is not None:
+            self._tokens.level -= self._tokens.cost(tokens)
+        self._granted += 1
+
+    def _eta(self, rank: int, tokens: int) -> float:
+        """Estimated wait for a new call of this rank: everything queued at the
+        same or a higher priority goes first."""
+        requests, demand = 1, tokens
+        for r, _, waiter in self._queue:
+            if r <= rank and not waiter.cancelled:
+                requests += 1
+                demand += self._tokens.cost(waiter.tokens) if self._tokens is not None else 0
+        eta = 0.0
+        if self._requests is not None:
+            eta = max(eta, (requests - self._requests.level) / self._requests.rate)
+        if self._tokens is not None:
+            eta = max(eta, (demand - self._tokens.level) / self._tokens.rate)
+        return max(0.0, eta)
+
+    def _head_eta(self) -> float:
+        """Seconds until the head of the queue fits (called right after _dispatch,
+        so the head is never a cancelled waiter)."""
+        if not self._queue:
+            return 0.0
+        waiter = self._queue[0][2]
+        eta = self._requests.eta(1) if self._requests is not None else 0.0
+        if self._tokens is not None:
+            eta = max(eta, self._tokens.eta(waiter.tokens))
+        return eta
@@ -0,0 +1,180 @@
+"""
+Bounded in-memory response cache:
+- LRU eviction by entry count and/or byte budget
+- Per-entry TTL; expired entries removed proactively by a timer-wheel janitor
+- Compact entries (__slots__, JSON payload, zlib-compressed when large)
+- Hit / miss / eviction / expiry counters via stats()
+"""
+
+import json
+import logging
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+COMPRESS_MIN_BYTES = 512   # payloads smaller than this are stored uncompressed
+
+
+class _Entry:
+    __slots__ = ("payload", "compressed", "expires")
+
+    def __init__(self, payload: bytes, compressed: bool, expires: float):
+        self.payload = payload
+        self.compressed = compressed
+        self.expires = expires
+
+
+class ResponseCache:
+    """Thread-safe LRU + TTL cache of JSON-serializable values.
+
+    Values are serialized on set and decoded on get, so callers always get a
+    fresh copy and can mutate it freely. `max_entries` / `max_bytes` of 0
+    mean "no limit" for that dimension.
+    """
+
+    def __init__(self, ttl: float, max_entries: int = 0, max_bytes: int = 0,
+                 tick: float = 1.0, name: str = "cache"):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes          # budget for stored payload bytes
+        self.name = name
+        self._entries: OrderedDict[str, _Entry] = OrderedDict()
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._expirations = 0
+
+        # Timer wheel: slot i holds keys expiring in tick i (mod slots).
+        self._tick = tick
+        self._slots = [set() for _ in range(max(2, int(ttl / tick) + 2))]
+        self._janitor = None
+
+    # ── Public API ─────────────────────────────────────────────────────
+    def get(self, key: str):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._misses += 1
+                return None
+            if entry.expires <= time.time():
+                self._drop(key, entry)
+                self._expirations += 1
+                self._misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+            payload, compressed = entry.payload, entry.compressed
+        if compressed:
+            payload = zlib.decompress(payload)
+        return json.loads(payload)
+
+    def set(self, key: str, value, ttl: float | None = None) -> None:
+        payload = json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        compressed = len(payload) >= COMPRESS_MIN_BYTES
+        if compressed:
+            payload = zlib.compress(payload)
+        if self.max_bytes and len(payload) > self.max_bytes:
+            return  # larger than the whole budget — not worth caching
+        expires = time.time() + (self.ttl if ttl is None else ttl)
+
+        with self._lock:
+            old = self._entries.get(key)
+            if old is not None:
+                self._drop(key, old)
+            self._entries[key] = _Entry(payload, compressed, expires)
+            self._bytes += len(payload)
+            self._slots[self._slot(expires)].add(key)
+            self._evict()
+        self._ensure_janitor()
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._drop(key, entry)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            for slot in self._slots:
+                slot.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "maxEntries": self.max_entries,
+                "maxBytes": self.max_bytes,
+                "hits": self._hits,
+                "misses": self._misses,
+                "hitRate": round(self._hits / lookups, 4) if lookups else 0.0,
+                "evictions": self._evictions,
+                "expirations": self._expirations,
+            }
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    # ── Internals (call with lock held) ────────────────────────────────
+    def _slot(self, expires: float) -> int:
+        return int(expires / self._tick) % len(self._slots)
+
+    def _drop(self, key: str, entry: _Entry) -> None:
+        del self._entries[key]
+        self._bytes -= len(entry.payload)
+        self._slots[self._slot(entry.expires)].discard(key)
+
+    def _evict(self) -> None:
+        while self._entries and (
+            (self.max_entries and len(self._entries) > self.max_entries)
+            or (self.max_bytes and self._bytes > self.max_bytes)
+        ):
+            key, entry = next(iter(self._entries.items()))
+            self._drop(key, entry)
+            self._evictions += 1
+
+    # ── Janitor ────────────────────────────────────────────────────────
+    def _ensure_janitor(self) -> None:
+        if self._janitor is not None and self._janitor.is_alive():
+            return
+        with self._lock:
+            if self._janitor is not None and self._janitor.is_alive():
+                return
+            self._janitor = threading.Thread(target=self._run_janitor, name=f"{self.name}-janitor", daemon=True)
+            self._janitor.start()
+
+    def _run_janitor(self) -> None:
+        last = int(time.time() / self._tick)
+        while True:
+            time.sleep(self._tick)
+            now_tick = int(time.time() / self._tick)
+            # Sweep every tick that has fully elapsed since the last run (at most one full turn).
+            for t in range(last, now_tick)[-len(self._slots):]:
+                self._sweep_slot(t % len(self._slots))
+            last = max(last, now_tick)
+
+    def _sweep_slot(self, index: int) -> int:
+        """Remove expired entries filed under one wheel slot. Returns count removed."""
+        now = time.time()
+        removed = 0
+        with self._lock:
+            slot = self._slots[index]
+            for key in list(slot):
+                entry = self._entries.get(key)
+                if entry is None:
+                    slot.discard(key)
+                elif entry.expires <= now:
+                    self._drop(key, entry)
+                    self._expirations += 1
+                    removed += 1
+        if removed:
+            logger.debug(f"[Cache:{self.name}] janitor expired {removed} entries")
+        return removed
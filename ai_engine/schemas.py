@@ -0,0 +1,167 @@
+"""
+Response schemas for every JSON Gemini call — one definition per call type.
+
+Each schema is a dict in the OpenAPI subset the Gemini SDK accepts as
+`response_schema` (type, properties, required, enum, items, nullable,
+min_items / max_items, property_ordering, description). The same dict:
+- is sent as the response schema in structured-output mode (gemini_client)
+- renders the schema text pasted into the prompt when that mode is off (describe)
+- drives triage validation (check, used by _validate_triage_schema)
+"""
+
+URGENCY_LEVELS = ["low", "moderate", "urgent", "emergency"]
+INTENTS = ["SMALL_TALK", "SYMPTOMS", "CLARIFICATION_REQUIRED"]
+SCOPES = ["MEDICAL", "NON_MEDICAL_SAFE", "OUT_OF_SCOPE"]
+SEVERITIES = ["mild", "moderate", "severe", "unknown"]
+DURATION_UNITS = ["days", "hours", "weeks", "unknown"]
+LANGUAGES = ["en", "hi", "mr", "ta", "te"]
+
+
+def _obj(properties: dict, required: list | None = None, description: str | None = None) -> dict:
+    schema = {"type": "OBJECT", "properties": properties, "property_ordering": list(properties),
+              "required": required if required is not None else list(properties)}
+    if description:
+        schema["description"] = description
+    return schema
+
+
+def _str(description: str, enum: list | None = None, nullable: bool = False) -> dict:
+    schema = {"type": "STRING", "description": description}
+    if enum:
+        schema["enum"] = enum
+    if nullable:
+        schema["nullable"] = True
+    return schema
+
+
+def _num(description: str, nullable: bool = False) -> dict:
+    schema = {"type": "NUMBER", "description": description}
+    if nullable:
+        schema["nullable"] = True
+    return schema
+
+
+def _list(description: str, min_items: int | None = None, max_items: int | None = None) -> dict:
+    schema = {"type": "ARRAY", "description": description, "items": {"type": "STRING"}}
+    if min_items is not None:
+        schema["min_items"] = min_items
+    if max_items is not None:
+        schema["max_items"] = max_items
+    return schema
+
+
+# ── Triage ─────────────────────────────────────────────────────────────────
+# urgency_level comes second so a streamed reply yields it early.
+TRIAGE = _obj({
+    "symptom_summary": _str("brief plain-language summary of user symptoms"),
+    "urgency_level": _str("urgency", enum=URGENCY_LEVELS),
+    "urgency_reason": _str("1-2 sentence explanation of urgency choice"),
+    "recommended_next_steps": _list("next steps, no medicine names", min_items=2, max_items=6),
+    "warning_signs": _list("signs that mean the patient should seek care sooner", min_items=2, max_items=6),
+    "clarifying_question": _str("one question if the information is insufficient", nullable=True),
+    "disclaimer": _str("This is not a medical diagnosis. If symptoms worsen or you feel unsafe, "
+                       "seek professional care."),
+}, required=["symptom_summary", "urgency_level", "urgency_reason",
+             "recommended_next_steps", "warning_signs", "disclaimer"])
+
+# ── Intent / extraction / scope ────────────────────────────────────────────
+_DURATION = _obj({
+    "value": _num("number of units", nullable=True),
+    "unit": _str("unit", enum=DURATION_UNITS),
+})
+_EXTRACTED = {
+    "primaryComplaint": _str("main symptom, or unknown"),
+    "duration": _DURATION,
+    "severity": _str("severity the patient states", enum=SEVERITIES),
+    "associatedSymptoms": _list("other symptoms mentioned"),
+    "redFlagsDetected": _list("red-flag symptoms like chest pain, breathlessness, unconscious, "
+                              "seizure, severe bleeding"),
+}
+
+EXTRACTION = _obj({
+    **_EXTRACTED,
+    "languageDetected": _str("language of the message", enum=LANGUAGES),
+    "confidence": _num("0.0 to 1.0"),
+    "needsFollowUp": {"type": "BOOLEAN", "description": "true if a follow-up question is needed"},
+    "followUpQuestion": _str("one follow-up question", nullable=True),
+}, required=list(_EXTRACTED))
+
+_INTENT_FIELDS = {
+    "intent": _str("message intent", enum=INTENTS),
+    "reply": _str("friendly reply in the patient's language for SMALL_TALK or CLARIFICATION_REQUIRED, "
+                  "null for SYMPTOMS", nullable=True),
+    **_EXTRACTED,
+    "confidence": _num("0.0 to 1.0"),
+    "followUpQuestion": _str("one clarifying question", nullable=True),
+}
+INTENT = _obj(_INTENT_FIELDS, required=["intent"])
+
+ANALYZE = _obj({"scope": _str("message scope", enum=SCOPES), **_INTENT_FIELDS}, required=["scope", "intent"])
+
+SCOPE = _obj({
+    "scope": _str("message scope", enum=SCOPES),
+    "confidence": _num("0.0 to 1.0"),
+}, required=["scope"])
+
+
+# ── Rendering / checking ───────────────────────────────────────────────────
+def describe(schema: dict, indent: int = 0) -> str:
+    """The schema as the JSON-shaped text pasted into prompts."""
+    pad = "  " * (indent + 1)
+    lines = [f'{pad}"{key}": {_describe_value(prop, indent + 1)}' for key, prop in schema["properties"].items()]
+    return "{\n" + ",\n".join(lines) + "\n" + "  " * indent + "}"
+
+
+def _describe_value(prop: dict, indent: int) -> str:
+    kind = prop["type"]
+    if kind == "OBJECT":
+        return describe(prop, indent)
+    if kind == "ARRAY":
+        return f'["{prop.get("description", "item")}"]'
+    if kind == "STRING":
+        text = " | ".join(prop["enum"]) if "enum" in prop else prop.get("description", "string")
+    elif kind == "NUMBER":
+        text = f"number ({prop['description']})" if prop.get("description") else "number"
+    else:
+        text = kind.lower()
+    if prop.get("nullable"):
+        return f'"{text}" or null' if kind == "STRING" else f"{text} or null"
+    return f'"{text}"' if kind == "STRING" else text
+
+
+def check(schema: dict, data) -> list[str]:
+    """Schema violations in a parsed reply: missing keys, values outside an enum
+    (compared case-insensitively), list lengths out of bounds."""
+    if not isinstance(data, dict):
+        return ["not a dict"]
+    issues = [f"missing key: {key}" for key in schema.get("required", []) if key not in data]
+    if issues:
+        return issues
+    for key, prop in schema["properties"].items():
+        if key not in data or (data[key] is None and prop.get("nullable")):
+            continue
+        value = data[key]
+        if "enum" in prop and str(value).lower().strip() not in {e.lower() for e in prop["enum"]}:
+            issues.append(f"invalid {key}: {str(value).lower().strip()}")
+        if prop["type"] == "ARRAY":
+            lo, hi = prop.get("min_items", 0), prop.get("max_items")
+            if not isinstance(value, list) or len(value) < lo or (hi is not None and len(value) > hi):
+                got = len(value) if isinstance(value, list) else type(value)
+                issues.append(f"{key} must be list of {lo}-{hi if hi is not None else 'n'} items, got {got}")
+    return issues
+
+
+def example(schema: dict):
+    """A minimal value that satisfies the schema (offline stub replies)."""
+    kind = schema["type"]
+    if kind == "OBJECT":
+        return {key: example(prop) for key, prop in schema["properties"].items()}
+    if kind == "ARRAY":
+        return [example(schema["items"]) for _ in range(max(1, schema.get("min_items", 1)))]
+    if kind == "STRING":
+        return schema["enum"][0] if "enum" in schema else "stub"
+    if kind == "NUMBER":
+        return 0.9
+    if kind == "INTEGER":
+        return 1
+    return False
@@ -0,0 +1,95 @@
+"""
+Singleflight — coalesce identical in-flight calls.
+
+Concurrent callers with the same key share one execution: the first caller
+(the leader) runs the work, everyone else waits for and receives its result.
+Sync callers coalesce across threads, async callers across tasks on the same
+event loop. The key is released as soon as the call finishes, so this never
+serves stale results — caching is the cache's job.
+"""
+
+import asyncio
+import threading
+import weakref
+
+
+class _Call:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    def __init__(self, name: str = "singleflight"):
+        self.name = name
+        self._lock = threading.Lock()
+        self._calls: dict[str, _Call] = {}
+        self._tasks = weakref.WeakKeyDictionary()  # event loop -> {key: asyncio.Task}
+        self._executions = 0
+        self._coalesced = 0
+
+    def do(self, key: str, fn, timeout: float | None = None) -> tuple:
+        """Run fn() once per key across threads. Returns (result, is_leader).
+        A follower waits at most `timeout` seconds, then raises TimeoutError."""
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                self._coalesced += 1
+                leader = False
+            else:
+                call = self._calls[key] = _Call()
+                self._executions += 1
+                leader = True
+
+        if not leader:
+            if not call.done.wait(timeout):
+                raise TimeoutError(f"{self.name}: in-flight call still running after {timeout}s")
+            if call.error is not None:
+                raise call.error
+            return call.result, False
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+        return call.result, True
+
+    async def ado(self, key: str, coro_fn, timeout: float | None = None) -> tuple:
+        """Await coro_fn() once per key on this event loop. Returns (result, is_leader).
+
+        The shared work runs as its own task, so a caller that is cancelled
+        (e.g. the client disconnected) or gives up after `timeout` seconds
+        (asyncio.TimeoutError) does not cancel it for the others.
+        """
+        loop = asyncio.get_running_loop()
+        tasks = self._tasks.get(loop)
+        if tasks is None:
+            tasks = self._tasks[loop] = {}
+
+        task = tasks.get(key)
+        leader = task is None
+        if leader:
+            task = tasks[key] = loop.create_task(coro_fn())
+            task.add_done_callback(lambda t, k=key: tasks.pop(k, None) if tasks.get(k) is t else None)
+            self._executions += 1
+        else:
+            self._coalesced += 1
+        return await asyncio.wait_for(asyncio.shield(task), timeout), leader
+
+    def stats(self) -> dict:
+        with self._lock:
+            in_flight = len(self._calls)
+        in_flight += sum(len(t) for t in list(self._tasks.values()))
+        return {
+            "inFlight": in_flight,
+            "executions": self._executions,
+            "coalesced": self._coalesced,
+        }
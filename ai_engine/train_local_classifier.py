@@ -0,0 +1,214 @@
+"""
+Train / evaluate the local scope and intent classifier (local_classifier.py).
+
+Training data: the hand-labeled data/intent_scope_corpus.jsonl plus messages
+generated from the extractor and intent dictionaries (symptom phrases in
+duration templates, greetings, vague-health phrases) in all five languages.
+Evaluation uses only hand-labeled messages: --holdout of them (stratified) is
+kept out of training and reported on — accuracy, and the coverage / accuracy
+of the answers the service would take locally (local_classifier.decide at
+--threshold, default LOCAL_MODEL_MIN_CONFIDENCE) — and lists each wrong one
+of those. Then a per-message latency benchmark.
+
+data/local_classifier_regression.jsonl (never trained on) lists messages with
+a symptom or a vague health complaint: any of them answered locally with the
+wrong label is listed too, and --save then writes nothing and exits 1.
+
+Usage: python train_local_classifier.py [--epochs 300] [--holdout 0.25] [--threshold 0.95] [--save]
+--save retrains on every example and writes models/scope.npy and models/intent.npy.
+"""
+
+import argparse
+import json
+import os
+import random
+import re
+import sys
+import time
+
+import numpy as np
+
+from local_classifier import (
+    MIN_CONFIDENCE, N_FEATURES, MODEL_DIR, SCOPE_LABELS, INTENT_LABELS, LinearHead, decide, features, softmax,
+)
+
+CORPUS = os.path.join(os.path.dirname(__file__), "data", "intent_scope_corpus.jsonl")
+REGRESSION = os.path.join(os.path.dirname(__file__), "data", "local_classifier_regression.jsonl")
+
+DURATION_TEMPLATES = {
+    "en": ["{s}", "I have {s}", "{s} for {n} days", "{s} since {n} days", "having {s} since yesterday",
+           "my child has {s}", "{s} and weakness"],
+    "hi": ["{s} है", "{n} दिन से {s} है", "मुझे {s} है", "mujhe {s} hai", "{n} din se {s} hai"],
+    "mr": ["{s} आहे", "{n} दिवसांपासून {s} आहे", "मला {s} आहे"],
+    "ta": ["{s}", "{n} நாட்களாக {s}", "எனக்கு {s}"],
+    "te": ["{s}", "{n} రోజులుగా {s}", "నాకు {s} ఉంది"],
+}
+
+
+def _literal(pattern: str) -> str | None:
+    """Plain phrase a simple keyword pattern matches, or None for real regexes."""
+    text = re.sub(r"\\s[*+]", " ", pattern.replace(r"\b", "")).strip("^$")
+    text = re.sub(r"\[\\s!\.\]\*", "", text)
+    return None if re.search(r"[\\()\[\]?*+|.{}]", text) else text
+
+
+def load_corpus(path: str = CORPUS) -> list[dict]:
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def generated_examples(rng: random.Random) -> list[dict]:
+    """Training messages built from the keyword dictionaries the local extractor uses."""
+    from nlp_extractor import SYMPTOM_KEYWORDS
+    from intent_gate import GREETINGS, VAGUE_HEALTH
+
+    rows = []
+    for by_lang in SYMPTOM_KEYWORDS.values():
+        for lang, patterns in by_lang.items():
+            for phrase in filter(None, map(_literal, patterns)):
+                for template in rng.sample(DURATION_TEMPLATES[lang], 2):
+                    rows.append({"text": template.format(s=phrase, n=rng.randint(1, 10)), "language": lang,
+                                 "scope": "MEDICAL", "intent": "SYMPTOMS"})
+    for lang, patterns in GREETINGS.items():
+        for pattern in patterns:
+            alternatives = re.match(r"\^\((.*)\)\[", pattern)
+            for phrase in (alternatives.group(1).split("|") if alternatives else [pattern]):
+                if _literal(phrase):
+                    rows.append({"text": phrase, "language": lang, "scope": "NON_MEDICAL_SAFE", "intent": "SMALL_TALK"})
+    for pattern in VAGUE_HEALTH:
+        phrase = _literal(pattern)
+        if phrase:
+            rows.append({"text": phrase, "language": "en", "scope": "MEDICAL", "intent": "CLARIFICATION_REQUIRED"})
+    return rows
+
+
+def _split(rows: list[dict], holdout: float, rng: random.Random) -> tuple[list, list]:
+    by_label = {}
+    for row in rows:
+        by_label.setdefault((row["scope"], row["intent"]), []).append(row)
+    train, test = [], []
+    for group in by_label.values():
+        group = group[:]
+        rng.shuffle(group)
+        k = int(round(len(group) * holdout))
+        test += group[:k]
+        train += group[k:]
+    return train, test
+
+
+def _encode(rows: list[dict], head: str, labels: tuple) -> tuple:
+    """Sparse design matrix as (feature index, row index) pairs plus label ids."""
+    rows = [r for r in rows if r.get(head)]
+    feats = [features(r["text"]) for r in rows]
+    cols = np.concatenate(feats) if feats else np.zeros(0, dtype=np.int64)
+    row_of = np.repeat(np.arange(len(rows)), [len(f) for f in feats])
+    y = np.array([labels.index(r[head]) for r in rows], dtype=np.int64)
+    return cols, row_of, y, rows
+
+
+def train_head(rows: list[dict], head: str, labels: tuple, epochs: int, l2: float = 1e-4,
+               lr: float = 0.05) -> np.ndarray:
+    """Softmax regression with Adam on the hashed features. Returns (N_FEATURES + 1, K) weights."""
+    cols, row_of, y, kept = _encode(rows, head, labels)
+    n, k = len(kept), len(labels)
+    w = np.zeros((N_FEATURES + 1, k), dtype=np.float64)
+    m, v = np.zeros_like(w), np.zeros_like(w)
+    onehot = np.eye(k)[y]
+    # Balance classes so the small ones (clarification, out-of-scope) are not drowned out.
+    weight = (n / (k * np.bincount(y, minlength=k)))[y][:, None]
+    for t in range(1, epochs + 1):
+        logits = np.zeros((n, k))
+        np.add.at(logits, row_of, w[cols])
+        logits += w[-1]
+        grad_rows = (softmax(logits) - onehot) * weight / n
+        grad = l2 * w
+        grad[-1] = 0
+        np.add.at(grad, cols, grad_rows[row_of])
+        grad[-1] += grad_rows.sum(axis=0)
+        m = 0.9 * m + 0.1 * grad
+        v = 0.999 * v + 0.001 * grad ** 2
+        w -= lr * (m / (1 - 0.9 ** t)) / (np.sqrt(v / (1 - 0.999 ** t)) + 1e-8)
+    return w.astype(np.float32)
+
+
+def evaluate(model: LinearHead, rows: list[dict], head: str, threshold: float) -> tuple[dict, list]:
+    """(metrics, confident errors): the errors are (row, predicted label, probability)
+    for wrong predictions local_classifier.decide lets through (app.py's keyword
+    guards may still send some of them on to Gemini)."""
+    rows = [r for r in rows if r.get(head)]
+    correct = confident = confident_correct = 0
+    errors = []
+    for r in rows:
+        label, prob = model.predict(r["text"])
+        hit = label == r[head]
+        correct += hit
+        if decide(model, r["text"], threshold) is not None:
+            confident += 1
+            confident_correct += hit
+            if not hit:
+                errors.append((r, label, prob))
+    n = len(rows) or 1
+    return {
+        "n": len(rows),
+        "accuracy": round(correct / n, 3),
+        "coverage": round(confident / n, 3),
+        "confidentAccuracy": round(confident_correct / confident, 3) if confident else None,
+    }, errors
+
+
+def benchmark(model: LinearHead, texts: list[str], rounds: int = 20) -> float:
+    """Mean µs per predict() call."""
+    t = time.perf_counter()
+    for _ in range(rounds):
+        for text in texts:
+            model.predict(text)
+    return (time.perf_counter() - t) / (rounds * len(texts)) * 1e6
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--epochs", type=int, default=300)
+    parser.add_argument("--holdout", type=float, default=0.25, help="fraction of hand-labeled data kept for evaluation")
+    parser.add_argument("--threshold", type=float, default=MIN_CONFIDENCE,
+                        help="confidence the service answers locally at (LOCAL_MODEL_MIN_CONFIDENCE)")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--save", action="store_true", help="retrain on all data and write models/*.npy")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    corpus = load_corpus()
+    regression = load_corpus(REGRESSION)
+    generated = generated_examples(rng)
+    train, test = _split(corpus, args.holdout, rng)
+    print(f"corpus {len(corpus)} hand-labeled (+{len(generated)} generated); "
+          f"train {len(train) + len(generated)}, held out {len(test)}")
+
+    for head, labels in (("scope", SCOPE_LABELS), ("intent", INTENT_LABELS)):
+        model = LinearHead(head, labels, train_head(train + generated, head, labels, args.epochs))
+        metrics, errors = evaluate(model, test, head, args.threshold)
+        print(f"{head:6s} held-out {metrics}")
+        _print_errors(head, "confident error", errors)
+        _print_errors(head, "regression", evaluate(model, regression, head, args.threshold)[1])
+
+        if args.save:
+            weights = train_head(corpus + generated, head, labels, args.epochs)
+            failures = evaluate(LinearHead(head, labels, weights), regression, head, args.threshold)[1]
+            if failures:
+                _print_errors(head, "regression", failures)
+                print(f"{head:6s} not saved: {len(failures)} regression message(s) answered locally with the wrong label")
+                sys.exit(1)
+            os.makedirs(MODEL_DIR, exist_ok=True)
+            np.save(os.path.join(MODEL_DIR, f"{head}.npy"), weights)
+            model = LinearHead(head, labels, weights)
+            print(f"{head:6s} saved models/{head}.npy ({weights.nbytes // 1024} KiB)")
+        print(f"{head:6s} {benchmark(model, [r['text'] for r in corpus]):.1f} µs/message")
+
+
+def _print_errors(head: str, kind: str, errors: list) -> None:
+    for row, label, prob in errors:
+        print(f"{head:6s}   {kind}: {row['text']!r} ({row['language']}) "
+              f"labelled {row[head]}, predicted {label} at {prob:.3f}")
+
+
+if __name__ == "__main__":
+    main()
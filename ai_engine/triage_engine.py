@@ -1,36 +1,41 @@
 """
 ArogyaSaarthi Triage Engine
 - Emergency keyword detection (rule-based, no LLM)
-- Gemini structured triage with validation + retry
+- Gemini structured triage with validation + retry; streamed, so the caller can
+  act on urgency_level before the rest of the reply arrives
 - Safe fallback JSON (no hardcoded facilities, no fake data)
 - Structured observability logs
 """
 
 import re
 import uuid
+import asyncio
 import logging
 import time
 
+from deadline import Deadline
+
 logger = logging.getLogger(__name__)
 
 # ── Emergency keywords (rule-based, language-aware) ───────────────────────
+# Grouped by the triage_rules red-flag symptom each phrase indicates
+# (self-harm has no rule symptom but is still an emergency).
+_EMERGENCY_GROUPS = {
+    "chest_pain": r"chest\s*pain|छाती\s*दर्द|छातीत\s*दुखणे|நெஞ்சு\s*வலி|ఛాతీ\s*నొప్పి",
+    "breathlessness": (
+        r"severe\s*breath|can.?t\s*breath|difficulty\s*breath|blue\s*lips|lips\s*blue|"
+        r"not\s*breathing|stopped\s*breathing|सांस\s*नहीं|श्वास\s*नाही|மூச்சு\s*இல்லை|ఊపిరి\s*ఆడటం\s*లేదు"
+    ),
+    "unconscious": r"unconscious|not\s*responding|passed\s*out|fainted|बेहोश|बेशुद्ध|மயக்கம்|స్పృహ\s*లేదు",
+    "seizure": r"seizure|convulsion|दौरा|झटके|வலிப்பு|మూర్ఛ",
+    "severe_bleeding": r"heavy\s*bleeding|severe\s*bleeding|lot\s*of\s*blood|बहुत\s*खून",
+    "stroke_signs": r"stroke|slurred\s*speech|face\s*droop",
+    "self_harm": r"suicidal|self.harm|want\s*to\s*die",
+    "snake_bite": r"snake\s*bite|snakebite",
+    "poisoning": r"poisoning|swallowed\s*poison",
+}
 _EMERGENCY_PATTERNS = re.compile(
-    r"("
-    r"chest\s*pain|severe\s*breath|can.?t\s*breath|difficulty\s*breath|"
-    r"unconscious|not\s*responding|passed\s*out|fainted|"
-    r"seizure|convulsion|"
-    r"heavy\s*bleeding|severe\s*bleeding|lot\s*of\s*blood|"
-    r"stroke|slurred\s*speech|face\s*droop|"
-    r"blue\s*lips|lips\s*blue|"
-    r"suicidal|self.harm|want\s*to\s*die|"
-    r"snake\s*bite|snakebite|"
-    r"poisoning|swallowed\s*poison|"
-    r"not\s*breathing|stopped\s*breathing|"
-    r"छाती\s*दर्द|सांस\s*नहीं|बेहोश|दौरा|बहुत\s*खून|"
-    r"छातीत\s*दुखणे|श्वास\s*नाही|बेशुद्ध|झटके|"
-    r"நெஞ்சு\s*வலி|மூச்சு\s*இல்லை|மயக்கம்|வலிப்பு|"
-    r"ఛాతీ\s*నొప్పి|ఊపిరి\s*ఆడటం\s*లేదు|స్పృహ\s*లేదు|మూర్ఛ"
-    r")",
+    "|".join(f"(?P<{name}>{pattern})" for name, pattern in _EMERGENCY_GROUPS.items()),
     re.IGNORECASE | re.UNICODE,
 )
 
@@ -40,6 +45,13 @@ def is_emergency_by_keywords(text: str) -> bool:
     return bool(_EMERGENCY_PATTERNS.search(text))
 
 
+def emergency_red_flags(text: str) -> list[str]:
+    """Red-flag symptoms named by the emergency keywords in text, in first-seen order."""
+    found = dict.fromkeys(m.lastgroup for m in _EMERGENCY_PATTERNS.finditer(text))
+    found.pop("self_harm", None)
+    return list(found)
+
+
 # ── Fallback responses ─────────────────────────────────────────────────────
 
 def _emergency_fallback(language: str = "en") -> dict:
@@ -245,15 +257,152 @@ def _safe_fallback(language: str = "en", ask_question: bool = True) -> dict:
 
 # ── Main triage function ───────────────────────────────────────────────────
 
-def run_triage(text: str, language: str = "en") -> dict:
+class _UrgencyNotice:
+    """Calls on_urgency(level) once per triage, as soon as the urgency is known:
+    the keyword emergency, Gemini's streamed urgency_level (before the reply is
+    complete or validated), else the final answer's. An early Gemini urgency is
+    timed in `_meta` as urgency_ms."""
+
+    def __init__(self, on_urgency, obs: dict, start: float):
+        self.on_urgency = on_urgency
+        self.obs = obs
+        self.start = start
+        self.fired = False
+
+    def __call__(self, level: str) -> None:
+        if self.fired or self.on_urgency is None:
+            return
+        self.fired = True
+        self.obs["urgency_ms"] = round((time.time() - self.start) * 1000)
+        try:
+            self.on_urgency(level)
+        except Exception as e:
+            logger.warning(f"[Triage][{self.obs['request_id']}] on_urgency failed: {type(e).__name__}: {e}")
+
+    @property
+    def stream_callback(self):
+        """What to hand call_triage: streaming only pays off if someone listens."""
+        return self if self.on_urgency is not None else None
+
+
+def run_triage(text: str, language: str = "en", deadline: Deadline | None = None,
+               on_urgency=None) -> dict:
     """
     Full triage pipeline:
     1. Emergency keyword check (rule-based, instant)
-    2. Gemini structured triage (with cache + validation + retry)
-    3. Safe fallback if Gemini fails
+    2. Gemini structured triage (with cache + validation + retry), bounded by `deadline`
+    3. Safe fallback if Gemini fails or the deadline is reached
 
+    on_urgency(level), if given, is called once as soon as the urgency is known —
+    for a Gemini answer typically while the rest of the reply is still streaming.
     Returns triage result dict + observability metadata.
     """
+    obs, start, early = _begin_triage(text, language)
+    notice = _UrgencyNotice(on_urgency, obs, start)
+    if early is not None:
+        notice(early["urgency_level"])
+        return early
+
+    # Step 2: Gemini triage
+    from gemini_client import call_triage, is_configured
+    outcome = call_triage(text, language, obs["request_id"], deadline,
+                          notice.stream_callback) if is_configured() else None
+    result = _finish_triage(outcome, language, obs, start)
+    notice(result["urgency_level"])
+    return result
+
+
+async def arun_triage(text: str, language: str = "en", deadline: Deadline | None = None,
+                      on_urgency=None) -> dict:
+    """Async run_triage — same steps, Gemini awaited instead of blocking a thread."""
+    obs, start, early = _begin_triage(text, language)
+    notice = _UrgencyNotice(on_urgency, obs, start)
+    if early is not None:
+        notice(early["urgency_level"])
+        return early
+
+    from gemini_client import acall_triage, is_configured
+    outcome = await acall_triage(text, language, obs["request_id"], deadline,
+                                 notice.stream_callback) if is_configured() else None
+    result = _finish_triage(outcome, language, obs, start)
+    notice(result["urgency_level"])
+    return result
+
+
+async def astream_triage(text: str, language: str = "en", deadline: Deadline | None = None):
+    """
+    Progressive run_triage. Async generator of (event, payload):
+    - "local":  deterministic answer (emergency keywords, else regex extraction
+                + triage_rules), available within milliseconds
+    - "urgency": {"urgency_level"} from Gemini's streamed reply, before the reply
+                is complete or validated (only when streamed, not on a cache hit)
+    - "gemini": the validated Gemini result, only if it arrives before `deadline`
+    - "done":   which answer stands ("local" | "gemini") plus `_meta`
+    """
+    obs, start, early = _begin_triage(text, language)
+    if early is not None:
+        meta = early.pop("_meta")
+        yield "local", early
+        yield "done", {"source": "local", "_meta": meta}
+        return
+
+    yield "local", _local_triage(text, language)
+    obs["first_event_ms"] = round((time.time() - start) * 1000)
+
+    from gemini_client import acall_triage, is_configured
+    outcome = None
+    if is_configured():
+        urgency = asyncio.Queue()
+        notice = _UrgencyNotice(urgency.put_nowait, obs, start)
+        call = asyncio.ensure_future(acall_triage(text, language, obs["request_id"], deadline, notice))
+        early = asyncio.ensure_future(urgency.get())
+        try:
+            await asyncio.wait({call, early}, return_when=asyncio.FIRST_COMPLETED)
+            if early.done():
+                yield "urgency", {"urgency_level": early.result()}
+            outcome = await call
+        finally:
+            early.cancel()
+            call.cancel()
+    result = _finish_triage(outcome, language, obs, start)
+    meta = result.pop("_meta")
+    if meta["fallback_used"]:
+        yield "done", {"source": "local", "_meta": meta}
+        return
+    yield "gemini", result
+    yield "done", {"source": "gemini", "_meta": meta}
+
+
+# triage_rules urgency → triage urgency_level (HIGH + EMERGENCY care is "emergency")
+_RULE_URGENCY = {"HIGH": "urgent", "MEDIUM": "moderate", "LOW": "low"}
+
+
+def _local_triage(text: str, language: str) -> dict:
+    """Deterministic triage from regex extraction + triage_rules — no LLM.
+    Same shape as the Gemini result, plus the rule classification under `local`."""
+    from nlp_extractor import _extract_with_regex
+    from triage_rules import classify
+
+    extracted = _extract_with_regex(text, language)
+    classification = classify(extracted)
+    if classification["urgency"] == "HIGH" and classification["careLevel"] == "EMERGENCY":
+        result = _emergency_fallback(language)
+    else:
+        vague = extracted["primaryComplaint"] == "unknown" and not extracted["redFlagsDetected"]
+        result = _safe_fallback(language, ask_question=vague)
+        result["urgency_level"] = _RULE_URGENCY.get(classification["urgency"], "moderate")
+    result["local"] = {
+        "urgency": classification["urgency"],
+        "careLevel": classification["careLevel"],
+        "reasonCodes": classification["reasonCodes"],
+        "symptoms": extracted["allDetectedSymptoms"],
+    }
+    return result
+
+
+def _begin_triage(text: str, language: str) -> tuple[dict, float, dict | None]:
+    """Start observability and run the emergency keyword check (step 1).
+    Returns (obs, start, emergency_result_or_None)."""
     request_id = uuid.uuid4().hex[:10]
     start = time.time()
 
@@ -275,12 +424,17 @@ def run_triage(text: str, language: str = "en") -> dict:
         result = _emergency_fallback(language)
         result["_meta"] = {**obs, "latency_ms": round((time.time() - start) * 1000)}
         logger.info(f"[Triage][{request_id}] EMERGENCY keyword hit — returning emergency fallback")
-        return result
+        return obs, start, result
 
-    # Step 2: Gemini triage
-    from gemini_client import call_triage, is_enabled
-    if is_enabled():
-        gemini_result, from_cache, error_code = call_triage(text, language, request_id)
+    return obs, start, None
+
+
+def _finish_triage(outcome: tuple | None, language: str, obs: dict, start: float) -> dict:
+    """Turn call_triage's (result, from_cache, error_code) — or None when Gemini
+    is disabled — into the final response (steps 2–3)."""
+    request_id = obs["request_id"]
+    if outcome is not None:
+        gemini_result, from_cache, error_code = outcome
         obs["from_cache"] = from_cache
 
         if gemini_result is not None:
@@ -3,6 +3,7 @@
 import json
 import os
 import logging
+from bisect import bisect_right
 
 logger = logging.getLogger(__name__)
 
@@ -23,11 +24,29 @@ def classify(structured: dict) -> dict:
     Deterministic triage classification.
     Input: structured extraction from nlp_extractor.
     Output: {urgency, careLevel, reasonCodes, matchedRules}
+
+    Runs on the compiled rule set (one table lookup once warm); inputs outside
+    its domain (e.g. a non-numeric duration) go through the interpreter.
     """
     symptoms = structured.get("allDetectedSymptoms", [])
     if not symptoms and structured.get("primaryComplaint", "unknown") != "unknown":
         symptoms = [structured["primaryComplaint"]]
 
+    duration_days = structured.get("duration", {}).get("value")
+    severity = structured.get("severity", "unknown")
+
+    key = COMPILED.key(symptoms, duration_days, severity)
+    if key is None:
+        return _classify_interpreted(structured)
+    return COMPILED.decide(key)
+
+
+def _classify_interpreted(structured: dict) -> dict:
+    """Reference interpreter: walks every rule. The compiled engine must match it."""
+    symptoms = structured.get("allDetectedSymptoms", [])
+    if not symptoms and structured.get("primaryComplaint", "unknown") != "unknown":
+        symptoms = [structured["primaryComplaint"]]
+
     duration_days = structured.get("duration", {}).get("value")
     severity = structured.get("severity", "unknown")
     red_flags = structured.get("redFlagsDetected", [])
@@ -144,3 +163,182 @@ def _pick_highest(rules: list) -> dict:
             CARE_ORDER.get(r["output"]["careLevel"], 0),
         ),
     )
+
+
+# ── Compiled rule set ──────────────────────────────────────────────────────
+# Symptom conditions become bitmasks over the rules' symptom vocabulary,
+# durations collapse into buckets between the rule thresholds, severities into
+# their SEVERITY_ORDER rank. (mask, bucket, rank) fully determines the outcome,
+# so each decision is computed once — via an inverted index from symptom to
+# candidate rules — and then served from a table.
+
+MAX_TABLE_ENTRIES = 65536
+
+
+class _Rule:
+    __slots__ = ("id", "name", "mask", "is_and", "dur_min", "dur_max", "sev_min", "sev_max", "rank", "output")
+
+    def __init__(self, rule: dict, bits: dict, thresholds: list):
+        cond = rule["conditions"]
+        self.id = rule["id"]
+        self.name = rule["name"]
+        self.output = rule["output"]
+        self.mask = 0
+        for s in cond.get("symptoms", []):
+            self.mask |= bits[s]
+        self.is_and = cond.get("operator", "ANY") == "AND"
+        # Duration bucket b = number of thresholds <= duration (None = unknown):
+        # "duration >= t" holds iff b > index(t); "duration < t" iff b <= index(t).
+        self.dur_min = thresholds.index(cond["durationDaysGte"]) + 1 if "durationDaysGte" in cond else None
+        self.dur_max = thresholds.index(cond["durationDaysLt"]) if "durationDaysLt" in cond else None
+        self.sev_min = SEVERITY_ORDER.get(cond["severityGte"], 0) if "severityGte" in cond else None
+        self.sev_max = SEVERITY_ORDER.get(cond["severityLte"], 0) if "severityLte" in cond else None
+        self.rank = (
+            URGENCY_ORDER.get(self.output.get("urgency"), 0),
+            CARE_ORDER.get(self.output.get("careLevel"), 0),
+        )
+
+    def symptoms_match(self, mask: int) -> bool:
+        if self.is_and:
+            return mask & self.mask == self.mask
+        return mask & self.mask != 0
+
+    def conditions_match(self, bucket: int | None, sev: int) -> bool:
+        if self.dur_min is not None and (bucket is None or bucket < self.dur_min):
+            return False
+        if self.dur_max is not None and bucket is not None and bucket > self.dur_max:
+            return False
+        if self.sev_min is not None and sev < self.sev_min:
+            return False
+        if self.sev_max is not None and sev > self.sev_max:
+            return False
+        return True
+
+
+class CompiledRules:
+    """RULES compiled for classify(). key() maps an input to its decision-table
+    key (None if outside the compiled domain); decide() returns the result."""
+
+    def __init__(self, rules: dict):
+        red = rules.get("redFlagRules", [])
+        general = rules.get("generalRules", [])
+
+        self.bits = {}
+        for rule in red + general:
+            for s in rule["conditions"].get("symptoms", []):
+                self.bits.setdefault(s, 1 << len(self.bits))
+        self.thresholds = sorted({
+            rule["conditions"][k] for rule in general
+            for k in ("durationDaysGte", "durationDaysLt") if k in rule["conditions"]
+        })
+
+        self.red = [_Rule(r, self.bits, self.thresholds) for r in red]
+        self.general = [_Rule(r, self.bits, self.thresholds) for r in general]
+        self._red_index, self._red_always = self._index(self.red)
+        self._general_index, self._general_always = self._index(self.general)
+
+        default = rules.get("defaultRule", {})
+        self.default = (
+            default.get("output", {}).get("urgency", "MEDIUM"),
+            default.get("output", {}).get("careLevel", "PHC"),
+            (default.get("id", "DEFAULT"),),
+            (default.get("name", "Default conservative"),),
+        )
+        self._table = {}
+
+    def _index(self, rules: list) -> tuple[dict, list]:
+        """Inverted index: symptom bit -> positions of rules mentioning it, plus
+        rules that match any symptom set (AND over no symptoms)."""
+        index, always = {}, []
+        for pos, rule in enumerate(rules):
+            if rule.mask == 0:
+                if rule.is_and:
+                    always.append(pos)
+                continue
+            m = rule.mask
+            while m:
+                low = m & -m
+                index.setdefault(low, []).append(pos)
+                m ^= low
+        return index, always
+
+    def key(self, symptoms, duration_days, severity) -> tuple | None:
+        if not isinstance(symptoms, (list, tuple)):
+            return None
+        try:
+            mask = 0
+            for s in symptoms:
+                mask |= self.bits.get(s, 0)
+            sev = SEVERITY_ORDER.get(severity, 0)
+        except TypeError:  # unhashable entries
+            return None
+        if duration_days is None:
+            bucket = None
+        elif isinstance(duration_days, (int, float)) and duration_days == duration_days:  # excludes NaN
+            bucket = bisect_right(self.thresholds, duration_days)
+        else:
+            return None
+        return mask, bucket, sev
+
+    def decide(self, key: tuple) -> dict:
+        decision = self._table.get(key)
+        if decision is None:
+            decision = self._evaluate(*key)
+            if len(self._table) < MAX_TABLE_ENTRIES:
+                self._table[key] = decision
+        urgency, care_level, codes, names = decision
+        return {
+            "urgency": urgency,
+            "careLevel": care_level,
+            "reasonCodes": list(codes),
+            "matchedRules": list(names),
+        }
+
+    def _candidates(self, mask: int, index: dict, always: list) -> list:
+        positions = set(always)
+        m = mask
+        while m:
+            low = m & -m
+            positions.update(index.get(low, ()))
+            m ^= low
+        return sorted(positions)
+
+    def _evaluate(self, mask: int, bucket: int | None, sev: int) -> tuple:
+        matched = [
+            self.red[p] for p in self._candidates(mask, self._red_index, self._red_always)
+            if self.red[p].symptoms_match(mask)
+        ]
+        if matched:
+            return self._pick(matched, "HIGH", "EMERGENCY", "red-flag rule")
+
+        matched = [
+            self.general[p] for p in self._candidates(mask, self._general_index, self._general_always)
+            if self.general[p].symptoms_match(mask) and self.general[p].conditions_match(bucket, sev)
+        ]
+        if matched:
+            return self._pick(matched, "MEDIUM", "PHC", "general rule")
+        return self.default_decision()
+
+    def default_decision(self) -> tuple:
+        """(urgency, careLevel, reasonCodes, matchedRules) when no rule matches."""
+        urgency, care_level, codes, names = self.default
+        if urgency not in VALID_URGENCIES:
+            logger.warning(f"[TriageRules] Invalid urgency '{urgency}' from default rule — forcing MEDIUM")
+            urgency = "MEDIUM"
+        if care_level not in VALID_CARE_LEVELS:
+            care_level = "PHC"
+        return urgency, care_level, codes, names
+
+    def _pick(self, matched: list, urgency_guard: str, care_guard: str, source: str) -> tuple:
+        best = max(matched, key=lambda r: r.rank)  # first of the highest, like _pick_highest
+        urgency = best.output.get("urgency", "MEDIUM")
+        care_level = best.output.get("careLevel", "PHC")
+        if urgency not in VALID_URGENCIES:
+            logger.warning(f"[TriageRules] Invalid urgency '{urgency}' from {source} — forcing {urgency_guard}")
+            urgency = urgency_guard
+        if care_level not in VALID_CARE_LEVELS:
+            care_level = care_guard
+        return urgency, care_level, tuple(r.id for r in matched), tuple(r.name for r in matched)
+
+
+COMPILED = CompiledRules(RULES)
@@ -0,0 +1,133 @@
+"""
+Pre-generate explanations into the table explainer.py loads at startup
+(explanation_table.py, EXPLANATION_TABLE_PATH, default data/explanations.json).
+
+Combinations: every known symptom as the primary complaint, alone and with
+each other symptom as the second one, classified by triage_rules over the
+rule duration thresholds and every severity — the (urgency, careLevel) pairs
+the service actually produces for them — times --languages. Each text comes
+from Gemini with the runtime prompt and is kept only if check_safety passes.
+
+A re-run keeps the entries of a table with the current version and fills the
+gaps (--refresh regenerates everything); a table for an older prompt version
+is replaced.
+
+Usage: python warm_explanations.py [--languages en,hi,mr,ta,te] [--concurrency 8]
+                                   [--limit N] [--refresh] [--dry-run] [--out PATH]
+Needs a configured Gemini (LLM_API_KEY, USE_LLM=true). Exit code 1 if it is not.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+import explanation_table
+import gemini_client
+from explainer import (
+    LANGUAGE_NAMES, SYMPTOM_DISPLAY, TABLE_PATH, _EXPLAIN_SITE, _explanation_context, table_version,
+)
+from safety import check_safety
+from triage_rules import COMPILED, SEVERITY_ORDER, classify
+
+
+def combinations(languages: list[str]) -> list[tuple]:
+    """Table keys for the symptom pairs the rules can produce, in a stable order."""
+    symptoms = [s for s in SYMPTOM_DISPLAY if s != "unknown"]
+    durations = sorted({None, *COMPILED.thresholds, *(t + 1 for t in COMPILED.thresholds)},
+                       key=lambda d: (d is not None, d or 0))
+    keys = {}
+    for primary in ["unknown"] + symptoms:
+        seconds = [None] if primary == "unknown" else [None] + [s for s in symptoms if s != primary]
+        for second in seconds:
+            structured = {
+                "primaryComplaint": primary,
+                "associatedSymptoms": [second] if second else [],
+                "allDetectedSymptoms": [s for s in (primary, second) if s and s != "unknown"],
+            }
+            for days in durations:
+                for severity in SEVERITY_ORDER:
+                    c = classify({**structured, "duration": {"value": days, "unit": "days"}, "severity": severity})
+                    for language in languages:
+                        ctx = _explanation_context(c["urgency"], c["careLevel"], structured, language)
+                        keys.setdefault(ctx["key"], structured)
+    return [(key, keys[key]) for key in sorted(keys)]
+
+
+async def generate(todo: list[tuple], concurrency: int) -> tuple[list[dict], int, int]:
+    """(entries, failed, unsafe) for the given (key, structured) pairs."""
+    limit = asyncio.Semaphore(concurrency)
+    entries, failed, unsafe = [], 0, 0
+
+    async def one(key: tuple, structured: dict) -> None:
+        nonlocal failed, unsafe
+        urgency, care_level, _, _, _, language = key
+        ctx = _explanation_context(urgency, care_level, structured, language)
+        async with limit:
+            text = await gemini_client.acall_gemini(ctx["prompt"], timeout=30, site=_EXPLAIN_SITE, inputs=key)
+        if not text:
+            failed += 1
+        elif not check_safety(text, language)["safe"]:
+            unsafe += 1
+        else:
+            entries.append(explanation_table.make_entry(key, text.strip()))
+        done = len(entries) + failed + unsafe
+        if done % 50 == 0:
+            print(f"  {done}/{len(todo)}", flush=True)
+
+    await asyncio.gather(*(one(key, structured) for key, structured in todo))
+    return entries, failed, unsafe
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--languages", default=",".join(LANGUAGE_NAMES))
+    ap.add_argument("--concurrency", type=int, default=8)
+    ap.add_argument("--limit", type=int, default=0, help="generate at most N missing entries (0 = all)")
+    ap.add_argument("--refresh", action="store_true", help="regenerate entries the table already has")
+    ap.add_argument("--dry-run", action="store_true", help="list the combinations, call nothing")
+    ap.add_argument("--out", default=TABLE_PATH)
+    args = ap.parse_args()
+
+    version = table_version()
+    wanted = combinations([lang.strip() for lang in args.languages.split(",") if lang.strip()])
+
+    kept = []
+    if not args.refresh and os.path.exists(args.out):
+        with open(args.out, encoding="utf-8") as f:
+            old = json.load(f)
+        if old.get("version") == version:
+            kept = old.get("entries", [])
+    have = {explanation_table.entry_key(entry) for entry in kept}
+    todo = [(key, structured) for key, structured in wanted if key not in have]
+    if args.limit:
+        todo = todo[:args.limit]
+    print(f"{len(wanted)} combinations (version {version}): {len(have)} in the table, {len(todo)} to generate")
+
+    if args.dry_run:
+        for key, _ in todo:
+            print("  " + " | ".join(key))
+        return 0
+    if not todo:
+        return 0
+    if not gemini_client.is_enabled():
+        print("Gemini is not configured (LLM_API_KEY / USE_LLM / LLM_PROVIDER) — nothing generated.")
+        return 1
+
+    start = time.perf_counter()
+    entries, failed, unsafe = asyncio.run(generate(todo, args.concurrency))
+    explanation_table.save(args.out, version, gemini_client._model_name, kept + entries)
+    print(f"Generated {len(entries)} in {time.perf_counter() - start:.1f}s "
+          f"({failed} failed, {unsafe} rejected by the safety filter); "
+          f"{len(kept) + len(entries)} entries in {args.out}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,5 +1,7 @@
 /**
  * AI Bridge — Scope → Intent gate → Extract → Classify (rules) → Explain.
+ * Runs as one /pipeline call; falls back to the per-stage endpoints only if the
+ * engine has no /pipeline (404) or cannot be reached, else to the local triage.
  * SMALL_TALK and CLARIFICATION_REQUIRED never reach triage.
  * NON_MEDICAL_SAFE → Gemini general answer (no medical advice).
  * OUT_OF_SCOPE → polite redirect, no Gemini.
@@ -7,6 +9,9 @@
 
 const AI_URL = process.env.AI_ENGINE_URL || 'http://localhost:8000';
 
+// Connection errors: the engine is not there at all (fetch rejects with a TypeError).
+const UNREACHABLE_CODES = new Set(['ECONNREFUSED', 'ENOTFOUND', 'EAI_AGAIN', 'EHOSTUNREACH']);
+
 const TIME_TO_ACT = { HIGH: 'NOW — call 108 immediately', MEDIUM: 'Within 24 hours', LOW: 'Monitor at home' };
 
 // ── Multilingual small-talk / clarification replies (Node-side fallback) ──
@@ -200,6 +205,19 @@ async function callAIEngine(text, language, source) {
 }
 
 async function _callAIEngineInternal(text, language, source) {
+  // ── Fused pipeline: one round trip for scope → intent → extract → classify → explain ──
+  try {
+    const pipelineRes = await fetchJSON(`${AI_URL}/pipeline`, { text, language, source }, 0);
+    return fromPipelineResult(pipelineRes, language);
+  } catch (err) {
+    // A timeout or server error would only repeat the same wait stage by stage.
+    if (!pipelineUnavailable(err)) {
+      console.warn('[callAIEngine] /pipeline failed, using local fallback:', err.message);
+      return localFallbackTriage(text, language);
+    }
+    console.warn('[callAIEngine] /pipeline unavailable, falling back to per-stage calls:', err.message);
+  }
+
   // ── Step -1: Scope classifier ──────────────────────────────────────
   const { scope, llmUsed: scopeLlmUsed } = await classifyScope(text, language);
 
@@ -311,6 +329,7 @@ async function _callAIEngineInternal(text, language, source) {
     structured: extractRes,
     reasonCodes: classifyRes.reasonCodes,
     language,
+    text,
   });
 
   const llmUsed = !!(intentLlmUsed || explainRes.meta?.llmUsed);
@@ -353,6 +372,86 @@ async function _callAIEngineInternal(text, language, source) {
   }, language);
 }
 
+// True when /pipeline does not exist on this engine (older build) or the engine is unreachable.
+function pipelineUnavailable(err) {
+  return err.status === 404 || UNREACHABLE_CODES.has(err.cause?.code);
+}
+
+// Maps a /pipeline response onto the same shapes the per-stage flow returns.
+function fromPipelineResult(res, language) {
+  const { scope, intent, extracted, meta = {} } = res;
+  const nonSymptom = {
+    triageCard: null,
+    facilities: [],
+    booking: null,
+    structured: null,
+    disclaimer: null,
+  };
+
+  if (scope === 'OUT_OF_SCOPE') {
+    return {
+      scope, intent: 'SMALL_TALK',
+      reply: OUT_OF_SCOPE_REPLIES[language] || OUT_OF_SCOPE_REPLIES.en,
+      ...nonSymptom,
+      meta: { llmUsed: false, fallbackUsed: false, latencyMs: 0 },
+    };
+  }
+
+  if (scope === 'NON_MEDICAL_SAFE') {
+    const redirect = NON_MEDICAL_REDIRECT[language] || NON_MEDICAL_REDIRECT.en;
+    const reply = res.reply
+      ? res.reply + redirect
+      : (SMALL_TALK_REPLIES[language] || SMALL_TALK_REPLIES.en);
+    return {
+      scope, intent: 'SMALL_TALK', reply, ...nonSymptom,
+      meta: { llmUsed: !!res.reply, fallbackUsed: !res.reply, latencyMs: 0 },
+    };
+  }
+
+  if (intent !== 'SYMPTOMS') {
+    return validateResponse({
+      scope: 'MEDICAL', intent, reply: res.reply, ...nonSymptom,
+      meta: { llmUsed: !!meta.llmUsed, fallbackUsed: !!meta.fallbackUsed, latencyMs: 0 },
+    }, language);
+  }
+
+  const triageCard = buildTriageCard(
+    res.urgency,
+    res.careLevel,
+    res.timeToAct || TIME_TO_ACT[res.urgency],
+    res.topReasons || [],
+    res.watchFor || [],
+    language,
+  );
+
+  return validateResponse({
+    scope: 'MEDICAL',
+    intent: 'SYMPTOMS',
+    urgency: res.urgency,
+    careLevel: res.careLevel,
+    urgencyBadge: res.urgencyBadge,
+    reasonCodes: res.reasonCodes,
+    structured: {
+      primaryComplaint: extracted.primaryComplaint,
+      duration: extracted.duration,
+      severity: extracted.severity,
+      associatedSymptoms: extracted.associatedSymptoms || [],
+      redFlagsDetected: extracted.redFlagsDetected || [],
+      clarifyingQuestion: extracted.clarifyingQuestion,
+    },
+    explanation: res.explanation,
+    disclaimer: res.disclaimer,
+    actions: res.actions,
+    recommended_facility: res.careLabel,
+    triageCard,
+    meta: {
+      llmUsed: !!meta.llmUsed,
+      fallbackUsed: !!meta.fallbackUsed,
+      extractionConfidence: extracted.extractionConfidence,
+    },
+  }, language);
+}
+
 function buildTriageCard(urgency, careLevel, timeToAct, topReasons, watchFor, language) {
   const timeLabels = {
     HIGH: { en: 'NOW — call 108 immediately', hi: 'अभी — 108 पर कॉल करें', mr: 'आत्ता — 108 वर कॉल करा', ta: 'இப்போதே — 108 அழைக்கவும்', te: 'ఇప్పుడే — 108 కు కాల్ చేయండి' },
@@ -402,7 +501,9 @@ async function fetchJSON(url, body, retries = 1) {
           await new Promise(r => setTimeout(r, 500));
           continue;
         }
-        throw new Error(`AI engine returned ${status}`);
+        const err = new Error(`AI engine returned ${status}`);
+        err.status = status;
+        throw err;
       }
       return await res.json();
     } catch (err) {
@@ -202,6 +202,11 @@ async function runTests() {
   const t9 = await post('/api/triage', { text: 'snake bite on leg', language: 'en', source: 'text' });
   check('Snake bite -> HIGH', t9.body.urgency === 'HIGH', `urgency=${t9.body.urgency}`);
 
+  // 26. Medicine request naming a symptom -> OUT_OF_SCOPE redirect, no triage
+  const oos = await post('/triage', { text: 'which tablet for fever since 2 days', language: 'en' });
+  check('Medicine request with symptom -> OUT_OF_SCOPE', oos.body.scope === 'OUT_OF_SCOPE' && !oos.body.urgency,
+    `scope=${oos.body.scope} urgency=${oos.body.urgency}`);
+
   // Summary
   console.log(`\n${'─'.repeat(50)}`);
   console.log(`Results: ${pass} passed, ${fail} failed out of ${pass + fail} tests`);